@@ -0,0 +1,129 @@
+import os
+import sys
+import argparse
+
+# Run from anywhere: make the project root importable
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+from main import load_config, sanitize_user_id
+from src.config_loader import ConfigError, UserSource
+from src.credential_store import CredentialStore
+from src.device_flow import DeviceFlowScheduler, load_client_config, request_device_codes
+from src.google_service_manager import SCOPES
+from src.http_transport import SharedTransport
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Authorize many users' Calendar access at once through the device flow"
+    )
+    parser.add_argument(
+        "--config",
+        default="credentials.json",
+        help="Global settings file (Google client secret, users)",
+    )
+    parser.add_argument(
+        "--users_config",
+        help="Directory of per-user <user_id>.json files, or a JSON-lines file of users",
+    )
+    parser.add_argument(
+        "--user",
+        action="append",
+        dest="selected_users",
+        metavar="USER_ID",
+        help="Only onboard this user (may be repeated)",
+    )
+    parser.add_argument(
+        "--tokens_dir",
+        default="tokens",
+        help="Where the token_<user_id>.json files are written",
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Also re-authorize users whose tokens still work",
+    )
+    return parser
+
+
+def onboard_users():
+    """
+    Requests device codes for every user without a working token, prints them all at once,
+    and writes each user's token file as soon as they approve.
+    """
+    args = build_parser().parse_args()
+    config = load_config(args.config)
+    calendar_config = config.get("google_calendar", {})
+    client_secret = calendar_config.get("client_secret_file", "client_secret.json")
+
+    try:
+        if args.users_config:
+            users = UserSource.from_path(args.users_config)
+        else:
+            users = UserSource.from_list(config.get("users", []), args.config)
+        if args.selected_users:
+            users = users.select(args.selected_users)
+        client = load_client_config(client_secret)
+    except (ConfigError, OSError, ValueError, KeyError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    transport = SharedTransport()
+    credential_store = CredentialStore(args.tokens_dir, session=transport.session)
+    scopes = [SCOPES["calendar"]]
+
+    # Users whose token is missing, unreadable or can no longer be refreshed
+    names = {}
+    for user_id in users.user_ids():
+        names.setdefault(sanitize_user_id(user_id), user_id)
+    if not args.force:
+        for name in names:
+            credential_store.load(name, scopes)
+        failures = credential_store.refresh_expiring()
+        names = {name: user_id for name, user_id in names.items() if name in failures}
+
+    if not names:
+        print("Every user already has a working token.")
+        return
+
+    print(f"Requesting device codes for {len(names)} users...")
+    authorizations, failures = request_device_codes(
+        client, list(names), scopes, session=transport.session
+    )
+
+    if authorizations:
+        print("\nAsk each user to visit the URL and enter their code:\n")
+        width = max(len(names[authorization.name]) for authorization in authorizations)
+        for authorization in authorizations:
+            print(
+                f"  {names[authorization.name]:<{width}}  {authorization.user_code}  "
+                f"{authorization.verification_url}"
+            )
+        print("\nWaiting for approvals (Ctrl+C to stop)...")
+
+    def save_token(name, creds):
+        credential_store.save(name, creds)
+        print(f"Authorized {names[name]}; token saved to {credential_store.token_path(name)}.")
+
+    scheduler = DeviceFlowScheduler(client, session=transport.session)
+    for authorization in authorizations:
+        scheduler.add(authorization)
+    try:
+        authorized = scheduler.run(on_authorized=save_token)
+    except KeyboardInterrupt:
+        print(f"\nStopped with {scheduler.pending()} users still pending.")
+        sys.exit(1)
+    finally:
+        transport.close()
+    failures.update(scheduler.failures)
+
+    print(f"\n{len(authorized)} of {len(names)} users authorized.")
+    for name, reason in sorted(failures.items()):
+        print(f"  - {names[name]}: {reason}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    onboard_users()
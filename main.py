@@ -1,10 +1,41 @@
 import argparse
+import atexit
+import datetime
+import functools
 import json
 import os
+import queue
+import secrets
 import sys
+import uuid
+from googleapiclient.errors import HttpError
 from src.todoist_manager import TodoistManager
-from src.google_service_manager import GoogleServiceManager
+from src.cassette import RECORD, REPLAY, close_cassettes, open_cassettes
+from src.config_loader import ConfigError, UserSource, read_user_ids
+from src.credential_store import CredentialStore, atomic_write
+from src.deadline import Deadline, DeadlineExceeded
+from src.email_digest import collapse_threads
+from src.email_index import DEFAULT_MAX_SNIPPETS, build_query, select_snippets
+from src.email_spool import EmailSpool
+from src.event_cache import EventCache
+from src.google_quota import CALENDAR_WRITES_PER_MINUTE
+from src.google_service_manager import SCOPES, GoogleServiceManager
+from src.http_transport import SharedTransport, format_stats
 from src.gemini_manager import GeminiManager
+from src.listener import Debouncer, ListenerServer, NotificationRouter, WatchRenewer
+from src.metrics import DEFAULT_METRICS, shard_textfile_path
+from src.models import BusyBlock, CalendarEvent, Email, Task, render_tasks
+from src.run_store import STAGES, RunStore, timed_stage
+from src.task_ranking import DEFAULT_TASKS_PER_DAY
+from src.sharding import (
+    iter_emails,
+    merge_summaries,
+    parse_shard,
+    run_local_shards,
+    save_emails,
+    shard_for,
+    strip_option,
+)
 
 
 def load_config(config_path="credentials.json"):
@@ -19,7 +50,15 @@ def load_config(config_path="credentials.json"):
         return json.load(f)
 
 
-def main():
+def sanitize_user_id(user_id):
+    """Sanitizes a user_id so it is safe to use in a filename."""
+    safe_user_id = "".join(
+        c for c in user_id if c.isalnum() or c in ("-", "_")
+    ).strip()
+    return safe_user_id or "unknown_user"
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Personal Assistant Script")
     parser.add_argument(
         "--test",
@@ -31,156 +70,1025 @@ def main():
         action="store_true",
         help="Turns off export to google calendar",
     )
-    args = parser.parse_args()
+    parser.add_argument(
+        "--config",
+        default="credentials.json",
+        help="Global settings file (Gemini key, Google client secret, admin email)",
+    )
+    parser.add_argument(
+        "--users_config",
+        help="Directory of per-user <user_id>.json files, or a JSON-lines file of users, "
+        "used instead of the 'users' list in --config",
+    )
+    parser.add_argument(
+        "--user",
+        action="append",
+        dest="selected_users",
+        metavar="USER_ID",
+        help="Only process this user (may be repeated)",
+    )
+    parser.add_argument(
+        "--users-from",
+        dest="users_from",
+        help="Only process the user IDs listed in this file, one per line",
+    )
+    parser.add_argument(
+        "--days",
+        type=int,
+        default=1,
+        help="Plan this many days (starting today) with a single Gemini call",
+    )
+    parser.add_argument(
+        "--availability",
+        choices=["primary", "freebusy"],
+        default="primary",
+        help="'freebusy' also checks every other selected calendar for busy times "
+        "with a single FreeBusy query",
+    )
+    parser.add_argument(
+        "--listen",
+        action="store_true",
+        help="Stay running and replan the rest of the day for users whose calendar or "
+        "TODOBOT emails change (push notifications)",
+    )
+    parser.add_argument(
+        "--listen_host",
+        default="127.0.0.1",
+        help="Interface the notification receiver binds to. It also serves per-user metrics, "
+        "so put it behind a reverse proxy rather than binding to 0.0.0.0",
+    )
+    parser.add_argument(
+        "--listen_port",
+        type=int,
+        default=8080,
+        help="Port the notification receiver listens on",
+    )
+    parser.add_argument(
+        "--webhook_url",
+        help="Public HTTPS base URL of the receiver; Calendar channels are created for "
+        "<url>/calendar. Without it, no channels are created (local testing)",
+    )
+    parser.add_argument(
+        "--gmail_topic",
+        help="Pub/Sub topic for admin Gmail notifications; its push subscription should "
+        "target <webhook_url>/gmail?token=<--gmail_push_token>",
+    )
+    parser.add_argument(
+        "--gmail_push_token",
+        help="Secret the Pub/Sub push endpoint URL carries as ?token=; Gmail notifications "
+        "without it are ignored",
+    )
+    parser.add_argument(
+        "--debounce",
+        type=float,
+        default=30.0,
+        help="Seconds of quiet before a burst of notifications triggers a replan",
+    )
+    parser.add_argument(
+        "--deadline",
+        type=float,
+        help="Minutes the whole run may take; users not reached in time are skipped",
+    )
+    parser.add_argument(
+        "--user_budget",
+        type=float,
+        help="Minutes each user may take; a user over budget is cut short and skipped",
+    )
+    parser.add_argument(
+        "--run_db",
+        default="runs.db",
+        help="SQLite file recording each run's inputs, prompts and responses",
+    )
+    parser.add_argument(
+        "--keep_days",
+        type=int,
+        default=30,
+        help="Delete run records older than this many days",
+    )
+    parser.add_argument(
+        "--resume",
+        nargs="?",
+        const="latest",
+        metavar="RUN_ID",
+        help="Continue an interrupted run from today (the latest unfinished one by default): "
+        "users already planned are skipped, the rest continue after their last completed "
+        "stage with the emails, tasks, events and Gemini plan saved in --run_db",
+    )
+    parser.add_argument(
+        "--shard",
+        help="Only process the users assigned to shard i of N (e.g. 0/4)",
+    )
+    parser.add_argument(
+        "--shards",
+        type=int,
+        help="Run every shard of N as a local process and merge their summaries",
+    )
+    parser.add_argument(
+        "--admin_emails",
+        help="Read the admin emails from this file instead of fetching them",
+    )
+    parser.add_argument(
+        "--dump_admin_emails",
+        help="Fetch the admin emails, write them to this file for the shards, and exit",
+    )
+    parser.add_argument(
+        "--summary_out",
+        help="Write a JSON summary of the processed users to this file",
+    )
+    parser.add_argument(
+        "--http_pool_size",
+        type=int,
+        default=10,
+        help="Keep-alive connections shared by all users' Google and OAuth requests",
+    )
+    parser.add_argument(
+        "--http_timeout",
+        type=float,
+        default=60.0,
+        help="Socket timeout in seconds for Google API requests",
+    )
+    parser.add_argument(
+        "--calendar_writes_per_minute",
+        type=int,
+        default=CALENDAR_WRITES_PER_MINUTE,
+        help="Pace each user's calendar writes to at most this many per minute "
+        "(0 disables pacing); rate-limited and failed requests are retried with backoff",
+    )
+    parser.add_argument(
+        "--max_tasks_per_day",
+        type=int,
+        default=DEFAULT_TASKS_PER_DAY,
+        help="Rank the potential tasks locally and send at most this many per planned day to "
+        "Gemini (0 sends every task); a user's 'max_tasks' setting, also per planned day, "
+        "overrides it",
+    )
+    parser.add_argument(
+        "--max_email_snippets",
+        type=int,
+        default=DEFAULT_MAX_SNIPPETS,
+        help="Send Gemini only the email paragraphs most relevant to the day's tasks and events "
+        "(and the most recent), at most this many per user (0 sends every email in full)",
+    )
+    parser.add_argument(
+        "--stream_gemini",
+        action="store_true",
+        help="Stream Gemini's responses: its text is printed as it arrives and each planned "
+        "event is written to the calendar as soon as Gemini proposes it, while it is still "
+        "planning the rest",
+    )
+    parser.add_argument(
+        "--metrics_file",
+        help="Write Prometheus metrics (API calls, retries, Gemini tokens, latencies) to this "
+        "textfile at the end of the run; with --listen, after every replan. The listener "
+        "also serves them on /metrics",
+    )
+    parser.add_argument(
+        "--event_cache",
+        metavar="DIR",
+        help="Keep each user's calendar events in DIR and update them with incremental sync, "
+        "so repeat runs (and replans) only download the changes",
+    )
+    cassette_mode = parser.add_mutually_exclusive_group()
+    cassette_mode.add_argument(
+        "--record",
+        metavar="DIR",
+        help="Record every Todoist, Google and Gemini request and response (secrets redacted) "
+        "to compressed cassettes in DIR",
+    )
+    cassette_mode.add_argument(
+        "--replay",
+        metavar="DIR",
+        help="Run offline, answering every API request from the cassettes recorded in DIR",
+    )
+    return parser
 
-    print("Starting Personal Assistant Script...")
 
-    # 1. Load Credentials
-    config = load_config()
+def minutes_to_seconds(minutes):
+    return None if minutes is None else minutes * 60
 
-    gemini_api_key = config.get("gemini", {}).get("api_key")
-    calendar_config = config.get("google_calendar", {})
-    admin_email = config.get("admin_email")
-    users = config.get("users", [])
 
-    if not gemini_api_key:
-        print("Error: Missing Gemini API key in credentials.json")
-        sys.exit(1)
+def iter_admin_emails(
+    admin_email, calendar_config, credential_store, deadline=None, cassettes=None,
+    transport=None, senders=None, reraise=False,
+):
+    """
+    Streams the TODOBOT emails from the admin mailbox, only from `senders` if given.
+    Stops early (with a message) on failure; with `reraise`, the error is raised after the
+    message so that the caller can tell a partial mailbox from a complete one.
+    """
+    print(f"\n=== Admin: Fetching Emails for {admin_email} ===")
+    count = 0
+    try:
+        client_secret = calendar_config.get(
+            "client_secret_file", "client_secret.json"
+        )
+        admin_token_file = credential_store.token_path("admin")
 
-    if not users:
-        print("Error: No users found in credentials.json")
-        sys.exit(1)
+        admin_service_manager = GoogleServiceManager(
+            client_secret_file=client_secret,
+            token_file=admin_token_file,
+            services=["gmail"],
+            auth_flow="installed",
+            interactive=False,
+            credentials=credential_store.get("admin"),
+            deadline=deadline,
+            cassette=(cassettes or {}).get("google"),
+            transport=transport,
+        )
+        for email in admin_service_manager.iter_emails_from_last_days(3, senders=senders):
+            count += 1
+            yield email
+        print(f"Fetched {count} emails from the last 3 days.")
+    except (Exception, DeadlineExceeded) as e:
+        print(f"Failed to fetch admin emails after {count} emails: {e}")
+        if reraise:
+            raise
 
-    if not admin_email:
-        print("Warning: 'admin_email' not found in credentials.json. Email processing will be skipped.")
 
-    # 2. Admin Context: Fetch all emails if admin email is present
-    all_recent_emails = []
-    if admin_email:
-        print(f"\n=== Admin: Fetching Emails for {admin_email} ===")
-        try:
-            client_secret = calendar_config.get(
-                "client_secret_file", "client_secret.json"
-            )
-            tokens_dir = "tokens"
-            os.makedirs(tokens_dir, exist_ok=True)
-            admin_token_file = os.path.join(tokens_dir, "token_admin.json")
+def build_email_spool(users):
+    """Creates an empty EmailSpool that routes emails to the users by their configured address."""
+    return EmailSpool({user["user_id"]: user.get("email") for user in users})
 
-            admin_service_manager = GoogleServiceManager(
-                client_secret_file=client_secret,
-                token_file=admin_token_file,
-                services=["gmail"],
-                auth_flow="installed",
-                interactive=False
-            )
-            all_recent_emails = admin_service_manager.get_emails_from_last_days(3)
-            print(f"Fetched {len(all_recent_emails)} emails from the last 3 days.")
-        except Exception as e:
-            print(f"Failed to fetch admin emails: {e}")
 
-    print(f"\nFound {len(users)} users to process.")
+def check_credentials(credential_store):
+    """Refreshes every loaded token that is close to expiry and reports unusable ones."""
+    print("\nChecking Google credentials...")
+    credential_failures = credential_store.refresh_expiring()
+    if credential_failures:
+        print(f"Warning: {len(credential_failures)} token(s) need attention:")
+        for name, reason in sorted(credential_failures.items()):
+            print(f"  - {name}: {reason}")
+    else:
+        print("All tokens are valid.")
 
-    if args.test:
-        print("TEST MODE ENABLED: Only the first user will be processed.")
-        users = users[:1]
 
-    for user in users:
-        user_id = user.get("user_id", "unknown_user")
-        user_email = user.get("email")
+def process_user(
+    user, args, gemini_config, calendar_config, credential_store,
+    run_store, run_id, email_spool, replan_from=None, deadline=None, cassettes=None,
+    transport=None,
+):
+    """
+    Plans the day(s) for a single user. If `replan_from` (a datetime) is given, only the
+    rest of today from that time is replanned.
+
+    If `deadline` (a Deadline) is reached, the user's remaining work is abandoned and the
+    user is reported as skipped.
 
-        # Sanitize user_id to ensure safe filename
-        safe_user_id = "".join(
-            c for c in user_id if c.isalnum() or c in ("-", "_")
-        ).strip()
-        if not safe_user_id:
-            safe_user_id = "unknown_user"
+    Returns:
+        dict: A summary entry with the user's ID, a status and the stage timings.
+    """
+    user_id = user.get("user_id", "unknown_user")
+    summary = {"user_id": user_id, "status": "ok", "events_created": 0, "timings": {}}
+    try:
+        _plan_user(
+            user, summary, args, gemini_config, calendar_config, credential_store,
+            run_store, run_id, email_spool, replan_from, deadline, cassettes or {}, transport,
+        )
+    except DeadlineExceeded as e:
+        print(f"Skipping the rest of {user_id}: {e}")
+        skip_user(summary, str(e))
+        run_store.record(
+            run_id, user_id, datetime.date.today(),
+            response=f"Skipped: {e}", timings=summary["timings"],
+        )
+    return summary
 
-        print(f"\n=== Processing User: {user_id} ===")
 
-        todoist_api_key = user.get("todoist_api_key")
-        personal_scheduling_preferences = user.get("personal_scheduling_preferences")
+def skip_user(summary, reason):
+    summary["status"] = "skipped"
+    summary["reason"] = reason
+    return summary
 
-        if not todoist_api_key:
-            print(f"Skipping user {user_id}: Missing Todoist API key.")
-            continue
 
-        if not personal_scheduling_preferences:
-            print(f"Warning: User {user_id} has no personal scheduling preferences.")
-            personal_scheduling_preferences = ""
-
-        # Filter emails for this user
-        recent_user_input = ""
-        if user_email and all_recent_emails:
-            print(f"Filtering emails for {user_email}...")
-            user_emails = [
-                email for email in all_recent_emails
-                if user_email.lower() in email.get("sender", "").lower()
-            ]
-            if user_emails:
-                for email in user_emails:
-                    recent_user_input += f"Date: {email['date']}\nContent: {email['content']}\n\n"
-                print(f"Found {len(user_emails)} relevant emails.")
-            else:
-                print("No relevant emails found for this user.")
-        elif not user_email:
-            print(f"No email configured for user {user_id}, skipping email context.")
-
-        # 3. Initialize Managers for this user
-        print(f"Initializing services for {user_id}...")
-        try:
-            todoist_manager = TodoistManager(todoist_api_key)
+def read_user_emails(user_id, user_email, email_spool):
+    """Reads a user's emails back from the spool, with their threads collapsed."""
+    user_emails = []
+    if user_email and email_spool is not None:
+        user_emails = list(email_spool.emails_for(user_id))
+        if user_emails:
+            # Quoted replies, signatures and repeated thread history would repeat in the prompt
+            message_count = len(user_emails)
+            user_emails = collapse_threads(user_emails)
+            print(f"Found {message_count} relevant emails in {len(user_emails)} threads.")
+        else:
+            print("No relevant emails found for this user.")
+    elif not user_email:
+        print(f"No email configured for user {user_id}, skipping email context.")
+    return user_emails
+
+
+def restore_inputs(checkpoint):
+    """The tasks, events, emails and busy blocks saved at a user's 'inputs' checkpoint."""
+    def restore(values, model):
+        # Error messages were saved in place of data that could not be fetched
+        if isinstance(values, str):
+            return values
+        return [model.from_dict(value) for value in values or []]
+
+    return (
+        restore(checkpoint["tasks"], Task),
+        restore(checkpoint["events"], CalendarEvent),
+        restore(checkpoint["emails"], Email),
+        restore(checkpoint["busy_blocks"], BusyBlock),
+    )
+
+
+UNCHANGED = "The calendar was left unchanged."
+PARTLY_WRITTEN = "The calendar was left partly written; the next run will reconcile it."
+
+
+def _plan_user(
+    user, summary, args, gemini_config, calendar_config, credential_store,
+    run_store, run_id, email_spool, replan_from, deadline, cassettes, transport,
+):
+    """Does the work of `process_user`, filling in `summary` as it goes."""
+    user_id = summary["user_id"]
+    user_email = user.get("email")
+
+    # Sanitize user_id to ensure safe filename
+    safe_user_id = sanitize_user_id(user_id)
+
+    print(f"\n=== Processing User: {user_id} ===")
+    today = datetime.date.today()
+    days = 1 if replan_from else args.days
+    last_day = today + datetime.timedelta(days=days - 1)
+    timings = summary["timings"]
+
+    todoist_api_key = user.get("todoist_api_key")
+    personal_scheduling_preferences = user.get("personal_scheduling_preferences")
+
+    if not todoist_api_key:
+        print(f"Skipping user {user_id}: Missing Todoist API key.")
+        summary["status"] = "skipped"
+        return
+
+    if not personal_scheduling_preferences:
+        print(f"Warning: User {user_id} has no personal scheduling preferences.")
+        personal_scheduling_preferences = ""
+
+    # With --resume, the user continues after their last checkpoint in this run
+    checkpoint = run_store.checkpoint(run_id, user_id) if args.resume else None
+    stage = checkpoint["stage"] if checkpoint else None
+    if stage == "written":
+        print(f"{user_id} was already planned in this run; skipping.")
+        summary["resumed_from"] = stage
+        summary["events_created"] = len(checkpoint.get("event_ids") or [])
+        return
+    if stage:
+        print(f"Resuming {user_id} after the '{stage}' stage.")
+        summary["resumed_from"] = stage
+    else:
+        user_emails = read_user_emails(user_id, user_email, email_spool)
+
+    # Initialize Managers for this user
+    print(f"Initializing services for {user_id}...")
+    try:
+        with timed_stage(timings, "init"):
+            todoist_manager = TodoistManager(
+                todoist_api_key, deadline=deadline, cassette=cassettes.get("todoist")
+            )
 
             # Helper to get client secret file path
             client_secret = calendar_config.get(
                 "client_secret_file", "client_secret.json"
             )
             # Unique token file for each user
-            tokens_dir = "tokens"
-            os.makedirs(tokens_dir, exist_ok=True)
-            token_file = os.path.join(tokens_dir, f"token_{safe_user_id}.json")
+            token_file = credential_store.token_path(safe_user_id)
 
             # User only needs Calendar access
             calendar_manager = GoogleServiceManager(
                 client_secret_file=client_secret,
                 token_file=token_file,
                 services=["calendar"],
-                auth_flow="device"
+                auth_flow="device",
+                credentials=credential_store.get(safe_user_id),
+                deadline=deadline,
+                cassette=cassettes.get("google"),
+                transport=transport,
+                writes_per_minute=args.calendar_writes_per_minute or None,
+                event_cache=(
+                    EventCache(os.path.join(args.event_cache, f"events_{safe_user_id}.json"))
+                    if args.event_cache else None
+                ),
             )
 
-            gemini_manager = GeminiManager(gemini_api_key, calendar_manager)
-        except Exception as e:
-            print(f"Initialization failed for user {user_id}: {e}")
-            continue
+            gemini_manager = GeminiManager(
+                gemini_config.get("api_key"),
+                calendar_manager,
+                models=gemini_config.get("models"),
+                deadline=deadline,
+                cassette=cassettes.get("gemini"),
+                user_id=user_id,
+                stream=args.stream_gemini,
+            )
+    except Exception as e:
+        print(f"Initialization failed for user {user_id}: {e}")
+        summary["status"] = "skipped"
+        return
 
-        # 4. Get Tasks from Todoist
+    # The bot's events in this window are replanned, then reconciled with the new plan
+    if checkpoint is None:
+        window_start = replan_from or datetime.datetime.now().astimezone()
+
+        # Get Tasks from Todoist
         print(f"Fetching tasks from Todoist for {user_id}...")
-        potential_tasks = todoist_manager.get_potential_tasks()
-        print(f"Potential Tasks:\n{potential_tasks}")
+        try:
+            # Only the highest ranked tasks reach the prompt; a user's max_tasks (also per
+            # planned day, 0 sends every task) overrides the default
+            tasks_per_day = user.get("max_tasks")
+            if tasks_per_day is None:
+                tasks_per_day = args.max_tasks_per_day
+            task_limit = tasks_per_day * days or None
+            with timed_stage(timings, "tasks"):
+                potential_tasks, dropped = todoist_manager.rank_potential_tasks(
+                    task_limit, user.get("task_label_weights")
+                )
+            summary["tasks_dropped"] = dropped
+            if dropped:
+                print(f"Kept the {len(potential_tasks)} highest ranked tasks; dropped {dropped}.")
+            print(f"Potential Tasks:\n{render_tasks(potential_tasks)}")
+        except Exception as e:
+            print(f"Error fetching tasks from Todoist: {e}")
+            potential_tasks = f"Error fetching tasks from Todoist: {e}"
 
-        # 5. Call Gemini to process and update calendar if this is not a test run
-        if args.no_export:
-            print(
-                "Skipping exporting to google calendar, but here is the final prompt:"
+        try:
+            with timed_stage(timings, "events"):
+                existing_events = calendar_manager.exclude_replanned_events(
+                    calendar_manager.fetch_events_for_range(today, last_day), window_start
+                )
+        except Exception as e:
+            existing_events = f"An error occurred while fetching events for {today} to {last_day}: {e}"
+
+        if user_emails and args.max_email_snippets:
+            # Only the paragraphs that bear on today's tasks and events (or are recent) reach
+            # the prompt
+            with timed_stage(timings, "email_index"):
+                user_emails, dropped = select_snippets(
+                    user_emails, build_query(potential_tasks, existing_events),
+                    args.max_email_snippets,
+                )
+            summary["email_paragraphs_dropped"] = dropped
+            if dropped:
+                print(
+                    f"Kept the {args.max_email_snippets} most relevant email paragraphs; "
+                    f"dropped {dropped}."
+                )
+
+        busy_blocks = []
+        if args.availability == "freebusy":
+            try:
+                with timed_stage(timings, "availability"):
+                    busy_blocks = calendar_manager.fetch_busy_blocks(today, last_day)
+                print(f"Found {len(busy_blocks)} busy blocks on other calendars.")
+            except Exception as e:
+                print(f"Error fetching availability for {user_id}: {e}")
+
+        run_store.record(
+            run_id, user_id, today,
+            tasks=potential_tasks, events=existing_events, emails=user_emails,
+            busy_blocks=busy_blocks, window_start=window_start.isoformat(), stage="inputs",
+        )
+    else:
+        # Everything fetched before the interruption is reused as it was
+        potential_tasks, existing_events, user_emails, busy_blocks = restore_inputs(checkpoint)
+        window_start = datetime.datetime.fromisoformat(checkpoint["window_start"])
+    window_end = datetime.datetime.combine(last_day, datetime.time.max).astimezone()
+
+    # A prompt saved at the 'prompt' checkpoint (or later) is reused as it was
+    prompt = checkpoint["prompt"] if stage in ("prompt", "gemini") else None
+
+    # Call Gemini to process and update calendar if this is not a test run
+    if args.no_export:
+        print(
+            "Skipping exporting to google calendar, but here is the final prompt:"
+        )
+        prompt = prompt or gemini_manager.generate_full_prompt(
+            personal_scheduling_preferences, potential_tasks, user_emails, existing_events,
+            days, busy_blocks, replan_from,
+        )
+        print(prompt)
+        run_store.record(
+            run_id, user_id, today, prompt=prompt, timings=timings,
+            stage=max(stage or "prompt", "prompt", key=STAGES.index),
+        )
+        summary["status"] = "planned"
+        return
+
+    print(f"Consulting Gemini and updating calendar for {user_id}...")
+    written = False
+    try:
+        # add_event only collects the plan; reconcile_plan writes the differences afterwards.
+        # When streaming, the planned events are written while Gemini is still planning.
+        calendar_manager.start_plan(
+            user_id,
+            write_through=(
+                (window_start, window_end) if args.stream_gemini and stage != "gemini" else None
+            ),
+        )
+        if stage == "gemini":
+            # Gemini already answered before the interruption; only its plan is left to write
+            calendar_manager.planned_events = checkpoint["plan"]
+            gemini_manager.last_prompt = prompt
+            result = checkpoint["response"]
+        else:
+            if prompt is None:
+                prompt = gemini_manager.generate_full_prompt(
+                    personal_scheduling_preferences, potential_tasks, user_emails,
+                    existing_events, days, busy_blocks, replan_from,
+                )
+                run_store.record(run_id, user_id, today, prompt=prompt, stage="prompt")
+            if args.stream_gemini:
+                print(f"\n--- Gemini Response for {user_id} ---")
+            with timed_stage(timings, "gemini"):
+                result = gemini_manager.generate_and_execute(
+                    personal_scheduling_preferences, potential_tasks, user_emails,
+                    existing_events, days, busy_blocks, replan_from, prompt=prompt,
+                )
+            summary["model"] = gemini_manager.last_model
+        if not args.stream_gemini or stage == "gemini":
+            # A streamed response was printed as it arrived
+            print(f"\n--- Gemini Response for {user_id} ---")
+            print(result)
+        print("-----------------------")
+        if result.startswith("Error interacting with Gemini"):
+            summary["status"] = "error"
+            # Events streamed in before the failure are rolled back
+            print(UNCHANGED if calendar_manager.discard_plan() else PARTLY_WRITTEN)
+        elif not calendar_manager.planned_events:
+            written = calendar_manager.discard_plan()
+            print("Gemini planned no events.")
+            print(UNCHANGED if written else PARTLY_WRITTEN)
+        else:
+            run_store.record(
+                run_id, user_id, today,
+                response=result, plan=calendar_manager.planned_events, stage="gemini",
             )
+            with timed_stage(timings, "reconcile"):
+                writes = calendar_manager.reconcile_plan(window_start, window_end)
+            summary["writes"] = writes
+            written = True
             print(
-                gemini_manager.generate_full_prompt(
-                    personal_scheduling_preferences, potential_tasks, recent_user_input
+                "Calendar updated: {inserted} inserted, {patched} patched, "
+                "{deleted} deleted, {unchanged} unchanged.".format(**writes)
+            )
+    except DeadlineExceeded as e:
+        # The plan is discarded unwritten; nothing on the calendar changes
+        print(f"Stopped consulting Gemini for {user_id}: {e}")
+        result = f"Skipped: {e}"
+        skip_user(summary, str(e))
+    except Exception as e:
+        print(f"Error processing user {user_id}: {e}")
+        result = f"Error processing user {user_id}: {e}"
+        summary["status"] = "error"
+    # Rolls back events written through for a plan that was not finished; a no-op once the
+    # plan is reconciled
+    if not calendar_manager.discard_plan():
+        print(PARTLY_WRITTEN)
+
+    run_store.record(
+        run_id, user_id, today,
+        prompt=gemini_manager.last_prompt,
+        response=result,
+        event_ids=calendar_manager.created_event_ids,
+        timings=timings,
+        **({"stage": "written"} if written else {}),
+    )
+    summary["events_created"] = len(calendar_manager.created_event_ids)
+    # Per-user quota use, kept in the run summary
+    api_stats = summary["google_api"] = dict(calendar_manager.executor.stats)
+    if api_stats["retries"] or api_stats["throttled_seconds"]:
+        print(
+            "Google API: {requests} requests, {retries} retries, "
+            "{throttled_seconds:.1f}s spent pacing writes.".format(**api_stats)
+        )
+
+
+MAILBOX_KEY = "__admin_mailbox__"
+
+
+def listen(
+    args, users, admin_email, gemini_config, calendar_config, credential_store,
+    run_store, email_spool, transport=None,
+):
+    """
+    Replans the rest of the day for users whose calendar or TODOBOT emails change.
+
+    Notifications arrive on a background HTTP thread and are debounced per user;
+    replans run one at a time on this thread.
+    """
+    user_configs = {user["user_id"]: user for user in users}
+    seen_email_ids = set(email_spool.message_ids)
+    replan_queue = queue.Queue()
+    debouncer = Debouncer(
+        lambda key, first_seen: replan_queue.put((key, first_seen)),
+        delay=args.debounce,
+    )
+    router = NotificationRouter(
+        on_calendar_change=debouncer.notify,
+        on_mailbox_change=lambda history_id: debouncer.notify(MAILBOX_KEY),
+        gmail_token=args.gmail_push_token,
+    )
+    server = ListenerServer(router, args.listen_host, args.listen_port, metrics=DEFAULT_METRICS)
+
+    client_secret = calendar_config.get("client_secret_file", "client_secret.json")
+    # Calendar channels and the Gmail watch expire; they are renewed shortly before they do
+    renewer = WatchRenewer()
+    channels = {}  # user_id -> (calendar_manager, channel_id, resource_id)
+    if args.webhook_url:
+        for user_id in user_configs:
+            safe_user_id = sanitize_user_id(user_id)
+            try:
+                calendar_manager = GoogleServiceManager(
+                    client_secret_file=client_secret,
+                    token_file=credential_store.token_path(safe_user_id),
+                    services=["calendar"],
+                    interactive=False,
+                    credentials=credential_store.get(safe_user_id),
+                    transport=transport,
+                )
+                renewer.add(user_id, functools.partial(
+                    watch_calendar, calendar_manager, user_id, router, args.webhook_url, channels
+                ))
+            except Exception as e:
+                print(f"Could not watch the calendar of {user_id}: {e}")
+        print(f"Watching {len(channels)} calendars.")
+
+    admin_manager = None
+    if admin_email and credential_store.get("admin"):
+        admin_manager = GoogleServiceManager(
+            client_secret_file=client_secret,
+            token_file=credential_store.token_path("admin"),
+            services=["gmail"],
+            auth_flow="installed",
+            interactive=False,
+            credentials=credential_store.get("admin"),
+            transport=transport,
+        )
+        if args.gmail_topic:
+            try:
+                renewer.add(MAILBOX_KEY, lambda: admin_manager.watch_gmail(args.gmail_topic))
+                print(f"Watching the admin mailbox through {args.gmail_topic}.")
+            except Exception as e:
+                print(f"Could not watch the admin mailbox: {e}")
+
+    server.start()
+    print(f"\nListening for notifications on {server.address} (Ctrl+C to stop)...")
+
+    try:
+        while True:
+            renewer.renew_due()
+            try:
+                key, first_seen = replan_queue.get(timeout=renewer.seconds_until_due())
+            except queue.Empty:
+                continue
+            replan_from = max(first_seen, datetime.datetime.now().astimezone())
+            affected_users = [key]
+
+            if key == MAILBOX_KEY:
+                if admin_manager is None:
+                    continue
+                # Respool the lookback window; users with an email not seen before are replanned
+                new_spool = build_email_spool(user_configs.values())
+                affected_users = set()
+                try:
+                    for email in admin_manager.iter_emails_from_last_days(
+                        3, senders=new_spool.addresses()
+                    ):
+                        routed = new_spool.add(email)
+                        if email.id not in seen_email_ids:
+                            seen_email_ids.add(email.id)
+                            affected_users.update(routed)
+                except HttpError:
+                    # Already reported; keep the previous mailbox until the next notification
+                    new_spool.close()
+                    continue
+                email_spool.close()
+                email_spool = new_spool
+
+            for user_id in affected_users:
+                if user_id not in user_configs:
+                    continue
+                print(f"\nChange detected for {user_id}; replanning from {replan_from:%I:%M %p}.")
+                run_id = run_store.start_run()
+                process_user(
+                    user_configs[user_id], args, gemini_config, calendar_config,
+                    credential_store, run_store, run_id, email_spool,
+                    replan_from=replan_from,
+                    deadline=Deadline(minutes_to_seconds(args.user_budget), name=user_id),
+                    transport=transport,
                 )
+                run_store.finish_run(run_id)
+                if args.metrics_file:
+                    DEFAULT_METRICS.write_textfile(args.metrics_file)
+    except KeyboardInterrupt:
+        print("\nStopping listener...")
+    finally:
+        debouncer.cancel_all()
+        server.stop()
+        email_spool.close()
+        for channel in channels.values():
+            stop_channel(*channel)
+
+
+def watch_calendar(calendar_manager, user_id, router, webhook_url, channels):
+    """
+    Opens a Calendar push channel on a user's calendar, then stops the channel it replaces
+    (if any), so that no change goes unnotified in between.
+
+    Returns:
+        dict: The new channel resource, including its expiration.
+    """
+    channel_id = f"{sanitize_user_id(user_id)}-{uuid.uuid4().hex[:12]}"
+    token = secrets.token_urlsafe(16)
+    channel = calendar_manager.watch_events(
+        f"{webhook_url.rstrip('/')}/calendar", channel_id, token
+    )
+    router.register_channel(channel_id, user_id, token)
+    previous = channels.get(user_id)
+    channels[user_id] = (calendar_manager, channel_id, channel.get("resourceId"))
+    if previous is not None:
+        stop_channel(*previous)
+        router.unregister_channel(previous[1])
+    return channel
+
+
+def stop_channel(calendar_manager, channel_id, resource_id):
+    try:
+        calendar_manager.stop_channel(channel_id, resource_id)
+    except Exception as e:
+        print(f"Could not stop channel {channel_id}: {e}")
+
+
+def resumable_run(run_store, requested):
+    """
+    The ID of the run `--resume` continues, or None if there is nothing to resume.
+    Only runs started today are resumed; an older plan would be for the wrong day.
+    """
+    run = run_store.unfinished_run(None if requested == "latest" else requested)
+    if run is None:
+        print("No unfinished run to resume; starting a new run.")
+        return None
+    started = datetime.datetime.fromisoformat(run["started_at"]).astimezone().date()
+    if started != datetime.date.today():
+        print(f"Run {run['run_id']} was started on {started}; starting a new run instead.")
+        return None
+    print(f"Resuming run {run['run_id']}.")
+    return run["run_id"]
+
+
+def print_summary(summary):
+    counts = ", ".join(f"{status}: {n}" for status, n in sorted(summary["counts"].items()))
+    print(f"\n=== Run Summary ({len(summary['users'])} users; {counts or 'none'}) ===")
+    for user in summary["users"]:
+        print(f"  - {user['user_id']}: {user['status']} ({user['events_created']} events)")
+    if summary.get("failed_shards"):
+        print(f"Warning: shards {summary['failed_shards']} did not finish.")
+
+
+def main():
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.days < 1:
+        parser.error("--days must be at least 1")
+    if args.max_tasks_per_day < 0:
+        parser.error("--max_tasks_per_day cannot be negative")
+    if args.max_email_snippets < 0:
+        parser.error("--max_email_snippets cannot be negative")
+    if args.http_pool_size < 1 or args.http_timeout <= 0:
+        parser.error("--http_pool_size and --http_timeout must be positive")
+    for option in ("deadline", "user_budget"):
+        if getattr(args, option) is not None and getattr(args, option) <= 0:
+            parser.error(f"--{option} must be a positive number of minutes")
+
+    shard = None
+    if args.shard:
+        try:
+            shard = parse_shard(args.shard)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.metrics_file:
+            # Each shard writes its own file, labelled so that the series don't collide
+            DEFAULT_METRICS.const_labels["shard"] = str(shard[0])
+            args.metrics_file = shard_textfile_path(args.metrics_file, shard[0])
+    if args.shards is not None and (args.shards < 1 or args.shard or args.test):
+        parser.error("--shards must be at least 1 and cannot be combined with --shard or --test")
+    cassette_dir = args.record or args.replay
+    if cassette_dir and (args.listen or args.shards):
+        parser.error("--record and --replay cannot be combined with --listen or --shards")
+    if args.gmail_topic and not args.gmail_push_token:
+        parser.error("--gmail_topic needs --gmail_push_token to authenticate the pushes")
+    if args.resume and (args.listen or args.shards or args.shard):
+        parser.error("--resume cannot be combined with --listen, --shards or --shard")
+
+    print("Starting Personal Assistant Script...")
+    cassettes = None
+    if cassette_dir:
+        try:
+            cassettes = open_cassettes(cassette_dir, RECORD if args.record else REPLAY)
+        except OSError as e:
+            print(f"Error: could not open the cassettes in {cassette_dir}: {e}")
+            sys.exit(1)
+        atexit.register(close_cassettes, cassettes)
+        print(f"{'Recording' if args.record else 'Replaying'} API traffic in {cassette_dir}.")
+    replaying = bool(args.replay)
+    # The run deadline is ignored in listener mode, which runs until interrupted
+    run_deadline = Deadline(
+        None if args.listen else minutes_to_seconds(args.deadline), name="run"
+    )
+
+    # 1. Load Credentials
+    config = load_config(args.config)
+
+    gemini_config = config.get("gemini", {})
+    gemini_api_key = gemini_config.get("api_key")
+    calendar_config = config.get("google_calendar", {})
+    admin_email = config.get("admin_email")
+
+    try:
+        if args.users_config:
+            users = UserSource.from_path(args.users_config)
+        else:
+            users = UserSource.from_list(config.get("users", []), args.config)
+
+        selected_user_ids = list(args.selected_users or [])
+        if args.users_from:
+            selected_user_ids.extend(read_user_ids(args.users_from))
+        if selected_user_ids:
+            users = users.select(selected_user_ids)
+    except (ConfigError, OSError) as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    if not gemini_api_key:
+        print(f"Error: Missing Gemini API key in {args.config}")
+        sys.exit(1)
+
+    if not len(users):
+        print(f"Error: No users found in {users.origin}")
+        sys.exit(1)
+
+    if not admin_email:
+        print(f"Warning: 'admin_email' not found in {args.config}. Email processing will be skipped.")
+
+    tokens_dir = "tokens"
+    os.makedirs(tokens_dir, exist_ok=True)
+    # One pool of keep-alive connections for every user's Google clients and OAuth requests
+    transport = SharedTransport(args.http_pool_size, args.http_timeout)
+    credential_store = CredentialStore(tokens_dir, session=transport.session)
+
+    # Admin-only modes: the admin mailbox is read once here and shared with every shard
+    if args.dump_admin_emails or args.shards:
+        # Streamed straight into the shared file, never held in memory
+        admin_emails = iter([])
+        if admin_email:
+            if not replaying:
+                credential_store.load("admin", [SCOPES["gmail"]])
+                check_credentials(credential_store)
+            # Only the users that pass validation; the shards skip the others anyway
+            invalid_users = users.validate()
+            valid_users = users.select(predicate=lambda user_id: user_id not in invalid_users)
+            admin_emails = iter_admin_emails(
+                admin_email, calendar_config, credential_store, cassettes=cassettes,
+                transport=transport,
+                senders=[user["email"] for user in valid_users if user.get("email")],
             )
-            continue
 
-        print(f"Consulting Gemini and updating calendar for {user_id}...")
+        if args.dump_admin_emails:
+            count = save_emails(args.dump_admin_emails, admin_emails)
+            print(f"Wrote {count} emails to {args.dump_admin_emails}.")
+            return
+
+        print(f"\nLaunching {args.shards} shards...")
+        child_argv = strip_option(sys.argv[1:], "--shards")
+        summary = run_local_shards(args.shards, child_argv, admin_emails)
+        print_summary(summary)
+        if args.summary_out:
+            atomic_write(args.summary_out, json.dumps(summary, indent=2))
+        if args.metrics_file:
+            # The admin mailbox fetch; every shard writes its own metrics next to this file
+            DEFAULT_METRICS.write_textfile(args.metrics_file)
+        if summary["failed_shards"]:
+            sys.exit(1)
+        return
+
+    if shard:
+        shard_index, shard_count = shard
+        users = users.select(
+            predicate=lambda user_id: shard_for(user_id, shard_count) == shard_index
+        )
+        print(f"Shard {shard_index}/{shard_count}: {len(users)} users assigned.")
+
+    print(f"Found {len(users)} users to process.")
+
+    if args.test:
+        print("TEST MODE ENABLED: Only the first user will be processed.")
+        users = users.head(1)
+
+    # Validate the selected users up front; invalid configs are reported and skipped
+    invalid_users = users.validate()
+    if invalid_users:
+        print(f"Warning: {len(invalid_users)} user config(s) are invalid and will be skipped:")
+        for errors in invalid_users.values():
+            for error in errors:
+                print(f"  - {error}")
+        users = users.select(predicate=lambda user_id: user_id not in invalid_users)
+
+    # 2. Load every token up front and refresh the ones close to expiry (not needed to replay)
+    if not replaying:
+        load_admin_token = admin_email and not args.admin_emails
+        if load_admin_token:
+            credential_store.load("admin", [SCOPES["gmail"]])
+        for user_id in users.user_ids():
+            credential_store.load(sanitize_user_id(user_id), [SCOPES["calendar"]])
+        check_credentials(credential_store)
+
+    run_store = RunStore(args.run_db)
+    evicted = run_store.evict(max_age_days=args.keep_days)
+    if evicted:
+        print(f"Evicted {evicted} run records older than {args.keep_days} days.")
+    run_id = resumable_run(run_store, args.resume) if args.resume else None
+    if run_id is None:
+        args.resume = None
+        run_id = run_store.start_run()
+    print(f"Run ID: {run_id}")
+
+    # 3. Admin Context: stream the admin emails into per-user buckets on disk
+    email_spool = build_email_spool(users)
+    saved_mailbox = run_store.saved_mailbox(run_id) if args.resume else None
+    if saved_mailbox is not None:
+        count = email_spool.extend(saved_mailbox)
+        print(f"Loaded {count} admin emails saved by the interrupted run.")
+    elif args.admin_emails:
+        count = email_spool.extend(iter_emails(args.admin_emails))
+        print(f"Loaded {count} shared admin emails from {args.admin_emails}.")
+    elif admin_email:
+        admin_emails = iter_admin_emails(
+            admin_email, calendar_config, credential_store, deadline=run_deadline,
+            cassettes=cassettes, transport=transport, senders=email_spool.addresses(),
+            reraise=True,
+        )
+        if not args.listen:
+            # Saved as it streams in, so that a resumed run doesn't fetch it again. The
+            # mailbox is only marked complete if the fetch finishes.
+            admin_emails = run_store.save_mailbox(run_id, admin_emails)
         try:
-            result = gemini_manager.generate_and_execute(
-                personal_scheduling_preferences, potential_tasks, recent_user_input
+            email_spool.extend(admin_emails)
+        except (Exception, DeadlineExceeded):
+            pass  # Already reported; the users are planned with the emails fetched so far
+
+    if args.listen:
+        listen(
+            args, users, admin_email, gemini_config, calendar_config, credential_store,
+            run_store, email_spool, transport,
+        )
+        run_store.finish_run(run_id)
+        run_store.close()
+        transport.close()
+        return
+
+    # 4. Plan each user's day; user configs are loaded one at a time as the loop reaches them
+    # Once the run deadline passes, the remaining users are reported as skipped without being planned
+    user_summaries = []
+    for user in users:
+        user_id = user.get("user_id", "unknown_user")
+        if run_deadline.expired():
+            reason = "The run deadline was reached before this user was started."
+            user_summaries.append(
+                skip_user({"user_id": user_id, "events_created": 0, "timings": {}}, reason)
             )
-            print(f"\n--- Gemini Response for {user_id} ---")
-            print(result)
-            print("-----------------------")
-        except Exception as e:
-            print(f"Error processing user {user_id}: {e}")
+            run_store.record(run_id, user_id, datetime.date.today(), response=f"Skipped: {reason}")
+            continue
+        user_summaries.append(
+            process_user(
+                user, args, gemini_config, calendar_config, credential_store,
+                run_store, run_id, email_spool,
+                deadline=run_deadline.child(minutes_to_seconds(args.user_budget), user_id),
+                cassettes=cassettes,
+                transport=transport,
+            )
+        )
+    skipped = [user for user in user_summaries if user.get("reason")]
+    if skipped:
+        print(f"Warning: {len(skipped)} user(s) were cut short by a deadline.")
 
+    run_store.finish_run(run_id)
+    run_store.close()
+    email_spool.close()
     print("\nAll users processed.")
+    print(f"Connection reuse:\n{format_stats(transport.stats())}")
+    transport.close()
+
+    if replaying:
+        for service, cassette in cassettes.items():
+            if cassette.unused():
+                print(f"Note: {cassette.unused()} recorded {service} exchanges were not replayed.")
+
+    if args.summary_out:
+        summary = merge_summaries([{"users": user_summaries}])
+        atomic_write(args.summary_out, json.dumps(summary, indent=2))
+    if args.metrics_file:
+        DEFAULT_METRICS.write_textfile(args.metrics_file)
 
 
 if __name__ == "__main__":
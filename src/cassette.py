@@ -0,0 +1,295 @@
+import os
+import gzip
+import json
+import time
+import base64
+import hashlib
+import threading
+from collections import deque
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import httplib2
+import httpx
+
+RECORD = "record"
+REPLAY = "replay"
+
+# The services whose traffic is recorded, one cassette file each
+SERVICES = ("todoist", "google", "gemini")
+
+# Query parameters and JSON / form fields whose values never reach a cassette
+SECRET_KEYS = {
+    "key", "api_key", "access_token", "refresh_token", "id_token", "token",
+    "client_secret", "device_code", "code", "password",
+}
+REDACTED = "REDACTED"
+# Only these response headers are kept; the rest are noise (or cookies)
+KEPT_HEADERS = ("content-type",)
+
+
+class CassetteMiss(Exception):
+    """Raised in replay mode when a request has no recorded response."""
+
+
+def _redact_json(value):
+    if isinstance(value, dict):
+        return {
+            key: REDACTED if key.lower() in SECRET_KEYS else _redact_json(item)
+            for key, item in value.items()
+        }
+    if isinstance(value, list):
+        return [_redact_json(item) for item in value]
+    return value
+
+
+def redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [
+        (key, REDACTED if key.lower() in SECRET_KEYS else value)
+        for key, value in parse_qsl(parts.query, keep_blank_values=True)
+    ]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def redact_body(body: bytes) -> str:
+    """Returns the body as text with secrets replaced; binary bodies are base64 encoded."""
+    if not body:
+        return ""
+    try:
+        text = body.decode("utf-8")
+    except UnicodeDecodeError:
+        return "base64:" + base64.b64encode(body).decode("ascii")
+    try:
+        return json.dumps(_redact_json(json.loads(text)), sort_keys=True)
+    except ValueError:
+        pass
+    if "=" in text and " " not in text:
+        # Form-encoded (OAuth token requests and responses)
+        pairs = parse_qsl(text, keep_blank_values=True)
+        if pairs:
+            return urlencode([
+                (key, REDACTED if key.lower() in SECRET_KEYS else value) for key, value in pairs
+            ])
+    return text
+
+
+def _decode_body(text: str) -> bytes:
+    if text.startswith("base64:"):
+        return base64.b64decode(text[len("base64:"):])
+    return text.encode("utf-8")
+
+
+class Cassette:
+    """
+    The HTTP exchanges of one service, stored as gzip-compressed JSON lines.
+
+    In record mode every exchange is appended (secrets redacted) as it completes, together with
+    how long it took. In replay mode the file is loaded up front and each request is answered
+    from it without touching the network. A request is matched on its method, URL and body;
+    if nothing matches exactly (e.g. the dates in a query changed since recording), the next
+    unused response for the same method and URL path is returned, in recorded order.
+    """
+
+    def __init__(self, path: str, mode: str = RECORD):
+        if mode not in (RECORD, REPLAY):
+            raise ValueError(f"Unknown cassette mode '{mode}'.")
+        self.path = path
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._file = None
+        self._entries = []
+        self._used = []
+        self._exact: Dict[Tuple[str, str, str], deque] = {}
+        self._loose: Dict[Tuple[str, str], deque] = {}
+
+        if mode == RECORD:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            self._file = gzip.open(path, "wt", encoding="utf-8")
+        else:
+            with gzip.open(path, "rt", encoding="utf-8") as f:
+                try:
+                    for line in f:
+                        if line.strip():
+                            self._index(json.loads(line))
+                except (EOFError, ValueError):
+                    # A run that died mid-recording leaves a truncated last line or gzip trailer
+                    pass
+
+    @staticmethod
+    def _keys(method: str, url: str, body: str):
+        digest = hashlib.sha256(body.encode("utf-8")).hexdigest()
+        exact = (method.upper(), url, digest)
+        loose = (method.upper(), urlsplit(url).path)
+        return exact, loose
+
+    def _index(self, entry: dict):
+        position = len(self._entries)
+        self._entries.append(entry)
+        self._used.append(False)
+        exact, loose = self._keys(entry["method"], entry["url"], entry["request_body"])
+        self._exact.setdefault(exact, deque()).append(position)
+        self._loose.setdefault(loose, deque()).append(position)
+
+    def record(
+        self, method: str, url: str, body: bytes, status: int, headers, content: bytes,
+        elapsed: float,
+    ):
+        entry = {
+            "method": method.upper(),
+            "url": redact_url(url),
+            "request_body": redact_body(body),
+            "status": status,
+            "headers": {
+                name: value for name, value in headers.items() if name.lower() in KEPT_HEADERS
+            },
+            "body": redact_body(content),
+            "elapsed_ms": round(elapsed * 1000, 1),
+        }
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            # Keep the file readable up to the last exchange if the run dies
+            self._file.flush()
+
+    def replay(self, method: str, url: str, body: bytes) -> Tuple[int, dict, bytes]:
+        """
+        Returns:
+            Tuple[int, dict, bytes]: The recorded status, headers and body.
+
+        Raises:
+            CassetteMiss: If there is no unused recorded response for the request.
+        """
+        exact, loose = self._keys(method, redact_url(url), redact_body(body))
+        with self._lock:
+            for queue in (self._exact.get(exact), self._loose.get(loose)):
+                while queue:
+                    position = queue.popleft()
+                    if not self._used[position]:
+                        self._used[position] = True
+                        entry = self._entries[position]
+                        return entry["status"], entry["headers"], _decode_body(entry["body"])
+        raise CassetteMiss(f"No recorded response for {method.upper()} {redact_url(url)} in {self.path}.")
+
+    def unused(self) -> int:
+        """Number of recorded exchanges that were never replayed."""
+        return self._used.count(False)
+
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+
+class _RecordingStream(httpx.SyncByteStream):
+    """Passes a response body through chunk by chunk and records the exchange when closed."""
+
+    def __init__(self, cassette: Cassette, request: httpx.Request, body: bytes,
+                 response: httpx.Response, start: float):
+        self._cassette = cassette
+        self._request = request
+        self._body = body
+        self._response = response
+        self._start = start
+        self._chunks = []
+        self._recorded = False
+
+    def __iter__(self):
+        for chunk in self._response.iter_bytes():
+            self._chunks.append(chunk)
+            yield chunk
+
+    def close(self):
+        try:
+            self._response.close()
+        finally:
+            if not self._recorded:
+                self._recorded = True
+                # A body cut short is recorded as far as it was read, as the caller saw it
+                self._cassette.record(
+                    self._request.method, str(self._request.url), self._body,
+                    self._response.status_code, self._response.headers, b"".join(self._chunks),
+                    time.perf_counter() - self._start,
+                )
+
+
+class CassetteTransport(httpx.BaseTransport):
+    """An httpx transport (Todoist, Gemini) that records to or replays from a Cassette."""
+
+    def __init__(self, cassette: Cassette, transport: Optional[httpx.BaseTransport] = None):
+        """
+        Args:
+            cassette (Cassette): Where exchanges are recorded to or replayed from.
+            transport (httpx.BaseTransport, optional): Sends the requests when recording.
+                                                       Defaults to a new HTTPTransport.
+        """
+        self.cassette = cassette
+        self._transport = None
+        if cassette.mode == RECORD:
+            self._transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        if self.cassette.mode == REPLAY:
+            status, headers, content = self.cassette.replay(request.method, str(request.url), body)
+            return httpx.Response(status, headers=headers, content=content, request=request)
+
+        start = time.perf_counter()
+        response = self._transport.handle_request(request)
+        # Hand back the (decoded) body chunk by chunk as it arrives, so streamed responses
+        # reach the caller as they would live; the exchange is recorded once it has been read
+        headers = [
+            (name, value) for name, value in response.headers.items()
+            if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(
+            response.status_code, headers=headers,
+            stream=_RecordingStream(self.cassette, request, body, response, start),
+            request=request, extensions=response.extensions,
+        )
+
+    def close(self):
+        # The cassette outlives the clients using it; only the network transport is closed
+        if self._transport:
+            self._transport.close()
+
+
+class CassetteHttp:
+    """
+    An httplib2.Http stand-in (Google API client) that records to or replays from a Cassette.
+    In record mode requests are sent with `http`, typically an authorized Http.
+    """
+
+    def __init__(self, cassette: Cassette, http=None):
+        self.cassette = cassette
+        self.http = http
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        if isinstance(body, str):
+            body = body.encode("utf-8")
+        if self.cassette.mode == REPLAY:
+            status, headers, content = self.cassette.replay(method, uri, body or b"")
+            return httplib2.Response({"status": str(status), **headers}), content
+
+        start = time.perf_counter()
+        response, content = self.http.request(uri, method, body=body, headers=headers, **kwargs)
+        self.cassette.record(
+            method, uri, body or b"", response.status, response, content,
+            time.perf_counter() - start,
+        )
+        return response, content
+
+    def close(self):
+        if self.http is not None and hasattr(self.http, "close"):
+            self.http.close()
+
+
+def open_cassettes(directory: str, mode: str) -> Dict[str, Cassette]:
+    """Opens one cassette per service in `directory`, e.g. `<directory>/todoist.jsonl.gz`."""
+    return {
+        service: Cassette(os.path.join(directory, f"{service}.jsonl.gz"), mode)
+        for service in SERVICES
+    }
+
+
+def close_cassettes(cassettes: Optional[Dict[str, Cassette]]):
+    for cassette in (cassettes or {}).values():
+        cassette.close()
@@ -0,0 +1,221 @@
+import os
+import re
+import json
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Known per-user settings: name -> (expected type, required)
+USER_SCHEMA = {
+    "user_id": (str, True),
+    "email": (str, False),
+    "todoist_api_key": (str, True),
+    "personal_scheduling_preferences": (str, False),
+    # How many tasks per planned day are ranked into the prompt (0 sends every task), and
+    # per-label score adjustments
+    "max_tasks": (int, False),
+    "task_label_weights": (dict, False),
+}
+
+# Cheap user_id extraction for JSON-lines files, so that unselected lines are never parsed
+_USER_ID_PATTERN = re.compile(r'"user_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+
+class ConfigError(Exception):
+    """Raised when the user configuration cannot be read."""
+
+
+def validate_user(user, origin: str = "") -> List[str]:
+    """
+    Validates a single user config against USER_SCHEMA.
+
+    Returns:
+        List[str]: Human readable errors; empty if the config is valid.
+    """
+    prefix = f"{origin}: " if origin else ""
+    if not isinstance(user, dict):
+        return [f"{prefix}expected a JSON object, got {type(user).__name__}"]
+
+    errors = []
+    for key, (expected_type, required) in USER_SCHEMA.items():
+        if key not in user or user[key] in (None, ""):
+            if required:
+                errors.append(f"{prefix}missing required field '{key}'")
+            continue
+        if not isinstance(user[key], expected_type):
+            errors.append(
+                f"{prefix}'{key}' must be a {expected_type.__name__}, "
+                f"got {type(user[key]).__name__}"
+            )
+    if isinstance(user.get("max_tasks"), int) and user["max_tasks"] < 0:
+        errors.append(f"{prefix}'max_tasks' cannot be negative")
+    if isinstance(user.get("task_label_weights"), dict):
+        for label, weight in user["task_label_weights"].items():
+            if isinstance(weight, bool) or not isinstance(weight, (int, float)):
+                errors.append(
+                    f"{prefix}'task_label_weights' must map labels to numbers, "
+                    f"got {type(weight).__name__} for '{label}'"
+                )
+    return errors
+
+
+class UserSource:
+    """
+    An ordered, lazily loaded collection of user configs.
+
+    Supported sources:
+    - a list of user dicts (the `users` key of a monolithic credentials.json),
+    - a directory of per-user `<user_id>.json` files,
+    - a JSON-lines file with one user object per line.
+
+    Only an index of user IDs is built up front (from file names or a cheap scan of each line);
+    user configs are parsed when they are validated or iterated, and never all held at once.
+    """
+
+    def __init__(self, origin: str, index: List[Tuple[str, object]], loader):
+        """
+        Args:
+            origin (str): Description of where the users come from, for messages.
+            index (List[Tuple[str, object]]): Ordered (user_id, locator) pairs.
+            loader (Callable): Loads the user dict for a locator.
+        """
+        self.origin = origin
+        self._index = index
+        self._loader = loader
+
+    @classmethod
+    def from_list(cls, users: List[dict], origin: str = "credentials.json") -> "UserSource":
+        index = [
+            (user.get("user_id", "unknown_user") if isinstance(user, dict) else "unknown_user", i)
+            for i, user in enumerate(users)
+        ]
+        return cls(origin, index, lambda i: users[i])
+
+    @classmethod
+    def from_path(cls, path: str) -> "UserSource":
+        """Creates a source from a directory of per-user files or a JSON-lines file."""
+        if os.path.isdir(path):
+            return cls._from_directory(path)
+        if os.path.isfile(path):
+            return cls._from_jsonl(path)
+        raise ConfigError(f"User config '{path}' not found.")
+
+    @classmethod
+    def _from_directory(cls, path: str) -> "UserSource":
+        index = [
+            (name[: -len(".json")], os.path.join(path, name))
+            for name in sorted(os.listdir(path))
+            if name.endswith(".json") and not name.startswith(".")
+        ]
+
+        def load(file_path):
+            with open(file_path, "r") as f:
+                return json.load(f)
+
+        return cls(path, index, load)
+
+    @classmethod
+    def _from_jsonl(cls, path: str) -> "UserSource":
+        index = []
+        with open(path, "rb") as f:
+            line_number = 0
+            while True:
+                offset = f.tell()
+                raw = f.readline()
+                if not raw:
+                    break
+                line_number += 1
+                line = raw.decode("utf-8").strip()
+                if not line or line.startswith("#"):
+                    continue
+                match = _USER_ID_PATTERN.search(line)
+                if match:
+                    user_id = json.loads(f'"{match.group(1)}"')
+                else:
+                    user_id = f"line_{line_number}"
+                index.append((user_id, offset))
+
+        def load(offset):
+            with open(path, "rb") as f:
+                f.seek(offset)
+                return json.loads(f.readline().decode("utf-8"))
+
+        return cls(path, index, load)
+
+    # --- Selection ---
+
+    def user_ids(self) -> List[str]:
+        return [user_id for user_id, _ in self._index]
+
+    def __len__(self) -> int:
+        return len(self._index)
+
+    def select(self, user_ids: Optional[Iterable[str]] = None, predicate=None) -> "UserSource":
+        """
+        Returns a source restricted to the given user IDs and/or IDs matching `predicate`,
+        keeping the original order.
+
+        Raises:
+            ConfigError: If a requested user ID does not exist.
+        """
+        index = self._index
+        if user_ids is not None:
+            wanted = set(user_ids)
+            missing = wanted - {user_id for user_id, _ in index}
+            if missing:
+                raise ConfigError(
+                    f"Unknown user(s) in {self.origin}: {', '.join(sorted(missing))}"
+                )
+            index = [entry for entry in index if entry[0] in wanted]
+        if predicate is not None:
+            index = [entry for entry in index if predicate(entry[0])]
+        return UserSource(self.origin, index, self._loader)
+
+    def head(self, count: int) -> "UserSource":
+        return UserSource(self.origin, self._index[:count], self._loader)
+
+    # --- Loading ---
+
+    def _load(self, user_id: str, locator) -> Tuple[Optional[dict], List[str]]:
+        origin = f"{self.origin} [{user_id}]"
+        try:
+            user = self._loader(locator)
+        except (OSError, ValueError) as e:
+            return None, [f"{origin}: could not be parsed: {e}"]
+        errors = validate_user(user, origin)
+        if not errors and user["user_id"] != user_id:
+            errors.append(f"{origin}: user_id '{user['user_id']}' does not match '{user_id}'")
+        return user, errors
+
+    def validate(self) -> Dict[str, List[str]]:
+        """
+        Parses and validates every selected user, one at a time, without keeping them.
+
+        Returns:
+            Dict[str, List[str]]: Errors per invalid user ID (empty if everything is valid).
+        """
+        invalid = {}
+        seen = set()
+        for user_id, locator in self._index:
+            _, errors = self._load(user_id, locator)
+            if user_id in seen:
+                errors.append(f"{self.origin} [{user_id}]: duplicate user_id")
+            seen.add(user_id)
+            if errors:
+                invalid[user_id] = errors
+        return invalid
+
+    def __iter__(self) -> Iterator[dict]:
+        """Yields each selected user config, loading it only when it is reached."""
+        for user_id, locator in self._index:
+            user, _ = self._load(user_id, locator)
+            if user is not None:
+                yield user
+
+
+def read_user_ids(path: str) -> List[str]:
+    """Reads user IDs from a file, one per line. Blank lines and '#' comments are ignored."""
+    with open(path, "r") as f:
+        return [
+            line.strip()
+            for line in f
+            if line.strip() and not line.strip().startswith("#")
+        ]
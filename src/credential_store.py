@@ -0,0 +1,141 @@
+import os
+import datetime
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterable, List, Optional, Union
+import requests
+from google.auth.transport.requests import Request
+from google.oauth2.credentials import Credentials
+
+
+def atomic_write(path: str, data: Union[str, Iterable[str]]):
+    """
+    Writes `data` (a string, or an iterable of strings that is written as it is consumed)
+    to `path` atomically.
+
+    The data is written to a temporary file in the same directory and then moved into place,
+    so readers never observe a half-written token file, even if the process dies mid-write.
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(
+        dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(fd, "w") as f:
+            if isinstance(data, str):
+                f.write(data)
+            else:
+                f.writelines(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+class CredentialStore:
+    """
+    Loads every OAuth token up front and refreshes the ones close to expiry concurrently,
+    so that authentication problems surface before the user loop starts.
+    """
+
+    def __init__(
+        self,
+        tokens_dir: str = "tokens",
+        refresh_margin: datetime.timedelta = datetime.timedelta(minutes=10),
+        max_workers: int = 8,
+        session: Optional[requests.Session] = None,
+    ):
+        """
+        Args:
+            tokens_dir (str): Directory holding the `token_<name>.json` files.
+            refresh_margin (datetime.timedelta): Tokens expiring within this margin are refreshed.
+            max_workers (int): Maximum number of concurrent refresh requests.
+            session (requests.Session, optional): A pooled session to send refreshes through,
+                                                  so concurrent refreshes reuse connections.
+        """
+        self.tokens_dir = tokens_dir
+        self.refresh_margin = refresh_margin
+        self.max_workers = max_workers
+        self.session = session
+        self._credentials: Dict[str, Credentials] = {}
+        self.failures: Dict[str, str] = {}  # name -> reason the token is unusable
+
+    def token_path(self, name: str) -> str:
+        return os.path.join(self.tokens_dir, f"token_{name}.json")
+
+    def load(self, name: str, scopes: List[str]) -> Optional[Credentials]:
+        """
+        Loads the token for `name`. Missing or unreadable tokens are recorded in `failures`.
+        """
+        path = self.token_path(name)
+        if not os.path.exists(path):
+            self.failures[name] = f"No token file at '{path}'."
+            return None
+
+        try:
+            creds = Credentials.from_authorized_user_file(path, scopes)
+        except Exception as e:
+            self.failures[name] = f"Could not read '{path}': {e}"
+            return None
+
+        self._credentials[name] = creds
+        self.failures.pop(name, None)
+        return creds
+
+    def get(self, name: str) -> Optional[Credentials]:
+        """Returns the loaded credentials for `name`, or None if they are missing or unusable."""
+        if name in self.failures:
+            return None
+        return self._credentials.get(name)
+
+    def save(self, name: str, creds: Credentials):
+        """Stores the credentials in memory and writes them atomically to disk."""
+        self._credentials[name] = creds
+        self.failures.pop(name, None)
+        atomic_write(self.token_path(name), creds.to_json())
+
+    def needs_refresh(self, creds: Credentials) -> bool:
+        """True if the credentials are invalid or expire within the refresh margin."""
+        if not creds.valid:
+            return True
+        if creds.expiry is None:
+            return False
+        # google-auth stores expiry as a naive UTC datetime
+        now = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+        return creds.expiry - now <= self.refresh_margin
+
+    def _refresh(self, name: str, creds: Credentials):
+        if not creds.refresh_token:
+            raise Exception("Token has expired and has no refresh token.")
+        creds.refresh(Request(self.session))
+        atomic_write(self.token_path(name), creds.to_json())
+
+    def refresh_expiring(self) -> Dict[str, str]:
+        """
+        Concurrently refreshes every loaded token that is expired or close to expiry.
+
+        Returns:
+            Dict[str, str]: Every unusable token (name -> reason), including ones that failed to load.
+        """
+        pending = {
+            name: creds
+            for name, creds in self._credentials.items()
+            if name not in self.failures and self.needs_refresh(creds)
+        }
+        if pending:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {
+                    name: executor.submit(self._refresh, name, creds)
+                    for name, creds in pending.items()
+                }
+                for name, future in futures.items():
+                    try:
+                        future.result()
+                    except Exception as e:
+                        self.failures[name] = f"Refresh failed: {e}"
+
+        return dict(self.failures)
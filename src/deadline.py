@@ -0,0 +1,85 @@
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(BaseException):
+    """
+    Raised when work runs past its deadline or budget.
+
+    Like asyncio.CancelledError, this derives from BaseException so that the broad
+    `except Exception` handlers around individual API calls don't swallow a cancellation.
+    """
+
+
+class Deadline:
+    """
+    A point in time that work must finish by, measured on the monotonic clock.
+
+    Deadlines nest: a per-user budget created with `child()` never outlasts the run deadline
+    it was derived from. A Deadline created with `seconds=None` never expires on its own.
+    """
+
+    def __init__(self, seconds: Optional[float] = None, name: str = "run", parent: "Deadline" = None):
+        """
+        Args:
+            seconds (float, optional): Time allowed from now. None means unlimited.
+            name (str): Used in error messages, e.g. "run" or "user_1".
+            parent (Deadline, optional): An enclosing deadline that also bounds this one.
+        """
+        self.name = name
+        self.parent = parent
+        self._expires_at = None if seconds is None else time.monotonic() + seconds
+
+    def child(self, seconds: Optional[float], name: str) -> "Deadline":
+        """Creates a nested budget that expires after `seconds` or with this deadline, whichever is first."""
+        return Deadline(seconds, name=name, parent=self)
+
+    def remaining(self) -> Optional[float]:
+        """Seconds left (never negative), or None if neither this deadline nor its parents are bounded."""
+        remaining = None
+        if self._expires_at is not None:
+            remaining = max(0.0, self._expires_at - time.monotonic())
+        if self.parent is not None:
+            parent_remaining = self.parent.remaining()
+            if parent_remaining is not None:
+                remaining = parent_remaining if remaining is None else min(remaining, parent_remaining)
+        return remaining
+
+    def expired(self) -> bool:
+        remaining = self.remaining()
+        return remaining is not None and remaining <= 0
+
+    def check(self, action: str = ""):
+        """
+        Raises:
+            DeadlineExceeded: If the deadline has passed.
+        """
+        if self.expired():
+            suffix = f" before {action}" if action else ""
+            raise DeadlineExceeded(f"The {self.name} deadline was reached{suffix}.")
+
+    def sleep(self, seconds: float, action: str = "retrying"):
+        """
+        Sleeps for `seconds`, unless that would overrun the deadline, in which case it raises
+        straight away instead of sleeping for nothing.
+
+        Raises:
+            DeadlineExceeded: If the deadline would pass before the sleep ends.
+        """
+        remaining = self.remaining()
+        if remaining is not None and seconds >= remaining:
+            raise DeadlineExceeded(
+                f"The {self.name} deadline would be reached while waiting {seconds:.0f}s before {action}."
+            )
+        time.sleep(seconds)
+
+    def timeout(self, default: Optional[float] = None) -> Optional[float]:
+        """The timeout to give a blocking call: `default`, capped by the time remaining."""
+        remaining = self.remaining()
+        if remaining is None:
+            return default
+        return remaining if default is None else min(default, remaining)
+
+
+# A deadline that never expires, used when no deadline is given
+NO_DEADLINE = Deadline(None, name="unlimited")
@@ -0,0 +1,271 @@
+import json
+import time
+import heapq
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+import requests
+from google.oauth2.credentials import Credentials
+from src.deadline import NO_DEADLINE, Deadline
+
+DEVICE_CODE_URL = "https://oauth2.googleapis.com/device/code"
+DEVICE_GRANT_TYPE = "urn:ietf:params:oauth:grant-type:device_code"
+DEFAULT_TOKEN_URI = "https://oauth2.googleapis.com/token"
+# RFC 8628: on "slow_down" the polling interval must grow by 5 seconds
+SLOW_DOWN_SECONDS = 5
+
+
+@dataclass
+class ClientConfig:
+    client_id: str
+    client_secret: str
+    token_uri: str = DEFAULT_TOKEN_URI
+
+
+@dataclass
+class DeviceAuthorization:
+    """A device code waiting for its user to approve it."""
+    name: str
+    device_code: str
+    user_code: str
+    verification_url: str
+    scopes: List[str]
+    interval: float
+    expires_at: float  # On the monotonic clock
+
+
+def load_client_config(client_secret_file: str) -> ClientConfig:
+    """
+    Reads the OAuth client from a client secret file ("installed" or "web" format).
+
+    Raises:
+        ValueError: If the file has neither format.
+    """
+    with open(client_secret_file, "r") as f:
+        data = json.load(f)
+
+    if "installed" in data:
+        config = data["installed"]
+    elif "web" in data:
+        config = data["web"]
+    else:
+        raise ValueError("Client secret file has unknown format.")
+    return ClientConfig(
+        client_id=config["client_id"],
+        client_secret=config["client_secret"],
+        token_uri=config.get("token_uri", DEFAULT_TOKEN_URI),
+    )
+
+
+def request_device_code(
+    client: ClientConfig,
+    scopes: List[str],
+    name: str = "",
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = 30,
+) -> DeviceAuthorization:
+    """
+    Requests a device code and the user code to show for it.
+
+    Raises:
+        requests.HTTPError: If the request is rejected.
+    """
+    response = (session or requests).post(
+        DEVICE_CODE_URL,
+        data={"client_id": client.client_id, "scope": " ".join(scopes)},
+        timeout=timeout,
+    )
+
+    if response.status_code != 200:
+        print(f"\nError requesting device code (Status {response.status_code}):")
+        print(response.text)
+        if response.status_code == 400:
+            print(
+                "\nHint: A 400 error often means the Client ID is incorrect for the Device Flow."
+            )
+            print(
+                "Please ensure your Client ID in client_secret.json matches a 'TVs and Limited Input devices' credential in Google Cloud Console."
+            )
+            print(
+                "Also verify that the requested scopes are enabled in the project."
+            )
+
+    response.raise_for_status()
+    data = response.json()
+    return DeviceAuthorization(
+        name=name,
+        device_code=data["device_code"],
+        user_code=data["user_code"],
+        verification_url=data["verification_url"],
+        scopes=list(scopes),
+        interval=data.get("interval", 5),
+        expires_at=time.monotonic() + data.get("expires_in", 1800),
+    )
+
+
+def request_device_codes(
+    client: ClientConfig,
+    names: List[str],
+    scopes: List[str],
+    session: Optional[requests.Session] = None,
+    max_workers: int = 8,
+) -> Tuple[List[DeviceAuthorization], Dict[str, str]]:
+    """
+    Requests a device code for each name concurrently.
+
+    Returns:
+        Tuple[List[DeviceAuthorization], Dict[str, str]]: The issued codes, in the order of
+        `names`, and the names whose request failed (name -> reason).
+    """
+    authorizations, failures = [], {}
+    if not names:
+        return authorizations, failures
+    with ThreadPoolExecutor(max_workers=min(len(names), max_workers)) as executor:
+        futures = {
+            name: executor.submit(request_device_code, client, scopes, name, session)
+            for name in names
+        }
+        for name, future in futures.items():
+            try:
+                authorizations.append(future.result())
+            except Exception as e:
+                failures[name] = f"Could not request a device code: {e}"
+    return authorizations, failures
+
+
+def poll_token(
+    client: ClientConfig,
+    authorization: DeviceAuthorization,
+    session: Optional[requests.Session] = None,
+    timeout: Optional[float] = 30,
+) -> Tuple[Optional[Credentials], Optional[str]]:
+    """
+    Asks once whether a device code has been approved.
+
+    Returns:
+        Tuple[Optional[Credentials], Optional[str]]: The credentials once approved; otherwise
+        None and the OAuth error (e.g. "authorization_pending" or "slow_down").
+    """
+    resp = (session or requests).post(
+        client.token_uri,
+        data={
+            "client_id": client.client_id,
+            "client_secret": client.client_secret,
+            "device_code": authorization.device_code,
+            "grant_type": DEVICE_GRANT_TYPE,
+        },
+        timeout=timeout,
+    )
+
+    if resp.status_code == 200:
+        token_data = resp.json()
+        return Credentials(
+            token=token_data["access_token"],
+            refresh_token=token_data.get("refresh_token"),
+            token_uri=client.token_uri,
+            client_id=client.client_id,
+            client_secret=client.client_secret,
+            scopes=authorization.scopes,
+        ), None
+
+    try:
+        error = resp.json().get("error")
+    except ValueError:
+        error = None
+    return None, error or f"HTTP {resp.status_code}"
+
+
+class DeviceFlowScheduler:
+    """
+    Polls many pending device codes from a single loop.
+
+    Each code is polled no sooner than its own `interval` after the previous poll, and its
+    interval grows whenever the server answers "slow_down". The loop sleeps until the next
+    code is due, so any number of users can be onboarded at once from one thread.
+    """
+
+    def __init__(
+        self,
+        client: ClientConfig,
+        session: Optional[requests.Session] = None,
+        deadline: Optional[Deadline] = None,
+    ):
+        """
+        Args:
+            client (ClientConfig): The OAuth client the device codes were issued to.
+            session (requests.Session, optional): A pooled session to poll through.
+            deadline (Deadline, optional): Bounds the whole polling loop.
+        """
+        self.client = client
+        self.session = session
+        self.deadline = deadline or NO_DEADLINE
+        self._queue = []  # (next poll time, tie-breaker, DeviceAuthorization)
+        self._order = itertools.count()
+        self.failures: Dict[str, str] = {}  # name -> why the code was not approved
+
+    def add(self, authorization: DeviceAuthorization):
+        """Schedules the first poll one interval from now."""
+        self._schedule(authorization, time.monotonic() + authorization.interval)
+
+    def _schedule(self, authorization: DeviceAuthorization, when: float):
+        heapq.heappush(self._queue, (when, next(self._order), authorization))
+
+    def pending(self) -> int:
+        return len(self._queue)
+
+    def run(
+        self, on_authorized: Optional[Callable[[str, Credentials], None]] = None
+    ) -> Dict[str, Credentials]:
+        """
+        Polls until every code is approved, denied or expired.
+
+        Args:
+            on_authorized (Callable, optional): Called with the name and credentials as soon as
+                                                each user approves, e.g. to save their token.
+
+        Returns:
+            Dict[str, Credentials]: The credentials of every approved code, by name. Codes that
+            were denied or expired are recorded in `failures`.
+
+        Raises:
+            DeadlineExceeded: If the deadline is reached with codes still pending.
+        """
+        authorized = {}
+        while self._queue:
+            when, _, authorization = self._queue[0]
+            if when > authorization.expires_at:
+                heapq.heappop(self._queue)
+                self.failures[authorization.name] = "Device code expired before it was approved."
+                continue
+            wait = when - time.monotonic()
+            if wait > 0:
+                self.deadline.sleep(wait, "polling for device authorization")
+            # Popped only once due, so `pending()` stays accurate while the loop sleeps
+            heapq.heappop(self._queue)
+
+            try:
+                creds, error = poll_token(
+                    self.client, authorization, self.session, self.deadline.timeout(30)
+                )
+            except requests.RequestException as e:
+                # A network hiccup costs this code one interval, not the whole onboarding
+                print(f"Could not poll the device code for {authorization.name}: {e}")
+                creds, error = None, "authorization_pending"
+
+            if creds is not None:
+                authorized[authorization.name] = creds
+                if on_authorized:
+                    on_authorized(authorization.name, creds)
+            elif error == "authorization_pending":
+                self._schedule(authorization, time.monotonic() + authorization.interval)
+            elif error == "slow_down":
+                authorization.interval += SLOW_DOWN_SECONDS
+                self._schedule(authorization, time.monotonic() + authorization.interval)
+            elif error == "expired_token":
+                self.failures[authorization.name] = "Device code expired before it was approved."
+            elif error == "access_denied":
+                self.failures[authorization.name] = "The user denied access."
+            else:
+                self.failures[authorization.name] = f"Failed to get token: {error}"
+        return authorized
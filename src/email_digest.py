@@ -0,0 +1,98 @@
+import re
+import dataclasses
+from typing import Dict, Iterable, List, Optional
+from src.models import Email
+
+# Paragraphs kept per thread, newest first, so a long thread doesn't crowd out the others
+DEFAULT_MAX_THREAD_PARAGRAPHS = 6
+
+# Where quoted history starts in a reply; everything from here on is dropped
+_REPLY_HEADERS = [
+    # Gmail / Apple Mail: "On Mon, Oct 2, 2023 at 9:00 AM Jane <jane@example.com> wrote:"
+    # (clients often wrap this line, so it may span two lines)
+    re.compile(r"^On\b[^\n]{0,200}(?:\n[^\n]{0,200})?\bwrote:[ \t]*$", re.MULTILINE),
+    re.compile(r"^-{2,}\s*Original Message\s*-{2,}\s*$", re.MULTILINE | re.IGNORECASE),
+    re.compile(r"^-{2,}\s*Forwarded message\s*-{2,}\s*$", re.MULTILINE | re.IGNORECASE),
+    # Outlook: a rule line, or a "From:" header block followed by "Sent:"/"Date:"
+    re.compile(r"^_{10,}\s*$", re.MULTILINE),
+    re.compile(r"^From: .*\n(?:.*\n)?(?:Sent|Date): ", re.MULTILINE),
+]
+
+# Where a signature starts; everything from here on is dropped
+_SIGNATURES = [
+    re.compile(r"^-- ?$", re.MULTILINE),  # The standard "-- " delimiter
+    re.compile(r"^Sent from my \w+.*$", re.MULTILINE | re.IGNORECASE),
+    re.compile(r"^Get Outlook for \w+.*$", re.MULTILINE | re.IGNORECASE),
+]
+
+_BLANK_LINES = re.compile(r"\n\s*\n")
+
+
+def strip_quoted_text(text: str) -> str:
+    """
+    Returns only the new content of an email: quoted replies ("> ..."), reply and forward
+    headers with the history below them, and signatures are removed.
+    """
+    text = text.replace("\r\n", "\n")
+    cut = len(text)
+    for pattern in _REPLY_HEADERS + _SIGNATURES:
+        match = pattern.search(text)
+        if match:
+            cut = min(cut, match.start())
+    text = text[:cut]
+
+    lines = [line.rstrip() for line in text.split("\n") if not line.lstrip().startswith(">")]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def _paragraphs(text: str) -> List[str]:
+    return [paragraph.strip() for paragraph in _BLANK_LINES.split(text) if paragraph.strip()]
+
+
+def _normalize(paragraph: str) -> str:
+    return " ".join(paragraph.lower().split())
+
+
+def collapse_threads(
+    emails: Iterable[Email], max_paragraphs: Optional[int] = DEFAULT_MAX_THREAD_PARAGRAPHS
+) -> List[Email]:
+    """
+    Collapses emails into one per thread, keeping only the newest content of each thread.
+
+    Messages are grouped by thread ID (or their own ID if they have none) and read oldest first.
+    Quoted text and signatures are stripped from each, and paragraphs repeated from earlier
+    messages are dropped. Of what is left, only the newest `max_paragraphs` paragraphs are kept,
+    so old history of a long thread doesn't reach the prompt. Each thread becomes a single Email
+    carrying the newest message's metadata, and threads are returned newest first. Threads with
+    no content left are dropped.
+
+    Args:
+        emails (Iterable[Email]): The emails to collapse.
+        max_paragraphs (int, optional): Paragraphs kept per thread. None keeps every one.
+
+    Returns:
+        List[Email]: One email per thread, newest first.
+    """
+    threads: Dict[str, List[Email]] = {}
+    for email in emails:
+        threads.setdefault(email.thread_id or email.id, []).append(email)
+
+    collapsed = []
+    for messages in threads.values():
+        messages.sort(key=lambda email: email.internal_date)
+        seen = set()
+        unique = []
+        for message in messages:
+            for paragraph in _paragraphs(strip_quoted_text(message.content)):
+                key = _normalize(paragraph)
+                if key not in seen:
+                    seen.add(key)
+                    unique.append(paragraph)
+        if max_paragraphs is not None:
+            unique = unique[-max_paragraphs:] if max_paragraphs else []
+        if unique:
+            newest = messages[-1]
+            collapsed.append(dataclasses.replace(newest, content="\n\n".join(unique)))
+
+    collapsed.sort(key=lambda email: email.internal_date, reverse=True)
+    return collapsed
@@ -0,0 +1,148 @@
+import re
+import math
+import time
+import dataclasses
+from collections import Counter
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+from src.models import CalendarEvent, Email, Task
+
+# Snippets sent to Gemini per user, across all of their emails
+DEFAULT_MAX_SNIPPETS = 12
+
+# BM25 parameters (the usual defaults)
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Relevance is scaled to 0..1 before this is added for a brand new snippet; it halves every
+# RECENCY_HALF_LIFE_DAYS, so newer paragraphs win among the equally relevant ones
+RECENCY_WEIGHT = 0.5
+RECENCY_HALF_LIFE_DAYS = 1.0
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_BLANK_LINES = re.compile(r"\n\s*\n")
+_STOPWORDS = frozenset("""
+    a about after all also am an and any are as at be been before but by can could did do
+    does for from had has have he her him his how i if in into is it its just me my no not
+    of on or our out please so some that the their them then there these they this to up
+    us was we were what when which who will with would you your
+""".split())
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words, without stopwords and single characters."""
+    return [
+        word for word in _WORD.findall(text.lower())
+        if len(word) > 1 and word not in _STOPWORDS
+    ]
+
+
+def build_query(
+    tasks: Union[List[Task], str], events: Union[List[CalendarEvent], str]
+) -> str:
+    """
+    The text snippets are matched against: the tasks' and events' titles and descriptions.
+    Either may be an error message instead of a list, in which case it contributes nothing.
+    """
+    parts = []
+    if not isinstance(tasks, str):
+        parts.extend(f"{task.content} {task.description} {' '.join(task.labels)}" for task in tasks)
+    if not isinstance(events, str):
+        parts.extend(f"{event.summary} {event.description}" for event in events)
+    return "\n".join(parts)
+
+
+class BM25Index:
+    """An Okapi BM25 index over a small, in-memory collection of documents."""
+
+    def __init__(self, documents: Sequence[List[str]], k1: float = BM25_K1, b: float = BM25_B):
+        """
+        Args:
+            documents (Sequence[List[str]]): Each document's tokens.
+        """
+        self.k1 = k1
+        self.b = b
+        self._term_counts = [Counter(tokens) for tokens in documents]
+        self._lengths = [len(tokens) for tokens in documents]
+        self._average_length = (sum(self._lengths) / len(documents)) if documents else 0.0
+        document_frequency = Counter(term for counts in self._term_counts for term in counts)
+        count = len(documents)
+        self._idf = {
+            term: math.log(1 + (count - frequency + 0.5) / (frequency + 0.5))
+            for term, frequency in document_frequency.items()
+        }
+
+    def scores(self, query: Iterable[str]) -> List[float]:
+        """The BM25 score of every document against the query tokens, in document order."""
+        terms = [term for term in set(query) if term in self._idf]
+        scores = []
+        for counts, length in zip(self._term_counts, self._lengths):
+            score = 0.0
+            norm = self.k1 * (1 - self.b + self.b * length / (self._average_length or 1))
+            for term in terms:
+                frequency = counts.get(term)
+                if frequency:
+                    score += self._idf[term] * frequency * (self.k1 + 1) / (frequency + norm)
+            scores.append(score)
+        return scores
+
+
+def select_snippets(
+    emails: List[Email],
+    query: str,
+    max_snippets: Optional[int] = DEFAULT_MAX_SNIPPETS,
+    now_ms: Optional[int] = None,
+) -> Tuple[List[Email], int]:
+    """
+    Keeps only the email paragraphs most relevant to `query` (today's tasks and events).
+
+    Each paragraph is scored with BM25 against the query, scaled to 0..1, plus a recency
+    bonus that halves every RECENCY_HALF_LIFE_DAYS. The top `max_snippets` paragraphs are kept,
+    in their original order within each email; emails left with no paragraph are dropped.
+
+    Args:
+        emails (List[Email]): The user's emails (typically after `collapse_threads`).
+        query (str): Text to match against, e.g. the rendered tasks and events.
+        max_snippets (int, optional): Paragraphs to keep. None keeps everything.
+        now_ms (int, optional): The current time in epoch milliseconds, for recency.
+
+    Returns:
+        Tuple[List[Email], int]: The emails, in the same order, with only their selected
+                                 paragraphs, and how many paragraphs were dropped.
+    """
+    paragraphs = [
+        (email_index, paragraph.strip())
+        for email_index, email in enumerate(emails)
+        for paragraph in _BLANK_LINES.split(email.content)
+        if paragraph.strip()
+    ]
+    if max_snippets is None or len(paragraphs) <= max_snippets:
+        return emails, 0
+
+    now_ms = now_ms if now_ms is not None else int(time.time() * 1000)
+    index = BM25Index([tokenize(paragraph) for _, paragraph in paragraphs])
+    relevance = index.scores(tokenize(query))
+    top_relevance = max(relevance) or 1.0
+
+    def recency(email: Email) -> float:
+        if not email.internal_date:
+            return 0.0
+        age_days = max(0.0, (now_ms - email.internal_date) / 86_400_000)
+        return 0.5 ** (age_days / RECENCY_HALF_LIFE_DAYS)
+
+    scores = [
+        relevance[position] / top_relevance + RECENCY_WEIGHT * recency(emails[email_index])
+        for position, (email_index, _) in enumerate(paragraphs)
+    ]
+    # Ties go to the earlier paragraph (emails arrive newest first)
+    ranked = sorted(range(len(paragraphs)), key=lambda position: (-scores[position], position))
+    kept = sorted(ranked[:max_snippets])
+
+    selected: List[List[str]] = [[] for _ in emails]
+    for position in kept:
+        email_index, paragraph = paragraphs[position]
+        selected[email_index].append(paragraph)
+    kept_emails = [
+        dataclasses.replace(email, content="\n\n".join(chosen))
+        for email, chosen in zip(emails, selected)
+        if chosen
+    ]
+    return kept_emails, len(paragraphs) - len(kept)
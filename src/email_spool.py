@@ -0,0 +1,84 @@
+import os
+import json
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Optional, Set
+from src.models import Email
+
+
+class EmailSpool:
+    """
+    Per-user buckets of admin emails, kept in temporary files rather than in memory.
+
+    Emails are routed to the users whose configured address matches the sender (ignoring case)
+    and appended to that user's bucket as they arrive; emails from anyone else are dropped.
+    A bucket is only read back, one email at a time, when its user is processed, so memory use
+    does not grow with the size of the mailbox.
+    """
+
+    def __init__(self, user_addresses: Dict[str, Optional[str]], directory: Optional[str] = None):
+        """
+        Args:
+            user_addresses (Dict[str, str]): Email address per user ID. Users without an address
+                                             receive no emails.
+            directory (str, optional): Where to create the temporary bucket directory.
+        """
+        self._tmp_dir = tempfile.TemporaryDirectory(prefix="email_spool_", dir=directory)
+        self._routes: Dict[str, List[str]] = {}
+        self._paths: Dict[str, str] = {}
+        self._counts: Dict[str, int] = {}
+        for index, (user_id, address) in enumerate(user_addresses.items()):
+            # Bucket files are numbered; user IDs are not necessarily safe file names
+            self._paths[user_id] = os.path.join(self._tmp_dir.name, f"{index}.jsonl")
+            self._counts[user_id] = 0
+            if address:
+                self._routes.setdefault(address.strip().lower(), []).append(user_id)
+        self.message_ids: Set[str] = set()
+
+    def add(self, email: Email) -> List[str]:
+        """
+        Spools an email into the buckets of the users it came from.
+
+        Returns:
+            List[str]: The IDs of the users the email was routed to.
+        """
+        self.message_ids.add(email.id)
+        user_ids = self._routes.get(email.sender.strip().lower(), [])
+        if user_ids:
+            line = json.dumps(email.to_dict()) + "\n"
+            for user_id in user_ids:
+                with open(self._paths[user_id], "a") as f:
+                    f.write(line)
+                self._counts[user_id] += 1
+        return user_ids
+
+    def extend(self, emails: Iterable[Email]) -> int:
+        """Spools every email from an iterable (typically a generator). Returns how many were read."""
+        count = 0
+        for email in emails:
+            self.add(email)
+            count += 1
+        return count
+
+    def addresses(self) -> List[str]:
+        """The sender addresses that are routed to a user."""
+        return list(self._routes)
+
+    def count(self, user_id: str) -> int:
+        return self._counts.get(user_id, 0)
+
+    def emails_for(self, user_id: str) -> Iterator[Email]:
+        """Streams a user's spooled emails in the order they were added."""
+        if not self._counts.get(user_id):
+            return
+        with open(self._paths[user_id], "r") as f:
+            for line in f:
+                yield Email.from_dict(json.loads(line))
+
+    def close(self):
+        self._tmp_dir.cleanup()
+
+    def __enter__(self) -> "EmailSpool":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
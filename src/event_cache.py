@@ -0,0 +1,164 @@
+import os
+import json
+import bisect
+import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.credential_store import atomic_write
+
+# Only these fields of an event resource are kept; they are all CalendarEvent needs
+KEPT_FIELDS = ("id", "summary", "description", "location", "start", "end")
+
+
+def _parse_bound(value: dict) -> Optional[datetime.datetime]:
+    if "dateTime" in value:
+        return datetime.datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+    if "date" in value:
+        # All-day events start and end at local midnight
+        return datetime.datetime.combine(
+            datetime.date.fromisoformat(value["date"]), datetime.time.min
+        ).astimezone()
+    return None
+
+
+def event_bounds(event: dict) -> Optional[Tuple[float, float]]:
+    """The event's start and end as POSIX timestamps, or None if it has no times."""
+    start = _parse_bound(event.get("start", {}))
+    end = _parse_bound(event.get("end", {}))
+    if start is None:
+        return None
+    return start.timestamp(), (end or start).timestamp()
+
+
+class CalendarCache:
+    """
+    The events of one calendar, kept current by incremental sync and indexed by start time.
+
+    Events that start before `horizon` (the timeMin of the last full sync) were never
+    downloaded, so the cache can only answer queries for windows from the horizon on.
+    """
+
+    def __init__(self, sync_token: Optional[str] = None, horizon: Optional[float] = None):
+        self.sync_token = sync_token
+        self.horizon = horizon
+        self._events: Dict[str, dict] = {}
+        self._index: List[Tuple[float, str]] = []  # (start, event ID), sorted
+        self._bounds: Dict[str, Tuple[float, float]] = {}
+        # Longest event seen, so overlap queries only scan back this far before the window
+        self._max_duration = 0.0
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def reset(self, horizon: Optional[float] = None):
+        """Forgets every event and the sync token, before a full sync."""
+        self.sync_token = None
+        self.horizon = horizon
+        self._events.clear()
+        self._index.clear()
+        self._bounds.clear()
+        self._max_duration = 0.0
+
+    def covers(self, start: datetime.datetime) -> bool:
+        return self.horizon is not None and start.timestamp() >= self.horizon
+
+    def _remove(self, event_id: str):
+        bounds = self._bounds.pop(event_id, None)
+        self._events.pop(event_id, None)
+        if bounds is not None:
+            position = bisect.bisect_left(self._index, (bounds[0], event_id))
+            if position < len(self._index) and self._index[position] == (bounds[0], event_id):
+                del self._index[position]
+
+    def apply(self, items: Iterable[dict]) -> int:
+        """
+        Applies a page of events.list results: cancelled events are removed, the rest are
+        added or replaced.
+
+        Returns:
+            int: How many events changed.
+        """
+        changed = 0
+        for item in items:
+            event_id = item.get("id")
+            if not event_id:
+                continue
+            self._remove(event_id)
+            changed += 1
+            bounds = event_bounds(item)
+            if item.get("status") == "cancelled" or bounds is None:
+                continue
+            self._events[event_id] = {key: item[key] for key in KEPT_FIELDS if key in item}
+            self._bounds[event_id] = bounds
+            bisect.insort(self._index, (bounds[0], event_id))
+            self._max_duration = max(self._max_duration, bounds[1] - bounds[0])
+        return changed
+
+    def between(
+        self, start: datetime.datetime, end: Optional[datetime.datetime] = None
+    ) -> List[dict]:
+        """
+        Events overlapping [start, end), like events.list with timeMin and timeMax, sorted by
+        start time. Without `end`, every event that has not ended by `start`.
+        """
+        start_ts = start.timestamp()
+        low = bisect.bisect_left(self._index, (start_ts - self._max_duration, ""))
+        high = len(self._index)
+        if end is not None:
+            high = bisect.bisect_left(self._index, (end.timestamp(), ""))
+        return [
+            self._events[event_id]
+            for _, event_id in self._index[low:high]
+            if self._bounds[event_id][1] > start_ts
+            # Zero-length events at the very start of the window still count
+            or self._bounds[event_id][0] == start_ts
+        ]
+
+    def to_json(self) -> dict:
+        return {
+            "sync_token": self.sync_token,
+            "horizon": self.horizon,
+            "events": list(self._events.values()),
+        }
+
+    @classmethod
+    def from_json(cls, data: dict) -> "CalendarCache":
+        cache = cls(data.get("sync_token"), data.get("horizon"))
+        cache.apply(data.get("events", []))
+        return cache
+
+
+class EventCache:
+    """One user's calendar caches, persisted to a JSON file between runs."""
+
+    def __init__(self, path: Optional[str] = None):
+        """
+        Args:
+            path (str, optional): Where the caches are saved. None keeps them in memory only.
+        """
+        self.path = path
+        self.calendars: Dict[str, CalendarCache] = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+                self.calendars = {
+                    calendar_id: CalendarCache.from_json(calendar)
+                    for calendar_id, calendar in data.get("calendars", {}).items()
+                }
+            except (OSError, ValueError, KeyError, TypeError, AttributeError) as e:
+                # A damaged cache only costs a full sync
+                print(f"Warning: Ignoring unreadable event cache '{path}': {e}")
+                self.calendars = {}
+
+    def calendar(self, calendar_id: str) -> CalendarCache:
+        return self.calendars.setdefault(calendar_id, CalendarCache())
+
+    def save(self):
+        if not self.path:
+            return
+        data = {
+            "calendars": {
+                calendar_id: calendar.to_json() for calendar_id, calendar in self.calendars.items()
+            }
+        }
+        atomic_write(self.path, json.dumps(data))
@@ -1,10 +1,31 @@
 from google import genai
 from google.genai import types
+from src.cassette import REPLAY, Cassette, CassetteTransport
+from src.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
 from src.google_service_manager import GoogleServiceManager
+from src.metrics import DEFAULT_METRICS, MetricsRegistry, instrumented
+from src.models import render_busy_blocks, render_emails, render_events, render_tasks
 import datetime
 import time
+import httpx
 import logging
 import re
+import threading
+from typing import Dict, List, Optional
+
+# Fallback chain: a lighter tier takes over immediately when the main model is overloaded
+DEFAULT_MODELS = ["gemini-2.5-flash", "gemini-2.5-flash-lite"]
+
+# Requests per chat turn: the prompt, then one per round of add_event results (as the SDK's
+# automatic function calling allows by default)
+MAX_TOOL_ROUNDS = 10
+
+# usage_metadata fields, by the `kind` label of secretary_gemini_tokens_total
+USAGE_FIELDS = (
+    ("input", "prompt_token_count"),
+    ("output", "candidates_token_count"),
+    ("cached", "cached_content_token_count"),
+)
 
 SECRETARY_PROMPT = """
 Current Date: {today}
@@ -74,6 +95,7 @@ Add the following information to the description:
 2. If the tasks in the event are large and or daunting, please breakdown the task into actionable steps.
 3. Provide relevant links to the task and or steps when necessary.
 
+{extra_instructions}
 Okay you are now ready for the key pieces of data.
 
 Pre-Exisiting Events:
@@ -89,21 +111,161 @@ Recent User Input:
 {recent_user_input}
 """
 
+MULTI_DAY_INSTRUCTIONS = """
+**MULTI-DAY PLANNING:**
+This time you are planning {days} days at once: from {today} ({day_of_week}) through {last_day} ({last_day_of_week}).
+Plan every day in this range as its own day. The task limits above apply to each day separately,
+and whether a day counts as a weekday or a weekend depends on that day's own day of week.
+Spread tasks sensibly across the days instead of front-loading them, and never schedule the same task twice.
+Every `add_event` call must start within this range, and start_time and end_time must include the full date.
+"""
+
+REPLAN_INSTRUCTIONS = """
+**REPLANNING THE REST OF THE DAY:**
+Something changed, so you are re-planning the rest of today. It is now {now}.
+Everything before {now} is over and must not be touched. Only schedule events that start at or after {now}.
+Events you planned earlier for the rest of today have been removed, so treat the remaining time as a fresh plan
+that respects the updated Pre-Existing Events and the latest Recent User Input.
+"""
+
+
+class ModelHealthTracker:
+    """
+    Tracks which Gemini models are currently responding, so that later users in a run go
+    straight to a healthy model instead of retrying an overloaded one.
+    """
+
+    def __init__(self, cooldown: float = 300.0):
+        """
+        Args:
+            cooldown (float): Seconds a model is avoided after it reports overload.
+        """
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+        self._unavailable_until: Dict[str, float] = {}
+
+    def mark_unavailable(self, model: str, duration: Optional[float] = None):
+        with self._lock:
+            self._unavailable_until[model] = time.monotonic() + (duration or self.cooldown)
+
+    def mark_healthy(self, model: str):
+        with self._lock:
+            self._unavailable_until.pop(model, None)
+
+    def is_healthy(self, model: str) -> bool:
+        with self._lock:
+            return self._unavailable_until.get(model, 0.0) <= time.monotonic()
+
+    def order(self, models: List[str]) -> List[str]:
+        """
+        Orders models for the next attempt: healthy ones first, in their configured order,
+        then unavailable ones by how soon they are expected to recover.
+        """
+        now = time.monotonic()
+        with self._lock:
+            until = {model: self._unavailable_until.get(model, 0.0) for model in models}
+        healthy = [model for model in models if until[model] <= now]
+        recovering = sorted((model for model in models if until[model] > now), key=until.get)
+        return healthy + recovering
+
+
+def _chunk_text(chunk) -> str:
+    """The text parts of a streamed chunk; function calls and thoughts are left out."""
+    if not chunk.candidates or not chunk.candidates[0].content:
+        return ""
+    return "".join(
+        part.text for part in chunk.candidates[0].content.parts or []
+        if part.text and not part.thought
+    )
+
+
+# Shared by every GeminiManager in the process unless one is passed in explicitly
+DEFAULT_HEALTH_TRACKER = ModelHealthTracker()
+
 
 class GeminiManager:
-    def __init__(self, api_key, google_service_manager: GoogleServiceManager):
-        self.client = genai.Client(api_key=api_key)
+    def __init__(
+        self,
+        api_key,
+        google_service_manager: GoogleServiceManager,
+        models: Optional[List[str]] = None,
+        health_tracker: Optional[ModelHealthTracker] = None,
+        deadline: Optional[Deadline] = None,
+        cassette: Optional[Cassette] = None,
+        metrics: Optional[MetricsRegistry] = None,
+        user_id: str = "",
+        stream: bool = False,
+    ):
+        """
+        Args:
+            api_key (str): The Gemini API key.
+            google_service_manager (GoogleServiceManager): Calendar access used by the tools.
+            models (List[str], optional): Models to try, in order of preference. On overload the
+                                          next model is used immediately. Defaults to DEFAULT_MODELS.
+            health_tracker (ModelHealthTracker, optional): Defaults to the process-wide tracker.
+            deadline (Deadline, optional): Bounds every Gemini call and retry sleep.
+            cassette (Cassette, optional): Records or replays the Gemini traffic. Retry sleeps
+                                           are skipped when replaying.
+            metrics (MetricsRegistry, optional): Where token usage, calls and retries are
+                                                 recorded. Defaults to the process-wide registry.
+            user_id (str): Labels this user's token usage.
+            stream (bool): Use the streaming chat API: the response text is printed as it
+                           arrives and each add_event call runs as soon as it is received,
+                           rather than once the model's whole turn is done.
+        """
+        if cassette is None:
+            self.client = genai.Client(api_key=api_key)
+        else:
+            http_client = httpx.Client(transport=CassetteTransport(cassette))
+            self.client = genai.Client(
+                api_key=api_key, http_options=types.HttpOptions(httpx_client=http_client)
+            )
+        self.replaying = cassette is not None and cassette.mode == REPLAY
         self.google_service_manager = google_service_manager
+        self.models = list(models or DEFAULT_MODELS)
+        self.health_tracker = health_tracker or DEFAULT_HEALTH_TRACKER
+        self.deadline = deadline or NO_DEADLINE
+        self.metrics = metrics or DEFAULT_METRICS
+        self.user_id = user_id
+        self.stream = stream
+        self.last_prompt = None
+        self.last_model = None
 
-        # Define the tools that Gemini can use
-        self.tools = [self.google_service_manager.add_event]
+        # Define the tools that Gemini can use. They are run here rather than by the SDK, so that
+        # every request of a turn (and its token usage) is seen
+        self.functions = {"add_event": self.google_service_manager.add_event}
+        self.tools = list(self.functions.values())
 
     def generate_full_prompt(
-        self, personal_scheduling_preferences, potential_tasks, recent_user_input=""
+        self,
+        personal_scheduling_preferences,
+        potential_tasks,
+        recent_user_input="",
+        existing_events=None,
+        days=1,
+        busy_blocks=None,
+        replan_from=None,
     ):
+        """
+        Builds the prompt for planning `days` days, starting today.
+        `busy_blocks` from the user's other calendars are listed after the existing events.
+        If `replan_from` (a datetime) is given, only the rest of today from that time is planned.
+        """
         today = datetime.date.today()
+        last_day = today + datetime.timedelta(days=days - 1)
         day_of_week = today.strftime("%A")
-        existing_events = self.google_service_manager.get_events_for_day(today)
+        if existing_events is None:
+            existing_events = self.google_service_manager.get_events_for_range(today, last_day)
+        # Structured inputs are rendered here, in one pass, right before assembly
+        if not isinstance(existing_events, str):
+            label = today if days == 1 else f"{today} to {last_day}"
+            existing_events = render_events(existing_events, label)
+        if busy_blocks:
+            existing_events += "\n" + render_busy_blocks(busy_blocks)
+        if not isinstance(potential_tasks, str):
+            potential_tasks = render_tasks(potential_tasks)
+        if not isinstance(recent_user_input, str):
+            recent_user_input = render_emails(recent_user_input)
         return SECRETARY_PROMPT.format(
             today=today,
             day_of_week=day_of_week,
@@ -111,72 +273,245 @@ class GeminiManager:
             personal_scheduling_preferences=personal_scheduling_preferences,
             potential_tasks=potential_tasks,
             recent_user_input=recent_user_input,
+            extra_instructions=self._extra_instructions(
+                today, day_of_week, last_day, days, replan_from
+            ),
         )
 
+    def _extra_instructions(self, today, day_of_week, last_day, days, replan_from):
+        instructions = ""
+        if days > 1:
+            instructions += MULTI_DAY_INSTRUCTIONS.format(
+                days=days,
+                today=today,
+                day_of_week=day_of_week,
+                last_day=last_day,
+                last_day_of_week=last_day.strftime("%A"),
+            )
+        if replan_from is not None:
+            instructions += REPLAN_INSTRUCTIONS.format(
+                now=replan_from.strftime("%I:%M %p")
+            )
+        return instructions
+
+    @instrumented
     def generate_and_execute(
-        self, personal_scheduling_preferences, potential_tasks, recent_user_input=""
+        self,
+        personal_scheduling_preferences,
+        potential_tasks,
+        recent_user_input="",
+        existing_events=None,
+        days=1,
+        busy_blocks=None,
+        replan_from=None,
+        prompt=None,
     ):
         """
         Sends the prompt to Gemini and handles tool calls.
+        A `prompt` built earlier (e.g. by `generate_full_prompt`) is sent as is.
+        The prompt that was sent is kept in `last_prompt`.
         """
-        full_prompt = self.generate_full_prompt(
-            personal_scheduling_preferences, potential_tasks, recent_user_input
+        full_prompt = prompt or self.generate_full_prompt(
+            personal_scheduling_preferences,
+            potential_tasks,
+            recent_user_input,
+            existing_events,
+            days,
+            busy_blocks,
+            replan_from,
+        )
+        self.last_prompt = full_prompt
+
+        # Only allow the model to schedule into the days (and times) it was asked to plan
+        today = datetime.date.today()
+        self.google_service_manager.planning_window = (
+            today,
+            today + datetime.timedelta(days=days - 1),
         )
+        self.google_service_manager.planning_not_before = replan_from
 
         max_retries = 5
         base_delay = 90  # Increased to 90 seconds (1.5 minutes) to avoid rate limits
+        # Overload is usually brief, and only reached once every model in the chain is overloaded
+        overload_base_delay = 15
 
         for attempt in range(max_retries):
-            try:
-                chat = self.client.chats.create(
-                    model="gemini-2.5-flash",
-                    config=types.GenerateContentConfig(tools=self.tools),
-                )
-                response = chat.send_message(full_prompt)
-                return response.text
-            except Exception as e:
-                error_msg = str(e)
-                # Check for 503 UNAVAILABLE or overloaded message
-                if "503" in error_msg or "overloaded" in error_msg.lower():
-                    if attempt < max_retries - 1:
-                        sleep_time = base_delay * (2**attempt)
-                        logging.warning(
-                            f"Gemini is overloaded. Retrying in {sleep_time} seconds... (Attempt {attempt + 1}/{max_retries})"
-                        )
-                        time.sleep(sleep_time)
+            # Models that are overloaded or out of quota are skipped immediately in favour of the
+            # next one in the chain; we only sleep once every model has failed in this round.
+            sleep_times = []
+            for model in self.health_tracker.order(self.models):
+                self.deadline.check("calling Gemini")
+                # Events planned by an attempt that failed part way are not part of this one
+                self.google_service_manager.restart_plan()
+                try:
+                    chat = self.client.chats.create(
+                        model=model,
+                        config=types.GenerateContentConfig(
+                            tools=self.tools, http_options=self._http_options(),
+                            automatic_function_calling=types.AutomaticFunctionCallingConfig(
+                                disable=True
+                            ),
+                        ),
+                    )
+                    text, usage = self._send_turn(chat, full_prompt)
+                    self.metrics.inc("secretary_api_calls_total", service="gemini", status="200")
+                    self._record_usage(model, usage)
+                    self.health_tracker.mark_healthy(model)
+                    self.last_model = model
+                    return text
+                except Exception as e:
+                    # A request cut short by the deadline's timeout is a cancellation, not a model error
+                    if self.deadline.expired():
+                        raise DeadlineExceeded(
+                            f"The {self.deadline.name} deadline was reached while calling Gemini."
+                        ) from e
+                    error_msg = str(e)
+                    # Check for 503 UNAVAILABLE or overloaded message
+                    if "503" in error_msg or "overloaded" in error_msg.lower():
+                        self.metrics.inc("secretary_api_calls_total", service="gemini", status="503")
+                        self.health_tracker.mark_unavailable(model)
+                        logging.warning(f"Gemini model {model} is overloaded. Trying the next model...")
+                        sleep_times.append(overload_base_delay * (2**attempt))
                         continue
 
-                # Check for 429 RESOURCE_EXHAUSTED
-                if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
-                    if attempt < max_retries - 1:
-                        # Try to find the retry delay in the error message
-                        # Look for 'retryDelay': '17s' or similar
-                        delay_match = re.search(
-                            r"retryDelay':\s*'([\d\.]+)s'", error_msg
-                        )
-                        if not delay_match:
-                            # Try looking for "Please retry in 17.501247704s."
-                            delay_match = re.search(r"retry in ([\d\.]+)s", error_msg)
-
-                        if delay_match:
-                            try:
-                                retry_delay = float(delay_match.group(1))
-                                # Add a small buffer just in case
-                                sleep_time = retry_delay + 1.0
-                            except ValueError:
-                                sleep_time = base_delay * (2**attempt)
-                        else:
-                            sleep_time = base_delay * (2**attempt)
-
-                        # Ensure we wait at least the base delay (1.5 minutes) to be safe against quota limits
-                        if sleep_time < base_delay:
-                            sleep_time = base_delay
-
-                        logging.warning(
-                            f"Gemini quota exceeded. Retrying in {sleep_time:.2f} seconds... (Attempt {attempt + 1}/{max_retries})"
-                        )
-                        time.sleep(sleep_time)
+                    # Check for 429 RESOURCE_EXHAUSTED
+                    if "429" in error_msg or "RESOURCE_EXHAUSTED" in error_msg:
+                        self.metrics.inc("secretary_api_calls_total", service="gemini", status="429")
+                        sleep_time = self._quota_retry_delay(error_msg, base_delay, attempt)
+                        self.health_tracker.mark_unavailable(model, sleep_time)
+                        logging.warning(f"Gemini model {model} quota exceeded. Trying the next model...")
+                        sleep_times.append(sleep_time)
                         continue
 
-                # If it's not a retryable error or we've exhausted retries
-                return f"Error interacting with Gemini: {e}"
+                    # If it's not a retryable error
+                    self.metrics.inc("secretary_api_calls_total", service="gemini", status="error")
+                    return f"Error interacting with Gemini: {e}"
+
+            if attempt < max_retries - 1:
+                sleep_time = min(sleep_times)
+                logging.warning(
+                    f"All Gemini models are unavailable. Retrying in {sleep_time:.2f} seconds... (Attempt {attempt + 1}/{max_retries})"
+                )
+                self.metrics.inc("secretary_api_retries_total", service="gemini")
+                if not self.replaying:
+                    self.metrics.inc(
+                        "secretary_sleep_seconds_total", sleep_time, service="gemini", reason="retry"
+                    )
+                    self.deadline.sleep(sleep_time, "retrying Gemini")
+
+        # We've exhausted retries
+        return f"Error interacting with Gemini: all models ({', '.join(self.models)}) are unavailable."
+
+    def _send_turn(self, chat, prompt):
+        """
+        Sends the prompt and runs the functions the model calls, sending their results back
+        until the model stops calling them (at most MAX_TOOL_ROUNDS requests).
+
+        Returns:
+            Tuple[str, Dict[str, int]]: The text (the final response's, or everything streamed),
+                                        and the tokens used by every request, by kind.
+        """
+        usage = dict.fromkeys((kind for kind, _ in USAGE_FIELDS), 0)
+        message = prompt
+        pieces = []
+        for _ in range(MAX_TOOL_ROUNDS):
+            if self.stream:
+                response, results = self._send_streaming(chat, message, pieces)
+            else:
+                response = chat.send_message(message)
+                pieces = [response.text or ""]
+                results = [self._call_function(call) for call in response.function_calls or []]
+            self._add_usage(usage, response)
+            if not results:
+                break
+            message = results
+        if self.stream and pieces and not pieces[-1].endswith("\n"):
+            print()
+        return "".join(pieces), usage
+
+    def _send_streaming(self, chat, message, pieces):
+        """
+        Sends one request of the turn with the streaming chat API, printing the text as it
+        arrives (and adding it to `pieces`) and running each function call as soon as the chunk
+        that carries it has been received.
+
+        Returns:
+            Tuple[GenerateContentResponse, List[types.Part]]: The last chunk with usage, which
+                                                            carries the usage of the request,
+                                                            and the function results.
+        """
+        results = []
+        last = None
+        for chunk in chat.send_message_stream(message):
+            piece = _chunk_text(chunk)
+            if piece:
+                pieces.append(piece)
+                print(piece, end="", flush=True)
+            results.extend(self._call_function(call) for call in chunk.function_calls or [])
+            if chunk.usage_metadata is not None:
+                last = chunk
+        return last, results
+
+    def _call_function(self, call) -> types.Part:
+        """Runs one function call from the model and wraps its result for the next request."""
+        function = self.functions.get(call.name)
+        try:
+            if function is None:
+                raise ValueError(f"Unknown function '{call.name}'.")
+            response = {"result": function(**(call.args or {}))}
+        except Exception as e:
+            response = {"error": str(e)}
+        return types.Part.from_function_response(name=call.name, response=response)
+
+    @staticmethod
+    def _add_usage(usage, response):
+        """Adds the tokens one request reports to `usage`."""
+        metadata = getattr(response, "usage_metadata", None)
+        if metadata is None:
+            return
+        for kind, field in USAGE_FIELDS:
+            count = getattr(metadata, field, None)
+            if isinstance(count, int):
+                usage[kind] += count
+
+    def _record_usage(self, model, usage):
+        """Counts the tokens used by every request of the chat turn."""
+        for kind, count in usage.items():
+            if count:
+                self.metrics.inc(
+                    "secretary_gemini_tokens_total", count,
+                    user=self.user_id, model=model, kind=kind,
+                )
+
+    def _http_options(self):
+        """Caps the request timeout at the time left before the deadline."""
+        timeout = self.deadline.timeout()
+        if timeout is None:
+            return None
+        return types.HttpOptions(timeout=max(1, int(timeout * 1000)))
+
+    def _quota_retry_delay(self, error_msg, base_delay, attempt):
+        """Works out how long to wait after a 429 RESOURCE_EXHAUSTED error."""
+        # Try to find the retry delay in the error message
+        # Look for 'retryDelay': '17s' or similar
+        delay_match = re.search(
+            r"retryDelay':\s*'([\d\.]+)s'", error_msg
+        )
+        if not delay_match:
+            # Try looking for "Please retry in 17.501247704s."
+            delay_match = re.search(r"retry in ([\d\.]+)s", error_msg)
+
+        if delay_match:
+            try:
+                retry_delay = float(delay_match.group(1))
+                # Add a small buffer just in case
+                sleep_time = retry_delay + 1.0
+            except ValueError:
+                sleep_time = base_delay * (2**attempt)
+        else:
+            sleep_time = base_delay * (2**attempt)
+
+        # Ensure we wait at least the base delay (1.5 minutes) to be safe against quota limits
+        if sleep_time < base_delay:
+            sleep_time = base_delay
+        return sleep_time
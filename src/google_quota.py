@@ -0,0 +1,196 @@
+import json
+import time
+import random
+import threading
+from collections import deque
+from typing import Optional
+from googleapiclient.errors import HttpError
+from src.deadline import NO_DEADLINE, Deadline
+from src.metrics import DEFAULT_METRICS, MetricsRegistry
+
+# Statuses worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+# 403s that mean "slow down" rather than "forbidden"; a daily quotaExceeded won't clear by retrying
+RETRYABLE_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "backendError"}
+
+# Calendar starts rejecting a user's event writes with rateLimitExceeded well below the
+# documented per-minute query quota when they arrive in bursts, so writes are paced under this
+CALENDAR_WRITES_PER_MINUTE = 120
+
+
+def error_reason(error: HttpError) -> str:
+    """The first `reason` in a Google API error body (e.g. "rateLimitExceeded"), or ""."""
+    try:
+        details = json.loads(error.content.decode("utf-8"))["error"]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return ""
+    if not isinstance(details, dict):
+        return ""
+    for item in details.get("errors", []):
+        if item.get("reason"):
+            return item["reason"]
+    return details.get("status", "")
+
+
+def is_retryable(error: Exception) -> bool:
+    """True for rate limiting, 5xx responses and dropped connections; False for everything else."""
+    if isinstance(error, HttpError):
+        status = error.resp.status
+        return status in RETRYABLE_STATUSES or (
+            status == 403 and error_reason(error) in RETRYABLE_REASONS
+        )
+    return isinstance(error, (ConnectionError, TimeoutError))
+
+
+def _service_name(request) -> str:
+    # e.g. "calendar.events.insert" -> "calendar"
+    method_id = getattr(request, "methodId", None)
+    return method_id.split(".")[0] if isinstance(method_id, str) and method_id else "google"
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait (Retry-After), if it said."""
+    resp = getattr(error, "resp", None)
+    try:
+        return float(resp.get("retry-after"))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class QuotaExecutor:
+    """
+    Executes one user's Google API requests, retrying transient failures with jittered
+    exponential backoff and pacing Calendar writes under the per-user write limit.
+
+    It also keeps count of the requests it sent, so each user's quota use can be reported.
+    """
+
+    def __init__(
+        self,
+        deadline: Optional[Deadline] = None,
+        max_retries: int = 5,
+        base_delay: float = 1.0,
+        max_delay: float = 32.0,
+        writes_per_minute: Optional[int] = CALENDAR_WRITES_PER_MINUTE,
+        replaying: bool = False,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        """
+        Args:
+            deadline (Deadline, optional): Bounds every retry and throttling wait.
+            max_retries (int): Retries per request before the error is raised.
+            base_delay (float): The first backoff in seconds; it doubles with each retry.
+            max_delay (float): Upper bound for a single backoff.
+            writes_per_minute (int, optional): Writes allowed per sliding minute. None disables
+                                               throttling.
+            replaying (bool): Skip every wait (cassette replays answer instantly).
+            metrics (MetricsRegistry, optional): Where calls, retries and waits are counted.
+                                                 Defaults to the process-wide registry.
+        """
+        self.deadline = deadline or NO_DEADLINE
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.writes_per_minute = writes_per_minute
+        self.replaying = replaying
+        self.metrics = metrics or DEFAULT_METRICS
+        self._lock = threading.Lock()
+        # Monotonic times of the latest writes (some may be scheduled in the future, for
+        # writes still waiting their turn); at most `writes_per_minute` are kept
+        self._recent_writes = deque()
+        self.stats = {
+            "requests": 0,  # Every attempt sent, including retries
+            "writes": 0,
+            "retries": 0,
+            "failures": 0,  # Requests that still failed after retrying (or were not retryable)
+            "throttled_seconds": 0.0,
+        }
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait before retry `attempt` (0-based), honouring Retry-After."""
+        requested = retry_after(error)
+        if requested is not None:
+            return min(self.max_delay, requested)
+        delay = min(self.max_delay, self.base_delay * (2**attempt))
+        # Equal jitter: at least half the delay, so that users retrying together spread out
+        return delay / 2 + random.uniform(0, delay / 2)
+
+    def _wait(self, seconds: float, action: str):
+        if self.replaying or seconds <= 0:
+            return
+        self.deadline.sleep(seconds, action)
+
+    def _count(self, stat: str, amount: float = 1):
+        with self._lock:
+            self.stats[stat] += amount
+
+    def _throttle_write(self):
+        if not self.writes_per_minute:
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self._recent_writes and now - self._recent_writes[0] >= 60:
+                self._recent_writes.popleft()
+            # This write may go once the write `writes_per_minute` places before it has left
+            # the window; that is the oldest one still inside it
+            slot = now
+            if len(self._recent_writes) >= self.writes_per_minute:
+                slot = max(now, self._recent_writes[-self.writes_per_minute] + 60)
+            self._recent_writes.append(slot)
+            while len(self._recent_writes) > self.writes_per_minute:
+                self._recent_writes.popleft()
+            wait = slot - now
+            if wait > 0 and not self.replaying:
+                self.stats["throttled_seconds"] += wait
+        if wait > 0 and not self.replaying:
+            self.metrics.inc(
+                "secretary_sleep_seconds_total", wait, service="calendar", reason="throttle"
+            )
+            self._wait(wait, "the next calendar write")
+
+    def execute(self, request, write: bool = False):
+        """
+        Executes a googleapiclient request.
+
+        Args:
+            request: The HttpRequest to execute, e.g. `service.events().insert(...)`.
+            write (bool): Whether the request writes (counts against the write limit).
+
+        Returns:
+            The response body.
+
+        Raises:
+            HttpError: If the request fails with a non-retryable error, or still fails
+                       after `max_retries` retries.
+            DeadlineExceeded: If the deadline would pass while waiting to retry.
+        """
+        if write:
+            self._throttle_write()
+            self._count("writes")
+        service = _service_name(request)
+        attempt = 0
+        while True:
+            self._count("requests")
+            try:
+                response = request.execute()
+                self.metrics.inc("secretary_api_calls_total", service=service, status="200")
+                return response
+            except (HttpError, ConnectionError, TimeoutError) as error:
+                status = error.resp.status if isinstance(error, HttpError) else type(error).__name__
+                self.metrics.inc("secretary_api_calls_total", service=service, status=status)
+                if not is_retryable(error) or attempt >= self.max_retries:
+                    self._count("failures")
+                    raise
+                delay = self.backoff(attempt, error)
+                print(
+                    f"Google API request failed ({error}); retrying in {delay:.1f}s "
+                    f"(attempt {attempt + 1}/{self.max_retries})."
+                )
+                self._count("retries")
+                self.metrics.inc("secretary_api_retries_total", service=service)
+                if not self.replaying:
+                    self.metrics.inc(
+                        "secretary_sleep_seconds_total", delay, service=service, reason="retry"
+                    )
+                self._wait(delay, "retrying a Google API request")
+                attempt += 1
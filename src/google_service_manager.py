@@ -1,15 +1,115 @@
 import os.path
 import datetime
-import json
-import time
-import requests
 import base64
-from typing import List, Optional
+import hashlib
+import itertools
+import httplib2
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional, Tuple
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
+from google_auth_httplib2 import AuthorizedHttp
 from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
+from src.cassette import RECORD, REPLAY, Cassette, CassetteHttp
+from src.credential_store import atomic_write
+from src.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+from src.event_cache import CalendarCache, EventCache
+from src.device_flow import DeviceFlowScheduler, load_client_config, request_device_code
+from src.google_quota import CALENDAR_WRITES_PER_MINUTE, QuotaExecutor
+from src.http_transport import SharedTransport
+from src.metrics import DEFAULT_METRICS, MetricsRegistry, instrumented
+from src.models import BusyBlock, CalendarEvent, Email, render_events
+
+# How far back the first full sync of an event cache reaches
+EVENT_CACHE_LOOKBACK = datetime.timedelta(days=7)
+
+# Occurrences tried for a planned event whose ID is held by a live event outside the window
+MAX_EVENT_ID_OCCURRENCES = 20
+
+# freebusy().query accepts at most this many calendars per request
+FREEBUSY_MAX_CALENDARS = 50
+
+# Bounds for each Gmail search when filtering by sender, to stay under query length limits
+GMAIL_MAX_SENDERS_PER_QUERY = 40
+GMAIL_MAX_QUERY_LENGTH = 1500
+# messages().list page size (the API maximum)
+GMAIL_PAGE_SIZE = 500
+
+SCOPES = {
+    "calendar": "https://www.googleapis.com/auth/calendar",
+    "gmail": "https://www.googleapis.com/auth/gmail.readonly",
+}
+
+
+def _parse_time(value: str) -> datetime.datetime:
+    # fromisoformat() only understands a trailing "Z" from Python 3.11 onwards
+    return datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def event_id_for(owner: str, day: datetime.date, summary: str, occurrence: int = 0) -> str:
+    """
+    A deterministic event ID for a planned task, so that the same task planned for the same
+    user and day always maps to the same event. Hex digits are valid (base32hex) event IDs.
+    """
+    task = " ".join(summary.lower().split())
+    key = "\n".join([owner, day.isoformat(), task, str(occurrence)])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+
+def _event_differs(current: dict, planned: dict) -> bool:
+    """Whether an existing event needs patching to match a planned one."""
+    if current.get("status") == "cancelled":
+        return True
+    if (current.get("summary") or "") != (planned.get("summary") or ""):
+        return True
+    if (current.get("description") or "") != (planned.get("description") or ""):
+        return True
+    for field in ("start", "end"):
+        current_time = current.get(field, {}).get("dateTime")
+        if not current_time or _parse_time(current_time) != _parse_time(planned[field]["dateTime"]):
+            return True
+    return False
+
+
+def build_gmail_queries(base_query: str, senders: Optional[List[str]] = None) -> List[str]:
+    """
+    Builds the Gmail searches for `base_query`, restricted to `senders` with one
+    `from:(a OR b ...)` clause per bounded chunk of addresses.
+    """
+    if senders is None:
+        return [base_query]
+
+    queries = []
+    chunk = []
+    for sender in sorted({sender.strip().lower() for sender in senders if sender}):
+        candidate = chunk + [sender]
+        query = f"{base_query} from:({' OR '.join(candidate)})"
+        if chunk and (
+            len(candidate) > GMAIL_MAX_SENDERS_PER_QUERY or len(query) > GMAIL_MAX_QUERY_LENGTH
+        ):
+            queries.append(f"{base_query} from:({' OR '.join(chunk)})")
+            chunk = [sender]
+        else:
+            chunk = candidate
+    if chunk:
+        queries.append(f"{base_query} from:({' OR '.join(chunk)})")
+    return queries
+
+
+def merge_busy_blocks(intervals) -> List[BusyBlock]:
+    """Merges overlapping or touching (start, end) datetime intervals into busy blocks."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [
+        BusyBlock(start=start.astimezone().isoformat(), end=end.astimezone().isoformat())
+        for start, end in merged
+    ]
 
 
 class GoogleServiceManager:
@@ -20,6 +120,13 @@ class GoogleServiceManager:
         services: Optional[List[str]] = None,
         auth_flow: str = "device",
         interactive: bool = True,
+        credentials: Optional[Credentials] = None,
+        deadline: Optional[Deadline] = None,
+        cassette: Optional[Cassette] = None,
+        transport: Optional[SharedTransport] = None,
+        writes_per_minute: Optional[int] = CALENDAR_WRITES_PER_MINUTE,
+        event_cache: Optional[EventCache] = None,
+        metrics: Optional[MetricsRegistry] = None,
     ):
         """
         Initializes the GoogleServiceManager.
@@ -34,35 +141,82 @@ class GoogleServiceManager:
             interactive (bool): If True, will attempt to authenticate interactively (browser or device code)
                                 if the token is missing or invalid. If False, it will raise an error.
                                 Defaults to True.
+            credentials (Credentials, optional): Pre-loaded credentials (e.g. from a CredentialStore).
+                                                 If given, the token file is not read again.
+            deadline (Deadline, optional): Bounds device-flow polling and calendar/mail reads.
+                                           Work past the deadline raises DeadlineExceeded.
+            cassette (Cassette, optional): Records or replays the Calendar/Gmail traffic. When
+                                           replaying, no credentials are needed.
+            transport (SharedTransport, optional): Pooled keep-alive connections shared with
+                                                   other users. Defaults to per-client connections.
+            writes_per_minute (int, optional): Calendar writes allowed per minute before writes
+                                               are paced. None disables pacing.
+            event_cache (EventCache, optional): Answers event reads from a local copy of each
+                                                calendar, kept current with incremental sync.
+                                                Defaults to listing events on every read.
+            metrics (MetricsRegistry, optional): Where API calls and method latencies are
+                                                 recorded. Defaults to the process-wide registry.
         """
-        self.creds = None
+        self.creds = credentials
         self.client_secret_file = client_secret_file
         self.token_file = token_file
         self.services_config = services or ["calendar"]
         self.auth_flow = auth_flow
         self.interactive = interactive
+        self.deadline = deadline or NO_DEADLINE
+        self.cassette = cassette
+        self.transport = transport
+        # OAuth requests (device flow, refreshes) go through the shared session if there is one
+        self._oauth_session = transport.session if transport else None
+        self.metrics = metrics or DEFAULT_METRICS
+        # Every Calendar/Gmail request goes through this, for retries and quota accounting
+        self.executor = QuotaExecutor(
+            self.deadline,
+            writes_per_minute=writes_per_minute,
+            replaying=cassette is not None and cassette.mode == REPLAY,
+            metrics=self.metrics,
+        )
+        self.event_cache = event_cache
         self.services = {}  # Stores initialized service objects (e.g., 'calendar', 'gmail')
         self.bot_calendar_id = None
+        self.created_event_ids: List[str] = []  # IDs of events inserted by add_event
+        # (first day, last day) that add_event may schedule into; None means unrestricted
+        self.planning_window: Optional[Tuple[datetime.date, datetime.date]] = None
+        # Earliest time add_event may schedule at (used when replanning the rest of a day)
+        self.planning_not_before: Optional[datetime.datetime] = None
+        # Events collected by add_event in planning mode, by deterministic event ID
+        self.planned_events: Optional[Dict[str, dict]] = None
+        self.plan_owner: Optional[str] = None
+        # Write-through planning (see start_plan): the writer thread and the writes it was given
+        self._plan_writer: Optional[ThreadPoolExecutor] = None
+        self._plan_pending = []  # Futures of the writes not yet waited for
+        self._plan_errors: List[BaseException] = []
+        self._plan_existing: Dict[str, dict] = {}  # Bot events in the window not yet planned again
+        self._plan_written: Dict[str, dict] = {}  # Planned events already written, by ID
+        # What each event written through looked like before (None if it was inserted)
+        self._plan_previous: Dict[str, Optional[dict]] = {}
+        self._plan_counts: Dict[str, int] = {}
 
         # Define scopes based on requested services
-        self.scopes = []
-        if "calendar" in self.services_config:
-            self.scopes.append("https://www.googleapis.com/auth/calendar")
-        if "gmail" in self.services_config:
-            self.scopes.append("https://www.googleapis.com/auth/gmail.readonly")
+        self.scopes = [SCOPES[name] for name in ("calendar", "gmail") if name in self.services_config]
 
         self.authenticate()
 
     def authenticate(self):
         """Authenticates the user and creates the requested services."""
-        if os.path.exists(self.token_file):
+        if self.cassette is not None and self.cassette.mode == REPLAY:
+            # Replayed responses need no credentials
+            self._build_services()
+            return
+
+        if self.creds is None and os.path.exists(self.token_file):
             self.creds = Credentials.from_authorized_user_file(self.token_file, self.scopes)
 
         # If there are no (valid) credentials available, let the user log in.
         if not self.creds or not self.creds.valid:
             if self.creds and self.creds.expired and self.creds.refresh_token:
                 try:
-                    self.creds.refresh(Request())
+                    self.creds.refresh(Request(self._oauth_session))
                 except Exception as e:
                     print(f"Error refreshing token: {e}. Re-authenticating...")
                     self.creds = None # Force re-auth
@@ -96,19 +250,30 @@ class GoogleServiceManager:
                         return
 
             # Save the credentials for the next run
-            # Ensure the directory exists
-            os.makedirs(os.path.dirname(self.token_file), exist_ok=True)
-            with open(self.token_file, "w") as token:
-                token.write(self.creds.to_json())
-
-        # Build services
+            atomic_write(self.token_file, self.creds.to_json())
+
+        self._build_services()
+
+    def _build_kwargs(self) -> dict:
+        """How the API clients send requests: directly, or through the cassette."""
+        pooled_http = self.transport.http if self.transport else None
+        if self.cassette is None:
+            if pooled_http is None:
+                return {"credentials": self.creds}
+            return {"http": AuthorizedHttp(self.creds, http=pooled_http)}
+        http = None
+        if self.cassette.mode == RECORD:
+            http = AuthorizedHttp(self.creds, http=pooled_http or httplib2.Http())
+        return {"http": CassetteHttp(self.cassette, http)}
+
+    def _build_services(self):
         try:
             if "calendar" in self.services_config:
-                self.services["calendar"] = build("calendar", "v3", credentials=self.creds)
+                self.services["calendar"] = build("calendar", "v3", **self._build_kwargs())
                 self.bot_calendar_id = self._get_or_create_secretary_calendar()
 
             if "gmail" in self.services_config:
-                self.services["gmail"] = build("gmail", "v1", credentials=self.creds)
+                self.services["gmail"] = build("gmail", "v1", **self._build_kwargs())
 
         except HttpError as error:
             print(f"An error occurred initializing services: {error}")
@@ -117,89 +282,26 @@ class GoogleServiceManager:
         """
         Authenticates the user using the OAuth 2.0 Device Authorization Flow.
         """
-        # Load client secrets
-        with open(self.client_secret_file, "r") as f:
-            data = json.load(f)
-
-        # Determine if 'installed' or 'web'
-        if "installed" in data:
-            config = data["installed"]
-        elif "web" in data:
-            config = data["web"]
-        else:
-            raise ValueError("Client secret file has unknown format.")
-
-        client_id = config["client_id"]
-        client_secret = config["client_secret"]
-        token_uri = config.get("token_uri", "https://oauth2.googleapis.com/token")
+        client = load_client_config(self.client_secret_file)
 
         # 1. Request device code
-        device_code_url = "https://oauth2.googleapis.com/device/code"
-        response = requests.post(
-            device_code_url,
-            data={"client_id": client_id, "scope": " ".join(scopes)},
+        authorization = request_device_code(
+            client, scopes, name=self.token_file, session=self._oauth_session,
+            timeout=self.deadline.timeout(30),
         )
 
-        if response.status_code != 200:
-            print(f"\nError requesting device code (Status {response.status_code}):")
-            print(response.text)
-            if response.status_code == 400:
-                print(
-                    "\nHint: A 400 error often means the Client ID is incorrect for the Device Flow."
-                )
-                print(
-                    "Please ensure your Client ID in client_secret.json matches a 'TVs and Limited Input devices' credential in Google Cloud Console."
-                )
-                print(
-                    "Also verify that the requested scopes are enabled in the project."
-                )
-
-        response.raise_for_status()
-        data = response.json()
+        print(f"\nTo authorize this application, visit this URL:\n{authorization.verification_url}")
+        print(f"\nAnd enter the code:\n{authorization.user_code}\n")
 
-        device_code = data["device_code"]
-        user_code = data["user_code"]
-        verification_url = data["verification_url"]
-        interval = data.get("interval", 5)
-
-        print(f"\nTo authorize this application, visit this URL:\n{verification_url}")
-        print(f"\nAnd enter the code:\n{user_code}\n")
-
-        # 2. Poll for token
-        while True:
-            time.sleep(interval)
-            resp = requests.post(
-                token_uri,
-                data={
-                    "client_id": client_id,
-                    "client_secret": client_secret,
-                    "device_code": device_code,
-                    "grant_type": "urn:ietf:params:oauth:grant-type:device_code",
-                },
+        # 2. Poll for token, until the code expires or the deadline is reached
+        scheduler = DeviceFlowScheduler(client, self._oauth_session, self.deadline)
+        scheduler.add(authorization)
+        authorized = scheduler.run()
+        if authorization.name not in authorized:
+            raise Exception(
+                f"{scheduler.failures[authorization.name]} Please restart the authentication."
             )
-
-            if resp.status_code == 200:
-                token_data = resp.json()
-                return Credentials(
-                    token=token_data["access_token"],
-                    refresh_token=token_data.get("refresh_token"),
-                    token_uri=token_uri,
-                    client_id=client_id,
-                    client_secret=client_secret,
-                    scopes=scopes,
-                )
-
-            error = resp.json().get("error")
-            if error == "authorization_pending":
-                continue
-            elif error == "slow_down":
-                interval += 5
-            elif error == "expired_token":
-                raise Exception(
-                    "Device code expired. Please restart the authentication."
-                )
-            else:
-                raise Exception(f"Failed to get token: {error}")
+        return authorized[authorization.name]
 
     def authenticate_installed_app_flow(self, scopes):
         """
@@ -212,6 +314,10 @@ class GoogleServiceManager:
 
     # --- Calendar Methods ---
 
+    def _execute(self, request, write: bool = False):
+        """Executes an API request, retrying transient failures (see QuotaExecutor.execute)."""
+        return self.executor.execute(request, write=write)
+
     def _get_or_create_secretary_calendar(self):
         """Finds the 'secretary_bot' calendar or creates it if it doesn't exist."""
         service = self.services.get("calendar")
@@ -223,9 +329,7 @@ class GoogleServiceManager:
         # List all calendars the user has access to
         page_token = None
         while True:
-            calendar_list = (
-                service.calendarList().list(pageToken=page_token).execute()
-            )
+            calendar_list = self._execute(service.calendarList().list(pageToken=page_token))
             for calendar_list_entry in calendar_list["items"]:
                 if calendar_list_entry["summary"] == calendar_name:
                     return calendar_list_entry["id"]
@@ -236,7 +340,7 @@ class GoogleServiceManager:
         # If not found, create it
         try:
             # Attempt to get primary calendar timezone
-            primary_cal = service.calendars().get(calendarId="primary").execute()
+            primary_cal = self._execute(service.calendars().get(calendarId="primary"))
             time_zone = primary_cal.get("timeZone", "UTC")
         except HttpError:
             time_zone = "UTC"
@@ -246,9 +350,113 @@ class GoogleServiceManager:
             "timeZone": time_zone,
         }
 
-        created_calendar = service.calendars().insert(body=new_calendar).execute()
+        created_calendar = self._execute(service.calendars().insert(body=new_calendar), write=True)
         return created_calendar["id"]
 
+    def start_plan(
+        self,
+        owner: str,
+        write_through: Optional[Tuple[datetime.datetime, datetime.datetime]] = None,
+    ):
+        """
+        Switches add_event to planning mode: events are collected under deterministic IDs
+        derived from `owner`, the day and the task, and nothing is written until `reconcile_plan`.
+
+        With `write_through`, the (start, end) window later given to `reconcile_plan`, the bot
+        events in the window are listed now and each planned event is written on a background
+        thread as soon as add_event collects it, overlapping the writes with the rest of the
+        planning. `reconcile_plan` then only waits for them and deletes the unplanned events;
+        `discard_plan` rolls them back.
+        """
+        self.discard_plan()
+        self.plan_owner = owner
+        self.planned_events = {}
+        if write_through is None or not self.services.get("calendar") or not self.bot_calendar_id:
+            return
+        start, end = write_through
+        self._plan_existing = {
+            event["id"]: event for event in self._list_bot_events(start, end, show_deleted=True)
+        }
+        self._plan_counts = dict.fromkeys(("inserted", "patched", "deleted", "unchanged"), 0)
+        # One thread keeps the writes in order and the service object single-threaded
+        self._plan_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="calendar-writes")
+
+    def restart_plan(self):
+        """
+        Empties the plan, e.g. after a Gemini attempt that failed part way, so that the next
+        attempt starts afresh. Events it already wrote through count as existing events again:
+        `reconcile_plan` keeps those that are planned again and deletes the rest.
+        """
+        if self.planned_events is None:
+            return
+        self.planned_events = {}
+        if self._plan_writer is not None:
+            self._wait_for_writes()
+            self._plan_existing.update(self._plan_written)
+            self._plan_written.clear()
+
+    def discard_plan(self) -> bool:
+        """
+        Leaves planning mode without writing anything more. Events already written through
+        (see `start_plan`) are rolled back: inserted events are deleted and patched ones restored.
+
+        Returns:
+            bool: False if the rollback failed, leaving the calendar partly written.
+        """
+        self.planned_events = None
+        if self._plan_writer is None:
+            return True
+        self._wait_for_writes()
+        self._plan_writer.shutdown()
+        self._plan_writer = None
+        for error in self._plan_errors:
+            print(f"A calendar write failed and the plan was not finished: {error}")
+        self._plan_errors = []
+        previous, self._plan_previous = self._plan_previous, {}
+        self._plan_existing, self._plan_written = {}, {}
+        return self._roll_back(previous)
+
+    def _roll_back(self, previous: Dict[str, Optional[dict]]) -> bool:
+        if not previous:
+            return True
+        events = self.services["calendar"].events()
+        try:
+            for event_id, before in previous.items():
+                if before is None or before.get("status") == "cancelled":
+                    self._execute(
+                        events.delete(calendarId=self.bot_calendar_id, eventId=event_id),
+                        write=True,
+                    )
+                    if event_id in self.created_event_ids:
+                        self.created_event_ids.remove(event_id)
+                else:
+                    self._execute(
+                        events.update(
+                            calendarId=self.bot_calendar_id, eventId=event_id, body=before
+                        ),
+                        write=True,
+                    )
+        except (HttpError, DeadlineExceeded) as error:
+            print(f"Could not roll back the events written for an unfinished plan: {error}")
+            return False
+        print(f"Rolled back {len(previous)} event(s) written for an unfinished plan.")
+        return True
+
+    def _wait_for_writes(self):
+        pending, self._plan_pending = self._plan_pending, []
+        for future in pending:
+            error = future.exception()
+            if error is not None:
+                self._plan_errors.append(error)
+
+    def _write_through(self, event_id: str, event: dict):
+        current = self._plan_existing.pop(event_id, None)
+        if self._write_planned(event_id, event, current, self._plan_counts) != "unchanged":
+            # The first version seen is the one from before this plan (under the ID written)
+            self._plan_previous.setdefault(event["id"], current)
+        self._plan_written[event_id] = event
+
+    @instrumented
     def add_event(
         self, summary: str, start_time: str, end_time: str, description: str = None
     ) -> str:
@@ -264,6 +472,7 @@ class GoogleServiceManager:
         Returns:
             str: The link to the created event or error message.
         """
+        self.deadline.check("creating an event")
         service = self.services.get("calendar")
         if not service:
             return "Calendar service not initialized."
@@ -279,34 +488,75 @@ class GoogleServiceManager:
             except ValueError:
                 return time_str
 
+        start_time = ensure_timezone(start_time)
+        end_time = ensure_timezone(end_time)
+
+        if self.planning_window:
+            first_day, last_day = self.planning_window
+            try:
+                start_day = datetime.datetime.fromisoformat(start_time).date()
+            except ValueError:
+                return f"Invalid start_time '{start_time}'. Use ISO format (e.g. '2023-10-27T09:00:00')."
+            if not first_day <= start_day <= last_day:
+                return (
+                    f"Event not created: {start_day} is outside the planning window "
+                    f"({first_day} to {last_day})."
+                )
+
+        if self.planning_not_before:
+            start_dt = datetime.datetime.fromisoformat(start_time)
+            if start_dt < self.planning_not_before:
+                return (
+                    f"Event not created: {start_time} is before "
+                    f"{self.planning_not_before.isoformat()}, the start of the replanning window."
+                )
+
         event = {
             "summary": summary,
             "description": description,
             "start": {
-                "dateTime": ensure_timezone(start_time),
+                "dateTime": start_time,
             },
             "end": {
-                "dateTime": ensure_timezone(end_time),
+                "dateTime": end_time,
             },
         }
 
+        if self.planned_events is not None:
+            try:
+                day = datetime.datetime.fromisoformat(start_time).date()
+            except ValueError:
+                return f"Invalid start_time '{start_time}'. Use ISO format (e.g. '2023-10-27T09:00:00')."
+            # The same task can be planned more than once a day (e.g. two focus blocks)
+            occurrence = 0
+            event_id = event_id_for(self.plan_owner, day, summary)
+            while event_id in self.planned_events:
+                occurrence += 1
+                event_id = event_id_for(self.plan_owner, day, summary, occurrence)
+            self.planned_events[event_id] = {"id": event_id, **event}
+            if self._plan_writer is not None:
+                self._plan_pending.append(self._plan_writer.submit(
+                    self._write_through, event_id, self.planned_events[event_id]
+                ))
+            return f"Event planned: {summary} from {start_time} to {end_time}."
+
         try:
-            event = (
-                service.events()
-                .insert(calendarId=calendar_id, body=event)
-                .execute()
+            event = self._execute(
+                service.events().insert(calendarId=calendar_id, body=event), write=True
             )
+            self.created_event_ids.append(event.get("id"))
             return f"Event created: {event.get('htmlLink')}"
         except HttpError as error:
             return f"An error occurred: {error}"
 
+    @instrumented
     def get_upcoming_events(self, max_results=10):
         """Gets the upcoming events."""
         service = self.services.get("calendar")
         if not service:
             return "Calendar service not initialized."
 
-        now = datetime.datetime.utcnow().isoformat() + "Z"  # 'Z' indicates UTC time
+        now = datetime.datetime.now(datetime.timezone.utc)
         all_events = []
         calendars_to_check = ["primary"]
         if self.bot_calendar_id and self.bot_calendar_id != "primary":
@@ -314,36 +564,33 @@ class GoogleServiceManager:
 
         try:
             for cal_id in calendars_to_check:
-                events_result = (
-                    service.events()
-                    .list(
-                        calendarId=cal_id,
-                        timeMin=now,
-                        maxResults=max_results,
-                        singleEvents=True,
-                        orderBy="startTime",
-                    )
-                    .execute()
-                )
-                all_events.extend(events_result.get("items", []))
+                if self.event_cache is not None:
+                    items = self._sync_calendar(cal_id).between(now)[:max_results]
+                else:
+                    items = self._execute(
+                        service.events().list(
+                            calendarId=cal_id,
+                            timeMin=now.isoformat(),
+                            maxResults=max_results,
+                            singleEvents=True,
+                            orderBy="startTime",
+                        )
+                    ).get("items", [])
+                all_events.extend(CalendarEvent.from_api(event, cal_id) for event in items)
 
             if not all_events:
                 return "No upcoming events found."
 
             # Sort combined events by start time
-            all_events.sort(
-                key=lambda x: x["start"].get("dateTime", x["start"].get("date"))
-            )
+            all_events.sort(key=lambda event: event.start)
             # Limit to max_results? Or maybe just show all gathered?
             # The original method was limiting results per request.
             # Here we might get max_results * 2. Let's slice it.
             all_events = all_events[:max_results]
 
-            result_str = "Upcoming events:\n"
-            for event in all_events:
-                start = event["start"].get("dateTime", event["start"].get("date"))
-                result_str += f"{start} - {event['summary']}\n"
-            return result_str
+            return "Upcoming events:\n" + "".join(
+                f"{event.start} - {event.summary}\n" for event in all_events
+            )
 
         except HttpError as error:
             return f"An error occurred: {error}"
@@ -358,6 +605,30 @@ class GoogleServiceManager:
         Returns:
             str: A status message indicating how many events were deleted.
         """
+        # Create start and end time for the given date in the local system's timezone
+        start_of_day = datetime.datetime.combine(date, datetime.time.min).astimezone()
+        end_of_day = datetime.datetime.combine(date, datetime.time.max).astimezone()
+        return self.clear_events_in_window(start_of_day, end_of_day, label=str(date))
+
+    @instrumented
+    def clear_events_in_window(
+        self,
+        start: datetime.datetime,
+        end: datetime.datetime,
+        label: Optional[str] = None,
+    ) -> str:
+        """
+        Clears the secretary_bot events that start within a time window.
+
+        Args:
+            start (datetime.datetime): Start of the window (timezone-aware).
+            end (datetime.datetime): End of the window (timezone-aware).
+            label (str, optional): How to describe the window in status messages.
+
+        Returns:
+            str: A status message indicating how many events were deleted.
+        """
+        self.deadline.check("clearing events")
         service = self.services.get("calendar")
         if not service:
             return "Calendar service not initialized."
@@ -365,124 +636,515 @@ class GoogleServiceManager:
         if not self.bot_calendar_id:
             return "No secretary_bot calendar found."
 
-        # Create start and end time for the given date in the local system's timezone
-        start_of_day = (
-            datetime.datetime.combine(date, datetime.time.min).astimezone().isoformat()
-        )
-        end_of_day = (
-            datetime.datetime.combine(date, datetime.time.max).astimezone().isoformat()
-        )
+        label = label or f"{start.isoformat()} to {end.isoformat()}"
 
         try:
-            events_result = (
-                service.events()
-                .list(
-                    calendarId=self.bot_calendar_id,
-                    timeMin=start_of_day,
-                    timeMax=end_of_day,
-                    singleEvents=True,
-                    orderBy="startTime",
-                )
-                .execute()
-            )
-            events = events_result.get("items", [])
+            events = self._list_bot_events(start, end)
 
             if not events:
-                return f"No events found to clear on {date}."
+                return f"No events found to clear on {label}."
 
             count = 0
             for event in events:
-                service.events().delete(
-                    calendarId=self.bot_calendar_id, eventId=event["id"]
-                ).execute()
+                self._execute(
+                    service.events().delete(calendarId=self.bot_calendar_id, eventId=event["id"]),
+                    write=True,
+                )
                 count += 1
 
-            return f"Successfully cleared {count} events from secretary_bot calendar for {date}."
+            return f"Successfully cleared {count} events from secretary_bot calendar for {label}."
 
         except HttpError as error:
             return f"An error occurred while clearing events: {error}"
 
-    def get_events_for_day(self, date: datetime.date) -> str:
+    def _list_bot_events(
+        self, start: datetime.datetime, end: datetime.datetime, show_deleted: bool = False
+    ) -> List[dict]:
+        """Lists the secretary_bot events that start within a window (raw API items)."""
+        service = self.services["calendar"]
+        events = []
+        page_token = None
+        while True:
+            events_result = self._execute(
+                service.events().list(
+                    calendarId=self.bot_calendar_id,
+                    timeMin=start.isoformat(),
+                    timeMax=end.isoformat(),
+                    singleEvents=True,
+                    showDeleted=show_deleted,
+                    maxResults=2500,
+                    pageToken=page_token,
+                )
+            )
+            # timeMin also matches events that started earlier but are still running
+            events.extend(
+                event for event in events_result.get("items", [])
+                if "dateTime" not in event.get("start", {})
+                or _parse_time(event["start"]["dateTime"]) >= start
+            )
+            page_token = events_result.get("nextPageToken")
+            if not page_token:
+                return events
+
+    def exclude_replanned_events(
+        self, events: List[CalendarEvent], start: datetime.datetime
+    ) -> List[CalendarEvent]:
         """
-        Gets events for a specific day.
+        Drops the secretary_bot events that start at or after `start`. They are about to be
+        replanned (and reconciled), so Gemini should not plan around them.
+        """
+        return [
+            event for event in events
+            if event.calendar_id != self.bot_calendar_id
+            or "T" not in event.start
+            or _parse_time(event.start) < start
+        ]
+
+    @instrumented
+    def reconcile_plan(self, start: datetime.datetime, end: datetime.datetime) -> Dict[str, int]:
+        """
+        Brings the secretary_bot events that start within a window in line with the events
+        collected since `start_plan`, sending only the inserts, patches and deletes that are
+        needed, then leaves planning mode.
 
         Args:
-            date (datetime.date): The date to fetch events for.
+            start (datetime.datetime): Start of the planned window (timezone-aware).
+            end (datetime.datetime): End of the planned window (timezone-aware).
 
         Returns:
-            str: A string representation of the events.
+            Dict[str, int]: How many events were inserted, patched, deleted and left unchanged.
+
+        Raises:
+            HttpError: If a Calendar API request fails.
+        """
+        planned, self.planned_events = self.planned_events or {}, None
+        counts = dict.fromkeys(("inserted", "patched", "deleted", "unchanged"), 0)
+        if self._plan_writer is not None:
+            # Planned events were written as they arrived; only the deletes are left
+            self._wait_for_writes()
+            if self._plan_errors:
+                # A half-written plan is rolled back, like any plan that could not be finished
+                error = self._plan_errors[0]
+                self.discard_plan()
+                raise error
+            counts = self._plan_counts
+            existing, written = self._plan_existing, self._plan_written
+            # The writes stand: leave planning mode without rolling them back
+            self._plan_previous = {}
+            self.discard_plan()
+            planned = {
+                event_id: event for event_id, event in planned.items() if event_id not in written
+            }
+            self.deadline.check("updating the calendar")
+            service = self.services["calendar"]
+        else:
+            self.deadline.check("updating the calendar")
+            service = self.services.get("calendar")
+            if not service or not self.bot_calendar_id:
+                print("Calendar service not initialized; the plan was not written.")
+                return counts
+
+            # Deleted events keep their ID, so they are listed too and restored if planned again
+            existing = {
+                event["id"]: event
+                for event in self._list_bot_events(start, end, show_deleted=True)
+            }
+
+        for event_id, event in planned.items():
+            self._write_planned(event_id, event, existing.pop(event_id, None), counts)
+
+        events = service.events()
+        for event_id, current in existing.items():
+            if current.get("status") == "cancelled":
+                continue
+            self._execute(
+                events.delete(calendarId=self.bot_calendar_id, eventId=event_id), write=True
+            )
+            counts["deleted"] += 1
+
+        return counts
+
+    def _write_planned(
+        self, event_id: str, event: dict, current: Optional[dict], counts: Dict[str, int]
+    ) -> str:
+        """
+        Inserts, patches or leaves alone one planned event, given its current version.
+        An inserted event may get a fresh ID (see `_insert_planned`), stored in event["id"].
+
+        Returns:
+            str: What was done: "inserted", "patched" or "unchanged" (also counted in `counts`).
+        """
+        events = self.services["calendar"].events()
+        if current is None:
+            self._insert_planned(event_id, event)
+            self.created_event_ids.append(event["id"])
+            outcome = "inserted"
+        elif _event_differs(current, event):
+            self._execute(
+                events.patch(
+                    calendarId=self.bot_calendar_id, eventId=event_id,
+                    body={**event, "status": "confirmed"},
+                ),
+                write=True,
+            )
+            outcome = "patched"
+        else:
+            outcome = "unchanged"
+        counts[outcome] += 1
+        return outcome
+
+    def _insert_planned(self, event_id: str, event: dict):
+        """
+        Inserts a planned event under `event_id`. If an event outside the window already holds
+        the ID, a deleted one is restored in its place; a live one (e.g. the same task earlier
+        today, before a replan window) is left alone and the planned event is inserted under
+        the next free occurrence of its ID, which is stored in event["id"].
+        """
+        events = self.services["calendar"].events()
+        day = _parse_time(event["start"]["dateTime"]).date()
+        tried = {event_id}
+        occurrence = 0
+        while True:
+            try:
+                self._execute(
+                    events.insert(calendarId=self.bot_calendar_id, body={**event, "id": event_id}),
+                    write=True,
+                )
+                break
+            except HttpError as error:
+                if error.resp.status != 409 or occurrence >= MAX_EVENT_ID_OCCURRENCES:
+                    raise
+            taken = self._execute(events.get(calendarId=self.bot_calendar_id, eventId=event_id))
+            if taken.get("status") == "cancelled":
+                self._execute(
+                    events.update(
+                        calendarId=self.bot_calendar_id, eventId=event_id,
+                        body={**event, "id": event_id, "status": "confirmed"},
+                    ),
+                    write=True,
+                )
+                break
+            while event_id in tried:
+                occurrence += 1
+                event_id = event_id_for(self.plan_owner, day, event["summary"], occurrence)
+            tried.add(event_id)
+        event["id"] = event_id
+
+    # --- Push Notifications ---
+
+    def watch_events(
+        self,
+        address: str,
+        channel_id: str,
+        token: Optional[str] = None,
+        calendar_id: str = "primary",
+        ttl_seconds: Optional[int] = None,
+    ) -> dict:
+        """
+        Subscribes a web_hook channel to changes on a calendar.
+
+        Args:
+            address (str): The HTTPS URL notifications are POSTed to.
+            channel_id (str): A unique ID for the channel.
+            token (str, optional): Echoed back in X-Goog-Channel-Token, to verify notifications.
+            calendar_id (str): The calendar to watch. Defaults to "primary".
+            ttl_seconds (int, optional): Requested channel lifetime.
+
+        Returns:
+            dict: The channel resource, including resourceId and expiration.
+        """
+        body = {"id": channel_id, "type": "web_hook", "address": address}
+        if token:
+            body["token"] = token
+        if ttl_seconds:
+            body["params"] = {"ttl": str(ttl_seconds)}
+        return self._execute(
+            self.services["calendar"].events().watch(calendarId=calendar_id, body=body)
+        )
+
+    def stop_channel(self, channel_id: str, resource_id: str):
+        """Stops a Calendar push notification channel."""
+        self._execute(
+            self.services["calendar"].channels().stop(
+                body={"id": channel_id, "resourceId": resource_id}
+            )
+        )
+
+    def _get_label_id(self, label_name: str) -> Optional[str]:
+        labels = self._execute(self.services["gmail"].users().labels().list(userId="me"))
+        for label in labels.get("labels", []):
+            if label.get("name") == label_name:
+                return label.get("id")
+        return None
+
+    def watch_gmail(self, topic_name: str, label_name: str = "TODOBOT") -> dict:
+        """
+        Subscribes the mailbox to Gmail push notifications for a label, delivered
+        through a Cloud Pub/Sub topic.
+
+        Args:
+            topic_name (str): The Pub/Sub topic, e.g. "projects/my-project/topics/todobot".
+            label_name (str): Only changes to messages with this label are notified.
+
+        Returns:
+            dict: The watch response, including historyId and expiration.
+        """
+        body = {"topicName": topic_name}
+        label_id = self._get_label_id(label_name)
+        if label_id:
+            body["labelIds"] = [label_id]
+            body["labelFilterBehavior"] = "include"
+        return self._execute(self.services["gmail"].users().watch(userId="me", body=body))
+
+    def _sync_calendar(self, calendar_id: str) -> CalendarCache:
+        """
+        Brings a calendar's cache up to date and returns it. With a sync token only the
+        changes since the last sync are downloaded; without one (or once Google expires it
+        with 410 Gone), the calendar is synced in full from EVENT_CACHE_LOOKBACK ago.
+
+        Raises:
+            HttpError: If the Calendar API request fails.
+        """
+        cache = self.event_cache.calendar(calendar_id)
+        events = self.services["calendar"].events()
+        while True:
+            params = {"calendarId": calendar_id, "singleEvents": True, "maxResults": 2500}
+            horizon = None
+            if cache.sync_token:
+                params["syncToken"] = cache.sync_token
+            else:
+                horizon = datetime.datetime.now().astimezone() - EVENT_CACHE_LOOKBACK
+                params["timeMin"] = horizon.isoformat()
+
+            items = []
+            page_token = None
+            try:
+                while True:
+                    self.deadline.check("syncing events")
+                    result = self._execute(events.list(pageToken=page_token, **params))
+                    items.extend(result.get("items", []))
+                    page_token = result.get("nextPageToken")
+                    if not page_token:
+                        break
+            except HttpError as error:
+                if error.resp.status == 410 and cache.sync_token:
+                    print(f"The sync token for calendar {calendar_id} expired; syncing it in full.")
+                    cache.reset()
+                    continue
+                raise
+
+            if horizon is not None:
+                cache.reset(horizon.timestamp())
+            cache.apply(items)
+            cache.sync_token = result.get("nextSyncToken")
+            self.event_cache.save()
+            return cache
+
+    @instrumented
+    def fetch_events_for_range(
+        self, start_date: datetime.date, end_date: datetime.date
+    ) -> List[CalendarEvent]:
+        """
+        Fetches events from the primary and secretary_bot calendars for a range of days,
+        using one paginated events().list per calendar for the whole range.
+
+        Args:
+            start_date (datetime.date): The first day to fetch events for.
+            end_date (datetime.date): The last day (inclusive) to fetch events for.
+
+        Returns:
+            List[CalendarEvent]: The events, sorted by start time.
+
+        Raises:
+            HttpError: If the Calendar API request fails.
         """
         service = self.services.get("calendar")
         if not service:
-            return "Calendar service not initialized."
+            return []
 
-        # Create start and end time for the given date in the local system's timezone
+        # Create start and end time for the range in the local system's timezone
         # astimezone() on a naive datetime assumes local time and adds the offset
-        start_of_day = (
-            datetime.datetime.combine(date, datetime.time.min).astimezone().isoformat()
-        )
-        end_of_day = (
-            datetime.datetime.combine(date, datetime.time.max).astimezone().isoformat()
-        )
+        range_start_dt = datetime.datetime.combine(start_date, datetime.time.min).astimezone()
+        range_end_dt = datetime.datetime.combine(end_date, datetime.time.max).astimezone()
+        range_start = range_start_dt.isoformat()
+        range_end = range_end_dt.isoformat()
 
         all_events = []
         calendars_to_check = ["primary"]
         if self.bot_calendar_id and self.bot_calendar_id != "primary":
             calendars_to_check.append(self.bot_calendar_id)
 
-        try:
-            for cal_id in calendars_to_check:
-                events_result = (
-                    service.events()
-                    .list(
+        for cal_id in calendars_to_check:
+            cache = self._sync_calendar(cal_id) if self.event_cache is not None else None
+            if cache is not None and cache.covers(range_start_dt):
+                all_events.extend(
+                    CalendarEvent.from_api(event, cal_id)
+                    for event in cache.between(range_start_dt, range_end_dt)
+                )
+                continue
+
+            page_token = None
+            while True:
+                self.deadline.check("fetching events")
+                events_result = self._execute(
+                    service.events().list(
                         calendarId=cal_id,
-                        timeMin=start_of_day,
-                        timeMax=end_of_day,
+                        timeMin=range_start,
+                        timeMax=range_end,
                         singleEvents=True,
                         orderBy="startTime",
+                        maxResults=2500,
+                        pageToken=page_token,
                     )
-                    .execute()
                 )
-                all_events.extend(events_result.get("items", []))
+                all_events.extend(
+                    CalendarEvent.from_api(event, cal_id)
+                    for event in events_result.get("items", [])
+                )
+                page_token = events_result.get("nextPageToken")
+                if not page_token:
+                    break
 
-            if not all_events:
-                return f"No events found for {date}."
+        # Sort combined events by start time
+        all_events.sort(key=lambda event: event.start)
+        return all_events
 
-            # Sort combined events by start time
-            all_events.sort(
-                key=lambda x: x["start"].get("dateTime", x["start"].get("date"))
+    def fetch_events_for_day(self, date: datetime.date) -> List[CalendarEvent]:
+        """
+        Fetches events for a specific day from the primary and secretary_bot calendars.
+
+        Args:
+            date (datetime.date): The date to fetch events for.
+
+        Returns:
+            List[CalendarEvent]: The events, sorted by start time.
+
+        Raises:
+            HttpError: If the Calendar API request fails.
+        """
+        return self.fetch_events_for_range(date, date)
+
+    def list_availability_calendars(self) -> List[str]:
+        """
+        Lists the IDs of the calendars selected in the user's calendar list, other than
+        the primary and secretary_bot calendars (whose events are fetched in full).
+        """
+        service = self.services.get("calendar")
+        if not service:
+            return []
+
+        calendar_ids = []
+        page_token = None
+        while True:
+            calendar_list = self._execute(service.calendarList().list(pageToken=page_token))
+            for entry in calendar_list.get("items", []):
+                if entry.get("primary") or entry.get("id") == self.bot_calendar_id:
+                    continue
+                if entry.get("selected"):
+                    calendar_ids.append(entry["id"])
+            page_token = calendar_list.get("nextPageToken")
+            if not page_token:
+                break
+        return calendar_ids
+
+    @instrumented
+    def fetch_busy_blocks(
+        self,
+        start_date: datetime.date,
+        end_date: datetime.date,
+        calendar_ids: Optional[List[str]] = None,
+    ) -> List[BusyBlock]:
+        """
+        Fetches merged busy blocks across calendars with a single freebusy().query
+        (one per FREEBUSY_MAX_CALENDARS calendars).
+
+        Args:
+            start_date (datetime.date): The first day to check.
+            end_date (datetime.date): The last day (inclusive) to check.
+            calendar_ids (List[str], optional): Calendars to check. Defaults to every selected
+                                                calendar other than primary and secretary_bot.
+
+        Returns:
+            List[BusyBlock]: Non-overlapping busy blocks, sorted by start time.
+
+        Raises:
+            HttpError: If the Calendar API request fails.
+        """
+        self.deadline.check("checking availability")
+        service = self.services.get("calendar")
+        if not service:
+            return []
+
+        if calendar_ids is None:
+            calendar_ids = self.list_availability_calendars()
+        if not calendar_ids:
+            return []
+
+        range_start = (
+            datetime.datetime.combine(start_date, datetime.time.min).astimezone().isoformat()
+        )
+        range_end = (
+            datetime.datetime.combine(end_date, datetime.time.max).astimezone().isoformat()
+        )
+
+        intervals = []
+        for i in range(0, len(calendar_ids), FREEBUSY_MAX_CALENDARS):
+            chunk = calendar_ids[i:i + FREEBUSY_MAX_CALENDARS]
+            result = self._execute(
+                service.freebusy().query(
+                    body={
+                        "timeMin": range_start,
+                        "timeMax": range_end,
+                        "items": [{"id": cal_id} for cal_id in chunk],
+                    }
+                )
             )
+            for cal_id, calendar in result.get("calendars", {}).items():
+                if calendar.get("errors"):
+                    print(f"Warning: Could not read availability for calendar {cal_id}: {calendar['errors']}")
+                    continue
+                for busy in calendar.get("busy", []):
+                    intervals.append((_parse_time(busy["start"]), _parse_time(busy["end"])))
 
-            result_str = f"Events for {date}:\n"
-            for event in all_events:
-                start = event["start"].get("dateTime", event["start"].get("date"))
-                end = event["end"].get("dateTime", event["end"].get("date"))
-                summary = event.get("summary", "No Title")
-                description = event.get("description", "")
-                location = event.get("location", "")
-
-                result_str += f"- {summary}\n"
-                result_str += f"  Start: {start}\n"
-                result_str += f"  End: {end}\n"
-                if location:
-                    result_str += f"  Location: {location}\n"
-                if description:
-                    # Truncate description if it's too long to avoid cluttering the prompt
-                    short_desc = (
-                        (description[:100] + "...")
-                        if len(description) > 100
-                        else description
-                    )
-                    result_str += f"  Description: {short_desc}\n"
-                result_str += "\n"
-            return result_str
+        return merge_busy_blocks(intervals)
 
+    def get_events_for_range(
+        self, start_date: datetime.date, end_date: datetime.date
+    ) -> str:
+        """
+        Gets events for a range of days.
+
+        Args:
+            start_date (datetime.date): The first day to fetch events for.
+            end_date (datetime.date): The last day (inclusive) to fetch events for.
+
+        Returns:
+            str: A string representation of the events.
+        """
+        if not self.services.get("calendar"):
+            return "Calendar service not initialized."
+
+        label = start_date if start_date == end_date else f"{start_date} to {end_date}"
+        try:
+            return render_events(self.fetch_events_for_range(start_date, end_date), label)
         except HttpError as error:
-            return f"An error occurred while fetching events for {date}: {error}"
+            return f"An error occurred while fetching events for {label}: {error}"
+
+    def get_events_for_day(self, date: datetime.date) -> str:
+        """
+        Gets events for a specific day.
+
+        Args:
+            date (datetime.date): The date to fetch events for.
+
+        Returns:
+            str: A string representation of the events.
+        """
+        return self.get_events_for_range(date, date)
 
     # --- Gmail Methods ---
 
-    def get_emails_from_last_days(self, days: int = 3) -> List[dict]:
+    def get_emails_from_last_days(self, days: int = 3) -> List[Email]:
         """
         Fetches emails from the last `days` days with label 'TODOBOT'.
 
@@ -490,29 +1152,77 @@ class GoogleServiceManager:
             days (int): Number of days to look back.
 
         Returns:
-            List[dict]: A list of emails with 'date', 'sender', and 'content'.
+            List[Email]: The matching emails.
+        """
+        emails = []
+        try:
+            emails.extend(self.iter_emails_from_last_days(days))
+        except HttpError:
+            pass  # Already reported; the emails fetched so far are returned
+        return emails
+
+    def _iter_messages(self, query: str) -> Iterator[dict]:
+        """Pages through every message (ID and thread ID) matching a Gmail search."""
+        messages = self.services["gmail"].users().messages()
+        page_token = None
+        while True:
+            self.deadline.check("listing emails")
+            results = self._execute(
+                messages.list(
+                    userId="me", q=query, maxResults=GMAIL_PAGE_SIZE, pageToken=page_token
+                )
+            )
+            yield from results.get("messages", [])
+            page_token = results.get("nextPageToken")
+            if not page_token:
+                return
+
+    def iter_emails_from_last_days(
+        self, days: int = 3, senders: Optional[List[str]] = None
+    ) -> Iterator[Email]:
+        """
+        Streams the emails from the last `days` days with label 'TODOBOT', fetching and parsing
+        one message at a time so that only the current message is held in memory.
+
+        Args:
+            days (int): Number of days to look back.
+            senders (List[str], optional): Only fetch emails from these addresses; the filter is
+                                           applied by Gmail, so other messages are never fetched.
+                                           An empty list fetches nothing. Defaults to every sender.
+
+        Yields:
+            Email: Each matching email.
+
+        Raises:
+            HttpError: If a Gmail request fails (after printing it), so that callers can tell
+                       a partial mailbox from a complete one.
         """
+        self.deadline.check("fetching emails")
         service = self.services.get("gmail")
         if not service:
             print("Gmail service not initialized.")
-            return []
+            return
 
         # Calculate date query: after:YYYY/MM/DD
         today = datetime.date.today()
         query_date = today - datetime.timedelta(days=days)
         query_date_str = query_date.strftime("%Y/%m/%d")
 
-        # Query: label:TODOBOT after:YYYY/MM/DD
-        query = f"label:TODOBOT after:{query_date_str}"
+        # Query: label:TODOBOT after:YYYY/MM/DD [from:(a OR b ...)]
+        queries = build_gmail_queries(f"label:TODOBOT after:{query_date_str}", senders)
 
         try:
-            results = service.users().messages().list(userId="me", q=query).execute()
-            messages = results.get("messages", [])
-
-            email_data = []
-
+            seen_ids = set()
+            messages = itertools.chain.from_iterable(
+                self._iter_messages(query) for query in queries
+            )
             for msg in messages:
-                msg_detail = service.users().messages().get(userId="me", id=msg["id"]).execute()
+                # Never fetch a message twice, even if it matches more than one search
+                if msg["id"] in seen_ids:
+                    continue
+                seen_ids.add(msg["id"])
+                self.deadline.check("fetching emails")
+                msg_detail = self._execute(service.users().messages().get(userId="me", id=msg["id"]))
                 payload = msg_detail.get("payload", {})
                 headers = payload.get("headers", [])
 
@@ -554,18 +1264,16 @@ class GoogleServiceManager:
                 if not body:
                     body = snippet = msg_detail.get("snippet", "")
 
-                email_data.append({
-                    "date": date,
-                    "sender": sender_email,
-                    "subject": subject,
-                    "content": body
-                })
-
-            # Sort by date? The API returns loosely sorted, but robust sort is better.
-            # However, date string parsing is complex. Let's rely on API order or just keep list.
-            # For this task, we can just return the list.
-            return email_data
+                yield Email(
+                    id=msg["id"],
+                    sender=sender_email,
+                    date=date,
+                    subject=subject,
+                    content=body,
+                    thread_id=msg_detail.get("threadId", msg.get("threadId", "")),
+                    internal_date=int(msg_detail.get("internalDate", 0) or 0),
+                )
 
         except HttpError as error:
             print(f"An error occurred fetching emails: {error}")
-            return []
+            raise
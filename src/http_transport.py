@@ -0,0 +1,180 @@
+import queue
+import threading
+from urllib.parse import urlsplit
+import httplib2
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class PooledHttp:
+    """
+    A thread-safe, httplib2.Http-compatible connection pool.
+
+    Each request borrows one of `size` keep-alive httplib2.Http objects (the most recently used
+    first, as it is the most likely to hold an open connection) and returns it afterwards, so
+    connections are reused across every user's Google API clients. Wrap it in an AuthorizedHttp
+    to add a user's credentials.
+    """
+
+    def __init__(self, size: int = 10, timeout: float = 60):
+        self.timeout = timeout
+        self._pool = queue.LifoQueue()
+        for _ in range(size):
+            self._pool.put(httplib2.Http(timeout=timeout))
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.connections_opened = 0  # TCP (and TLS) handshakes, including reconnects
+
+        pool = self
+
+        class CountingHTTPConnection(httplib2.HTTPConnectionWithTimeout):
+            def connect(self):
+                pool._count_connection()
+                super().connect()
+
+        class CountingHTTPSConnection(httplib2.HTTPSConnectionWithTimeout):
+            def connect(self):
+                pool._count_connection()
+                super().connect()
+
+        self._connection_types = {
+            "http": CountingHTTPConnection,
+            "https": CountingHTTPSConnection,
+        }
+
+    def _count_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def request(
+        self, uri, method="GET", body=None, headers=None,
+        redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None,
+    ):
+        if connection_type is None:
+            connection_type = self._connection_types.get(urlsplit(uri).scheme)
+        with self._lock:
+            self.requests_sent += 1
+        http = self._pool.get()
+        try:
+            return http.request(
+                uri, method, body=body, headers=headers,
+                redirections=redirections, connection_type=connection_type,
+            )
+        finally:
+            self._pool.put(http)
+
+    def close(self):
+        # Google API clients close their http when they are closed; the shared pool outlives them
+        pass
+
+    def shutdown(self):
+        """Closes every pooled connection."""
+        while True:
+            try:
+                http = self._pool.get_nowait()
+            except queue.Empty:
+                return
+            http.close()
+
+
+class CountingAdapter(HTTPAdapter):
+    """
+    A pooled requests adapter that counts the requests it sends and the connections it opens,
+    the same way PooledHttp does, through its own connection classes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self._lock = threading.Lock()
+        self.requests_sent = 0
+        self.connections_opened = 0  # TCP (and TLS) handshakes, including reconnects
+        super().__init__(*args, **kwargs)
+
+    def _count_connection(self):
+        with self._lock:
+            self.connections_opened += 1
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        adapter = self
+
+        class CountingHTTPConnection(HTTPConnection):
+            def connect(self):
+                adapter._count_connection()
+                super().connect()
+
+        class CountingHTTPSConnection(HTTPSConnection):
+            def connect(self):
+                adapter._count_connection()
+                super().connect()
+
+        class CountingHTTPConnectionPool(HTTPConnectionPool):
+            ConnectionCls = CountingHTTPConnection
+
+        class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+            ConnectionCls = CountingHTTPSConnection
+
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": CountingHTTPConnectionPool,
+            "https": CountingHTTPSConnectionPool,
+        }
+
+    def send(self, request, *args, **kwargs):
+        with self._lock:
+            self.requests_sent += 1
+        return super().send(request, *args, **kwargs)
+
+
+class SharedTransport:
+    """
+    Keep-alive connections shared across users: a PooledHttp for the Google API clients and a
+    pooled requests.Session for OAuth requests (device flow and token refreshes).
+    """
+
+    def __init__(self, pool_size: int = 10, timeout: float = 60):
+        """
+        Args:
+            pool_size (int): Connections kept per pool (and the maximum concurrent requests).
+            timeout (float): Socket timeout in seconds for the Google API clients.
+        """
+        self.timeout = timeout
+        self.http = PooledHttp(pool_size, timeout)
+        self.session = requests.Session()
+        adapter = CountingAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._adapter = adapter
+
+    def stats(self) -> dict:
+        """
+        Connection reuse so far, per pool: requests sent and connections opened. A request that
+        did not open a connection reused one.
+        """
+        return {
+            "google_api": {
+                "requests": self.http.requests_sent,
+                "connections": self.http.connections_opened,
+            },
+            "oauth": {
+                "requests": self._adapter.requests_sent,
+                "connections": self._adapter.connections_opened,
+            },
+        }
+
+    def close(self):
+        self.http.shutdown()
+        self.session.close()
+
+
+def format_stats(stats: dict) -> str:
+    """Renders `SharedTransport.stats()` as one line per pool."""
+    lines = []
+    for name, counts in stats.items():
+        requests_sent, connections = counts["requests"], counts["connections"]
+        reused = max(0, requests_sent - connections)
+        rate = f"{reused / requests_sent:.0%}" if requests_sent else "n/a"
+        lines.append(
+            f"{name}: {requests_sent} requests over {connections} connections ({rate} reused)"
+        )
+    return "\n".join(lines)
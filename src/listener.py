@@ -0,0 +1,292 @@
+import hmac
+import json
+import time
+import base64
+import datetime
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+from urllib.parse import parse_qs, urlsplit
+
+# Watches are renewed this long before they expire (Calendar channels and Gmail watches
+# both expire, after about a week at most)
+RENEW_BEFORE_SECONDS = 3600.0
+# The longest the listener goes without checking for due renewals, and the shortest (so
+# that a failing renewal is retried without spinning)
+MAX_RENEWAL_CHECK_SECONDS = 3600.0
+MIN_RENEWAL_CHECK_SECONDS = 60.0
+
+
+class Debouncer:
+    """
+    Collapses bursts of notifications per key into a single callback.
+
+    The callback fires once a key has been quiet for `delay` seconds, or at the latest
+    `max_wait` seconds after the first notification of the burst. It receives the key and
+    the time of the earliest notification in the burst.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[str, datetime.datetime], None],
+        delay: float = 30.0,
+        max_wait: float = 300.0,
+    ):
+        self.callback = callback
+        self.delay = delay
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._timers: Dict[str, threading.Timer] = {}
+        self._first_seen: Dict[str, datetime.datetime] = {}
+
+    def notify(self, key: str, when: Optional[datetime.datetime] = None):
+        when = when or datetime.datetime.now().astimezone()
+        with self._lock:
+            first_seen = self._first_seen.setdefault(key, when)
+            if when < first_seen:
+                self._first_seen[key] = first_seen = when
+
+            timer = self._timers.pop(key, None)
+            if timer:
+                timer.cancel()
+
+            elapsed = (when - first_seen).total_seconds()
+            delay = max(0.0, min(self.delay, self.max_wait - elapsed))
+            timer = threading.Timer(delay, self._fire, args=(key,))
+            timer.daemon = True
+            self._timers[key] = timer
+            timer.start()
+
+    def _fire(self, key: str):
+        with self._lock:
+            self._timers.pop(key, None)
+            first_seen = self._first_seen.pop(key, None)
+        if first_seen is not None:
+            self.callback(key, first_seen)
+
+    def cancel_all(self):
+        with self._lock:
+            for timer in self._timers.values():
+                timer.cancel()
+            self._timers.clear()
+            self._first_seen.clear()
+
+
+def watch_expiration(resource: dict) -> Optional[float]:
+    """A watch resource's `expiration` (epoch milliseconds) as a POSIX timestamp, if it has one."""
+    try:
+        return int(resource["expiration"]) / 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class WatchRenewer:
+    """
+    Keeps push subscriptions alive: each one is renewed by calling its `renew` function again
+    shortly before the expiration of the watch resource it last returned.
+    """
+
+    def __init__(self, renew_before: float = RENEW_BEFORE_SECONDS):
+        self.renew_before = renew_before
+        self._watches: Dict[str, list] = {}  # name -> [renew, expiration or None]
+
+    def __len__(self) -> int:
+        return len(self._watches)
+
+    def add(self, name: str, renew: Callable[[], dict]) -> dict:
+        """
+        Starts a watch by calling `renew`, and keeps renewing it.
+
+        Raises:
+            Whatever `renew` raises; the watch is then not kept.
+        """
+        resource = renew()
+        self._watches[name] = [renew, watch_expiration(resource)]
+        return resource
+
+    def renew_due(self, now: Optional[float] = None) -> List[str]:
+        """
+        Renews the watches that expire within `renew_before`. A failed renewal is reported
+        and retried at the next check.
+
+        Returns:
+            List[str]: The names of the watches renewed.
+        """
+        now = time.time() if now is None else now
+        renewed = []
+        for name, watch in self._watches.items():
+            renew, expiration = watch
+            if expiration is None or expiration - now > self.renew_before:
+                continue
+            try:
+                watch[1] = watch_expiration(renew())
+                renewed.append(name)
+            except Exception as e:
+                print(f"Could not renew the watch for {name}: {e}")
+        return renewed
+
+    def seconds_until_due(self, now: Optional[float] = None) -> float:
+        """How long until the next renewal is due, bounded by the check interval limits."""
+        now = time.time() if now is None else now
+        due = [
+            expiration - self.renew_before - now
+            for _, expiration in self._watches.values()
+            if expiration is not None
+        ]
+        wait = min(due, default=MAX_RENEWAL_CHECK_SECONDS)
+        return min(MAX_RENEWAL_CHECK_SECONDS, max(MIN_RENEWAL_CHECK_SECONDS, wait))
+
+
+class NotificationRouter:
+    """
+    Maps incoming Calendar and Gmail push notifications to callbacks.
+    """
+
+    def __init__(
+        self,
+        on_calendar_change: Callable[[str], None],
+        on_mailbox_change: Optional[Callable[[str], None]] = None,
+        gmail_token: Optional[str] = None,
+    ):
+        """
+        Args:
+            on_calendar_change (Callable[[str], None]): Called with the user_id whose calendar changed.
+            on_mailbox_change (Callable[[str], None], optional): Called with the Gmail historyId
+                of an admin mailbox change.
+            gmail_token (str, optional): The secret the Pub/Sub push endpoint URL carries as
+                `?token=`. Gmail notifications are ignored without it.
+        """
+        self.on_calendar_change = on_calendar_change
+        self.on_mailbox_change = on_mailbox_change
+        self.gmail_token = gmail_token
+        self._channels: Dict[str, dict] = {}  # channel_id -> {"user_id", "token"}
+
+    def register_channel(self, channel_id: str, user_id: str, token: Optional[str] = None):
+        self._channels[channel_id] = {"user_id": user_id, "token": token}
+
+    def unregister_channel(self, channel_id: str):
+        self._channels.pop(channel_id, None)
+
+    def handle_calendar(self, headers) -> Optional[str]:
+        """
+        Handles a Calendar events().watch notification.
+
+        Returns:
+            str: The affected user_id, or None if the notification was ignored.
+        """
+        channel = self._channels.get(headers.get("X-Goog-Channel-ID", ""))
+        if channel is None:
+            return None
+        if channel["token"] and headers.get("X-Goog-Channel-Token") != channel["token"]:
+            return None
+        # "sync" is sent once when the channel is created; it does not signal a change
+        if headers.get("X-Goog-Resource-State") == "sync":
+            return None
+
+        self.on_calendar_change(channel["user_id"])
+        return channel["user_id"]
+
+    def handle_gmail(self, body: bytes, token: Optional[str] = None) -> Optional[str]:
+        """
+        Handles a Gmail watch notification delivered by a Pub/Sub push subscription.
+
+        Args:
+            body (bytes): The push request body.
+            token (str, optional): The `token` query parameter of the push request.
+
+        Returns:
+            str: The notified historyId, or None if the notification was ignored.
+        """
+        if self.on_mailbox_change is None or not self.gmail_token:
+            return None
+        if not token or not hmac.compare_digest(token, self.gmail_token):
+            return None
+        try:
+            envelope = json.loads(body)
+            data = json.loads(base64.b64decode(envelope["message"]["data"]))
+            history_id = str(data["historyId"])
+        except (ValueError, KeyError, TypeError):
+            return None
+
+        self.on_mailbox_change(history_id)
+        return history_id
+
+
+class _NotificationHandler(BaseHTTPRequestHandler):
+    router: NotificationRouter = None  # Set on the subclass created by ListenerServer
+    metrics = None  # A MetricsRegistry served on GET /metrics, if given
+
+    def do_GET(self):
+        if self.metrics is None or self.path.split("?")[0] != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.metrics.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+
+        # Acknowledge straight away; Google retries notifications that are not answered quickly
+        self.send_response(200)
+        self.end_headers()
+
+        url = urlsplit(self.path)
+        if url.path.startswith("/calendar"):
+            self.router.handle_calendar(self.headers)
+        elif url.path.startswith("/gmail"):
+            token = parse_qs(url.query).get("token", [None])[0]
+            self.router.handle_gmail(body, token)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ListenerServer:
+    """
+    A small HTTP receiver for push notifications.
+
+    Calendar notifications are expected on /calendar and Gmail (Pub/Sub push) notifications
+    on /gmail?token=<secret>. In production it sits behind an HTTPS endpoint; locally it doubles as a
+    stand-in receiver that tests can POST simulated notifications to.
+    """
+
+    def __init__(
+        self, router: NotificationRouter, host: str = "127.0.0.1", port: int = 8080, metrics=None,
+    ):
+        """
+        Args:
+            router (NotificationRouter): Handles the notifications.
+            host (str): Interface to bind to.
+            port (int): Port to listen on.
+            metrics (MetricsRegistry, optional): Also served on GET /metrics for Prometheus.
+        """
+        handler = type(
+            "NotificationHandler", (_NotificationHandler,), {"router": router, "metrics": metrics}
+        )
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def address(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        """Serves in a background thread."""
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+
+    def serve_forever(self):
+        self.httpd.serve_forever()
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread:
+            self._thread.join()
@@ -0,0 +1,152 @@
+import os
+import time
+import bisect
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Dict, Tuple
+from src.credential_store import atomic_write
+
+# Latency buckets in seconds, from a cached read to a slow Gemini call
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+# Every metric the planner exports: name -> (type, help)
+METRICS = {
+    "secretary_api_calls_total": (
+        "counter", "API requests sent, by service and response status (retries included).",
+    ),
+    "secretary_api_retries_total": ("counter", "API requests retried after a transient failure."),
+    "secretary_sleep_seconds_total": (
+        "counter", "Seconds spent waiting, by service and reason (retry backoff or write pacing).",
+    ),
+    "secretary_gemini_tokens_total": (
+        "counter", "Gemini tokens, by user, model and kind (input, output or cached input).",
+    ),
+    "secretary_method_duration_seconds": ("histogram", "Duration of manager methods."),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace("\n", r"\n").replace('"', r"\"")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class MetricsRegistry:
+    """
+    Counters and histograms rendered in the Prometheus text exposition format, so they can
+    be written as a node_exporter textfile or served on a /metrics endpoint.
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # Added to every series, e.g. {"shard": "0"} so that shards' files don't collide
+        self.const_labels: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        # name -> labels -> [bucket counts..., sum, count]
+        self._histograms: Dict[str, Dict[Labels, list]] = {}
+
+    def _labels(self, labels: dict) -> Labels:
+        merged = {**self.const_labels, **labels}
+        return tuple(sorted((name, str(value)) for name, value in merged.items()))
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """Adds `value` to a counter."""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        """Records one observation in a histogram."""
+        key = self._labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            state = series.get(key)
+            if state is None:
+                state = series[key] = [0] * len(self.buckets) + [0.0, 0]
+            # Counted in the first bucket that fits; render() makes the buckets cumulative
+            position = bisect.bisect_left(self.buckets, value)
+            if position < len(self.buckets):
+                state[position] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def value(self, name: str, **labels) -> float:
+        """A counter's current value (0 if never incremented), or a histogram's count."""
+        key = self._labels(labels)
+        with self._lock:
+            if name in self._histograms:
+                state = self._histograms[name].get(key)
+                return state[-1] if state else 0
+            return self._counters.get(name, {}).get(key, 0)
+
+    @contextmanager
+    def time(self, name: str, **labels):
+        """Observes how long the block takes, labelled with its outcome (ok or error)."""
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            yield
+            outcome = "ok"
+        finally:
+            self.observe(name, time.perf_counter() - start, outcome=outcome, **labels)
+
+    def render(self) -> str:
+        lines = []
+        with self._lock:
+            names = sorted(set(self._counters) | set(self._histograms))
+            for name in names:
+                kind, help_text = METRICS.get(name, ("untyped", name))
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in sorted(self._counters.get(name, {}).items()):
+                    lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+                for labels, state in sorted(self._histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(self.buckets, state):
+                        cumulative += count
+                        bucket_labels = labels + (("le", repr(float(bound))),)
+                        lines.append(f"{name}_bucket{_format_labels(bucket_labels)} {cumulative}")
+                    inf_labels = labels + (("le", "+Inf"),)
+                    lines.append(f"{name}_bucket{_format_labels(inf_labels)} {state[-1]}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {_format_value(state[-2])}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {state[-1]}")
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def write_textfile(self, path: str):
+        """Writes the metrics atomically, so a collector never reads a half-written file."""
+        atomic_write(path, self.render())
+
+
+def shard_textfile_path(path: str, shard_index: int) -> str:
+    """"metrics.prom" -> "metrics.shard0.prom", so that every shard writes its own file."""
+    base, extension = os.path.splitext(path)
+    return f"{base}.shard{shard_index}{extension}"
+
+
+def instrumented(method):
+    """Times a manager method into `self.metrics` as secretary_method_duration_seconds."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with self.metrics.time(
+            "secretary_method_duration_seconds",
+            manager=type(self).__name__, method=method.__name__,
+        ):
+            return method(self, *args, **kwargs)
+    return wrapper
+
+
+# The process-wide registry every manager reports to unless given its own
+DEFAULT_METRICS = MetricsRegistry()
@@ -0,0 +1,244 @@
+import datetime
+from dataclasses import dataclass
+from typing import Iterable, Optional, Tuple, Union
+
+DueValue = Union[datetime.date, datetime.datetime]
+
+
+def _parse_due(value: Optional[str]) -> Optional[DueValue]:
+    """Parses a serialized due value back into a date or datetime."""
+    if not value:
+        return None
+    if "T" in value:
+        return datetime.datetime.fromisoformat(value)
+    return datetime.date.fromisoformat(value)
+
+
+def _duration_minutes(duration) -> Optional[int]:
+    """Converts a Todoist duration object into minutes, if it has a usable amount."""
+    if duration is None:
+        return None
+    amount = getattr(duration, "amount", None)
+    if not isinstance(amount, int):
+        return None
+    unit = getattr(duration, "unit", "minute")
+    return amount * 24 * 60 if unit == "day" else amount
+
+
+@dataclass(slots=True)
+class Task:
+    """A Todoist task, reduced to the fields the planner cares about."""
+
+    id: str
+    content: str
+    description: str = ""
+    project_id: str = ""
+    priority: int = 1
+    labels: Tuple[str, ...] = ()
+    due: Optional[DueValue] = None
+    duration_minutes: Optional[int] = None
+
+    @classmethod
+    def from_todoist(cls, task) -> "Task":
+        """Builds a Task from a todoist_api_python Task object."""
+        due = getattr(task, "due", None)
+        labels = getattr(task, "labels", None) or ()
+        priority = getattr(task, "priority", 1)
+        return cls(
+            id=str(task.id),
+            content=task.content,
+            description=getattr(task, "description", "") or "",
+            project_id=str(getattr(task, "project_id", "") or ""),
+            priority=priority if isinstance(priority, int) else 1,
+            labels=tuple(label for label in labels if isinstance(label, str)),
+            due=due.date if due is not None else None,
+            duration_minutes=_duration_minutes(getattr(task, "duration", None)),
+        )
+
+    @property
+    def due_time(self) -> Optional[str]:
+        """The preferred time of day (e.g. '09:30 AM'), or None for date-only tasks."""
+        if self.due is None:
+            return None
+        formatted_time = self.due.strftime("%I:%M %p")
+        return None if formatted_time == "12:00 AM" else formatted_time
+
+    def render(self) -> str:
+        """Renders the task as a single prompt line."""
+        line = f"- {self.content}"
+        if self.description:
+            line += f" ({self.description})"
+        due_time = self.due_time
+        if due_time:
+            line += f" ({due_time})"
+        return line + "\n"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "content": self.content,
+            "description": self.description,
+            "project_id": self.project_id,
+            "priority": self.priority,
+            "labels": list(self.labels),
+            "due": self.due.isoformat() if self.due is not None else None,
+            "duration_minutes": self.duration_minutes,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Task":
+        return cls(
+            id=data["id"],
+            content=data["content"],
+            description=data.get("description", ""),
+            project_id=data.get("project_id", ""),
+            priority=data.get("priority", 1),
+            labels=tuple(data.get("labels", ())),
+            due=_parse_due(data.get("due")),
+            duration_minutes=data.get("duration_minutes"),
+        )
+
+
+@dataclass(slots=True)
+class CalendarEvent:
+    """A Google Calendar event. Start and end are kept as the API's ISO strings."""
+
+    id: str
+    summary: str
+    start: str
+    end: str
+    calendar_id: str = ""
+    description: str = ""
+    location: str = ""
+
+    @classmethod
+    def from_api(cls, event: dict, calendar_id: str = "") -> "CalendarEvent":
+        """Builds a CalendarEvent from a Calendar API event resource."""
+        start = event.get("start", {})
+        end = event.get("end", {})
+        return cls(
+            id=event.get("id", ""),
+            summary=event.get("summary", "No Title"),
+            start=start.get("dateTime", start.get("date", "")),
+            end=end.get("dateTime", end.get("date", "")),
+            calendar_id=calendar_id,
+            description=event.get("description", "") or "",
+            location=event.get("location", "") or "",
+        )
+
+    def render(self) -> str:
+        """Renders the event as a prompt block, truncating long descriptions."""
+        lines = [f"- {self.summary}", f"  Start: {self.start}", f"  End: {self.end}"]
+        if self.location:
+            lines.append(f"  Location: {self.location}")
+        if self.description:
+            # Truncate description if it's too long to avoid cluttering the prompt
+            short_desc = (
+                (self.description[:100] + "...")
+                if len(self.description) > 100
+                else self.description
+            )
+            lines.append(f"  Description: {short_desc}")
+        lines.append("\n")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "summary": self.summary,
+            "start": self.start,
+            "end": self.end,
+            "calendar_id": self.calendar_id,
+            "description": self.description,
+            "location": self.location,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "CalendarEvent":
+        return cls(**data)
+
+
+@dataclass(slots=True)
+class BusyBlock:
+    """A busy interval from a calendar whose event details are not fetched."""
+
+    start: str
+    end: str
+
+    def render(self) -> str:
+        return f"- Busy\n  Start: {self.start}\n  End: {self.end}\n\n"
+
+    def to_dict(self) -> dict:
+        return {"start": self.start, "end": self.end}
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "BusyBlock":
+        return cls(**data)
+
+
+@dataclass(slots=True)
+class Email:
+    """A TODOBOT email fetched from the admin mailbox."""
+
+    id: str
+    sender: str
+    date: str
+    subject: str = ""
+    content: str = ""
+    thread_id: str = ""
+    internal_date: int = 0  # Milliseconds since the epoch, as reported by Gmail
+
+    def render(self) -> str:
+        """Renders the email as a prompt block."""
+        return f"Date: {self.date}\nContent: {self.content}\n\n"
+
+    def to_dict(self) -> dict:
+        return {
+            "id": self.id,
+            "sender": self.sender,
+            "date": self.date,
+            "subject": self.subject,
+            "content": self.content,
+            "thread_id": self.thread_id,
+            "internal_date": self.internal_date,
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "Email":
+        return cls(**data)
+
+
+# --- Prompt rendering ---
+
+
+def render_tasks(tasks: Iterable[Task]) -> str:
+    """Renders tasks as the 'Potential Tasks' prompt section."""
+    rendered = "".join(task.render() for task in tasks)
+    return rendered or "No overdue or due today tasks found."
+
+
+def render_events(events: Iterable[CalendarEvent], date) -> str:
+    """
+    Renders events as the 'Pre-Existing Events' prompt section.
+    `date` labels the section; it may be a day or a pre-formatted range.
+    """
+    rendered = "".join(event.render() for event in events)
+    if not rendered:
+        return f"No events found for {date}."
+    return f"Events for {date}:\n{rendered}"
+
+
+def render_busy_blocks(blocks: Iterable[BusyBlock]) -> str:
+    """Renders busy blocks from the user's other calendars as a prompt section."""
+    rendered = "".join(block.render() for block in blocks)
+    if not rendered:
+        return ""
+    return (
+        "Busy times from my other calendars (details are private, but these times are just as off-limits):\n"
+        + rendered
+    )
+
+
+def render_emails(emails: Iterable[Email]) -> str:
+    """Renders emails as the 'Recent User Input' prompt section."""
+    return "".join(email.render() for email in emails)
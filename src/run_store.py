@@ -0,0 +1,330 @@
+import json
+import sqlite3
+import time
+import uuid
+import datetime
+from contextlib import contextmanager
+from typing import Dict, Iterable, Iterator, List, Optional
+from src.models import Email
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    started_at TEXT NOT NULL,
+    finished_at TEXT,
+    mailbox_saved INTEGER NOT NULL DEFAULT 0
+);
+
+CREATE TABLE IF NOT EXISTS user_runs (
+    run_id TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    user_id TEXT NOT NULL,
+    run_date TEXT NOT NULL,
+    tasks TEXT,
+    events TEXT,
+    emails TEXT,
+    prompt TEXT,
+    response TEXT,
+    event_ids TEXT,
+    timings TEXT,
+    stage TEXT,
+    busy_blocks TEXT,
+    window_start TEXT,
+    plan TEXT,
+    updated_at TEXT NOT NULL,
+    PRIMARY KEY (run_id, user_id)
+);
+
+-- The admin mailbox as fetched for a run, so a resumed run doesn't fetch it again
+CREATE TABLE IF NOT EXISTS run_emails (
+    run_id TEXT NOT NULL REFERENCES runs(run_id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    email TEXT NOT NULL,
+    PRIMARY KEY (run_id, position)
+);
+
+CREATE INDEX IF NOT EXISTS idx_user_runs_user_date ON user_runs (user_id, run_date);
+CREATE INDEX IF NOT EXISTS idx_user_runs_date ON user_runs (run_date);
+CREATE INDEX IF NOT EXISTS idx_runs_started_at ON runs (started_at);
+"""
+
+# Columns holding JSON-encoded values
+JSON_COLUMNS = ("tasks", "events", "emails", "event_ids", "timings", "busy_blocks", "plan")
+TEXT_COLUMNS = ("prompt", "response", "stage", "window_start")
+# Columns added since the first schema, with their types, for databases created before them
+ADDED_COLUMNS = {
+    "runs": {"mailbox_saved": "INTEGER NOT NULL DEFAULT 0"},
+    "user_runs": {"stage": "TEXT", "busy_blocks": "TEXT", "window_start": "TEXT", "plan": "TEXT"},
+}
+
+# A user's checkpoints within a run, in order. A resumed run continues after the last one:
+#   inputs  - tasks, events, emails and busy blocks were fetched
+#   prompt  - the prompt was built
+#   gemini  - Gemini answered and its plan was saved, but not yet written
+#   written - the plan was written to the calendar (or there was nothing to write)
+STAGES = ("inputs", "prompt", "gemini", "written")
+
+# Saved mailbox emails are committed this many at a time
+MAILBOX_BATCH_SIZE = 100
+
+
+def _now() -> str:
+    return datetime.datetime.now(datetime.timezone.utc).isoformat()
+
+
+@contextmanager
+def timed_stage(timings: Dict[str, float], stage: str):
+    """Records the wall time of the enclosed block, in seconds, as `timings[stage]`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[stage] = round(time.perf_counter() - start, 3)
+
+
+class RunStore:
+    """
+    Embedded SQLite history of every run: per user, the fetched inputs, the final prompt,
+    the Gemini response, the created event IDs and the stage timings.
+    """
+
+    def __init__(self, path: str = "runs.db"):
+        """
+        Args:
+            path (str): Path to the SQLite database file. Use ":memory:" for a throwaway store.
+        """
+        self.path = path
+        self.conn = sqlite3.connect(path, timeout=30)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        if path != ":memory:":
+            # WAL lets several processes (e.g. shards) write to the same store
+            self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.executescript(SCHEMA)
+        self._add_missing_columns()
+        self.conn.commit()
+
+    def _add_missing_columns(self):
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row["name"] for row in self.conn.execute(f"PRAGMA table_info({table})")}
+            for name, definition in columns.items():
+                if name not in existing:
+                    self.conn.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+    def close(self):
+        self.conn.close()
+
+    # --- Writing ---
+
+    def start_run(self) -> str:
+        """Creates a new run and returns its ID."""
+        run_id = datetime.datetime.now().strftime("%Y%m%dT%H%M%S-") + uuid.uuid4().hex[:8]
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO runs (run_id, started_at) VALUES (?, ?)", (run_id, _now())
+            )
+        return run_id
+
+    def finish_run(self, run_id: str):
+        with self.conn:
+            self.conn.execute(
+                "UPDATE runs SET finished_at = ? WHERE run_id = ?", (_now(), run_id)
+            )
+
+    def record(self, run_id: str, user_id: str, run_date: datetime.date, **columns):
+        """
+        Upserts columns of a user's record for a run. Values for JSON columns may be
+        lists of model objects (anything with `to_dict`), plain lists or dicts.
+
+        Args:
+            run_id (str): The run the record belongs to.
+            user_id (str): The user the record belongs to.
+            run_date (datetime.date): The date that was planned.
+            **columns: Any of tasks, events, emails, prompt, response, event_ids, timings,
+                       stage (one of STAGES), busy_blocks, window_start, plan.
+        """
+        if columns.get("stage") not in (None, *STAGES):
+            raise ValueError(f"Unknown stage: {columns['stage']}")
+        values = {
+            name: self._encode(name, value) for name, value in columns.items()
+        }
+        values.update(run_id=run_id, user_id=user_id, run_date=str(run_date), updated_at=_now())
+
+        names = ", ".join(values)
+        placeholders = ", ".join("?" for _ in values)
+        updates = ", ".join(
+            f"{name} = excluded.{name}" for name in values if name not in ("run_id", "user_id")
+        )
+        with self.conn:
+            self.conn.execute(
+                f"INSERT INTO user_runs ({names}) VALUES ({placeholders}) "
+                f"ON CONFLICT (run_id, user_id) DO UPDATE SET {updates}",
+                tuple(values.values()),
+            )
+
+    def save_mailbox(self, run_id: str, emails: Iterable[Email]) -> Iterator[Email]:
+        """
+        Saves the admin mailbox of a run as it streams past, so that it can be consumed
+        (e.g. by `EmailSpool.extend`) while it is saved. Once the stream is exhausted the
+        mailbox is marked complete; an interrupted fetch is fetched again on resume.
+        """
+        with self.conn:
+            self.conn.execute("DELETE FROM run_emails WHERE run_id = ?", (run_id,))
+        batch = []
+        for position, email in enumerate(emails):
+            batch.append((run_id, position, json.dumps(email.to_dict())))
+            if len(batch) >= MAILBOX_BATCH_SIZE:
+                self._insert_emails(batch)
+            yield email
+        self._insert_emails(batch)
+        with self.conn:
+            self.conn.execute("UPDATE runs SET mailbox_saved = 1 WHERE run_id = ?", (run_id,))
+
+    def _insert_emails(self, batch: list):
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO run_emails (run_id, position, email) VALUES (?, ?, ?)", batch
+            )
+        batch.clear()
+
+    def _encode(self, name: str, value):
+        if name not in JSON_COLUMNS:
+            if name not in TEXT_COLUMNS:
+                raise ValueError(f"Unknown run store column: {name}")
+            return value
+        if isinstance(value, dict):
+            return json.dumps(value)
+        if isinstance(value, str):
+            # Error messages stand in for data that could not be fetched
+            return json.dumps(value)
+        return json.dumps(
+            [item.to_dict() if hasattr(item, "to_dict") else item for item in value]
+        )
+
+    # --- Reading ---
+
+    def history(
+        self,
+        user_id: str,
+        since: Optional[datetime.date] = None,
+        limit: int = 10,
+    ) -> List[dict]:
+        """
+        Returns a user's most recent records, newest first, with JSON columns decoded.
+        """
+        query = "SELECT * FROM user_runs WHERE user_id = ?"
+        params: list = [user_id]
+        if since is not None:
+            query += " AND run_date >= ?"
+            params.append(str(since))
+        query += " ORDER BY run_date DESC, updated_at DESC LIMIT ?"
+        params.append(limit)
+        return [self._decode(row) for row in self.conn.execute(query, params)]
+
+    def records_for_date(self, run_date: datetime.date) -> List[dict]:
+        """Returns every user's records for a planned date."""
+        rows = self.conn.execute(
+            "SELECT * FROM user_runs WHERE run_date = ? ORDER BY user_id, updated_at",
+            (str(run_date),),
+        )
+        return [self._decode(row) for row in rows]
+
+    def unfinished_run(self, run_id: Optional[str] = None) -> Optional[dict]:
+        """
+        The run to resume: `run_id` if it exists and has not finished, otherwise (without
+        `run_id`) the most recently started run that has not finished, or None.
+        """
+        if run_id is not None:
+            row = self.conn.execute(
+                "SELECT * FROM runs WHERE run_id = ? AND finished_at IS NULL", (run_id,)
+            ).fetchone()
+        else:
+            row = self.conn.execute(
+                "SELECT * FROM runs WHERE finished_at IS NULL ORDER BY started_at DESC LIMIT 1"
+            ).fetchone()
+        return dict(row) if row else None
+
+    def checkpoint(self, run_id: str, user_id: str) -> Optional[dict]:
+        """A user's record in a run, with JSON columns decoded, or None if it has no stage yet."""
+        row = self.conn.execute(
+            "SELECT * FROM user_runs WHERE run_id = ? AND user_id = ? AND stage IS NOT NULL",
+            (run_id, user_id),
+        ).fetchone()
+        return self._decode(row) if row else None
+
+    def saved_mailbox(self, run_id: str) -> Optional[Iterator[Email]]:
+        """Streams a run's saved admin mailbox, or returns None if it was not saved completely."""
+        row = self.conn.execute(
+            "SELECT mailbox_saved FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if not row or not row["mailbox_saved"]:
+            return None
+        rows = self.conn.execute(
+            "SELECT email FROM run_emails WHERE run_id = ? ORDER BY position", (run_id,)
+        )
+        return (Email.from_dict(json.loads(row["email"])) for row in rows)
+
+    def _decode(self, row: sqlite3.Row) -> dict:
+        record = dict(row)
+        for name in JSON_COLUMNS:
+            if record.get(name) is not None:
+                record[name] = json.loads(record[name])
+        return record
+
+    # --- Retention ---
+
+    def evict(self, max_age_days: Optional[int] = 30, max_runs_per_user: Optional[int] = None) -> int:
+        """
+        Applies the retention policy.
+
+        Args:
+            max_age_days (int, optional): Runs started more than this many days ago are deleted.
+            max_runs_per_user (int, optional): Only this many of each user's newest records are kept.
+
+        Returns:
+            int: The number of user records deleted.
+        """
+        deleted = 0
+        with self.conn:
+            if max_age_days is not None:
+                cutoff = (
+                    datetime.datetime.now(datetime.timezone.utc)
+                    - datetime.timedelta(days=max_age_days)
+                ).isoformat()
+                old_runs = [
+                    row["run_id"]
+                    for row in self.conn.execute(
+                        "SELECT run_id FROM runs WHERE started_at < ?", (cutoff,)
+                    )
+                ]
+                deleted += self._delete_runs(old_runs)
+
+            if max_runs_per_user is not None:
+                cursor = self.conn.execute(
+                    """
+                    DELETE FROM user_runs WHERE rowid IN (
+                        SELECT rowid FROM (
+                            SELECT rowid, ROW_NUMBER() OVER (
+                                PARTITION BY user_id ORDER BY run_date DESC, updated_at DESC
+                            ) AS rank
+                            FROM user_runs
+                        ) WHERE rank > ?
+                    )
+                    """,
+                    (max_runs_per_user,),
+                )
+                deleted += cursor.rowcount
+                # Drop runs that no longer have any user records
+                self.conn.execute(
+                    "DELETE FROM runs WHERE finished_at IS NOT NULL AND run_id NOT IN "
+                    "(SELECT DISTINCT run_id FROM user_runs)"
+                )
+        return deleted
+
+    def _delete_runs(self, run_ids: Iterable[str]) -> int:
+        deleted = 0
+        for run_id in run_ids:
+            deleted += self.conn.execute(
+                "DELETE FROM user_runs WHERE run_id = ?", (run_id,)
+            ).rowcount
+            self.conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,))
+        return deleted
@@ -0,0 +1,159 @@
+import os
+import sys
+import json
+import hashlib
+import subprocess
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Sequence, Tuple
+from src.credential_store import atomic_write
+from src.models import Email
+
+# The script every local shard runs, resolved so shards start from any working directory
+MAIN_SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "main.py")
+
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """
+    Parses a shard spec of the form "i/N" (0 <= i < N).
+
+    Returns:
+        Tuple[int, int]: The shard index and the shard count.
+
+    Raises:
+        ValueError: If the spec is malformed or out of range.
+    """
+    try:
+        index_str, count_str = spec.split("/")
+        index, count = int(index_str), int(count_str)
+    except ValueError:
+        raise ValueError(f"Invalid shard '{spec}'. Expected the form i/N, e.g. 0/4.")
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard '{spec}'. The index must satisfy 0 <= i < N.")
+    return index, count
+
+
+def shard_for(user_id: str, shard_count: int) -> int:
+    """
+    Assigns a user to a shard using a stable hash of the user_id.
+    Unlike hash(), this does not change between processes or Python versions.
+    """
+    digest = hashlib.sha256(user_id.encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") % shard_count
+
+
+def save_emails(path: str, emails: Iterable[Email]) -> int:
+    """
+    Writes the admin emails to a shared file (JSON lines) so shards don't fetch them again.
+    The emails are written as they are consumed, so a generator is never held in memory.
+
+    Returns:
+        int: The number of emails written.
+    """
+    count = 0
+
+    def lines():
+        nonlocal count
+        for email in emails:
+            count += 1
+            yield json.dumps(email.to_dict()) + "\n"
+
+    atomic_write(path, lines())
+    return count
+
+
+def iter_emails(path: str) -> Iterator[Email]:
+    """Streams admin emails written by `save_emails`."""
+    with open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield Email.from_dict(json.loads(line))
+
+
+def load_emails(path: str) -> List[Email]:
+    """Loads admin emails written by `save_emails`."""
+    return list(iter_emails(path))
+
+
+def strip_option(argv: Sequence[str], option: str) -> List[str]:
+    """Removes `option` and its value (either `--opt value` or `--opt=value`) from argv."""
+    stripped = []
+    skip_next = False
+    for arg in argv:
+        if skip_next:
+            skip_next = False
+            continue
+        if arg == option:
+            skip_next = True
+            continue
+        if arg.startswith(option + "="):
+            continue
+        stripped.append(arg)
+    return stripped
+
+
+def merge_summaries(summaries: Sequence[dict]) -> dict:
+    """Merges per-shard summaries into a single run summary."""
+    users = sorted(
+        (user for summary in summaries for user in summary.get("users", [])),
+        key=lambda user: user["user_id"],
+    )
+    counts: Dict[str, int] = {}
+    for user in users:
+        counts[user["status"]] = counts.get(user["status"], 0) + 1
+    return {"users": users, "counts": counts}
+
+
+def run_local_shards(
+    shard_count: int,
+    child_argv: Sequence[str],
+    emails: Iterable[Email],
+    script: str = MAIN_SCRIPT,
+) -> dict:
+    """
+    Runs every shard as its own process on this machine and merges their summaries.
+
+    The admin emails are fetched once by the caller and handed to every shard through a shared
+    file, so the admin mailbox is read once per run rather than once per shard.
+
+    Args:
+        shard_count (int): Number of shards (and processes) to run.
+        child_argv (Sequence[str]): Arguments forwarded to every shard's main.py. Any
+                                    --shard, --admin_emails or --summary_out is replaced by
+                                    the shard's own.
+        emails (Iterable[Email]): The admin emails to share with the shards.
+        script (str): The script each shard runs.
+
+    Returns:
+        dict: The merged summary, plus the list of shards whose process failed.
+    """
+    for option in ("--shard", "--admin_emails", "--summary_out"):
+        child_argv = strip_option(child_argv, option)
+
+    with tempfile.TemporaryDirectory(prefix="shards_") as work_dir:
+        emails_file = os.path.join(work_dir, "admin_emails.json")
+        save_emails(emails_file, emails)
+
+        processes = []
+        for index in range(shard_count):
+            summary_file = os.path.join(work_dir, f"summary_{index}.json")
+            command = [
+                sys.executable, script, *child_argv,
+                "--shard", f"{index}/{shard_count}",
+                "--admin_emails", emails_file,
+                "--summary_out", summary_file,
+            ]
+            processes.append((index, summary_file, subprocess.Popen(command)))
+
+        summaries = []
+        failed_shards = []
+        for index, summary_file, process in processes:
+            return_code = process.wait()
+            if return_code != 0 or not os.path.exists(summary_file):
+                failed_shards.append(index)
+                continue
+            with open(summary_file, "r") as f:
+                summaries.append(json.load(f))
+
+    merged = merge_summaries(summaries)
+    merged["failed_shards"] = failed_shards
+    return merged
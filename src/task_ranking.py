@@ -0,0 +1,101 @@
+import heapq
+import datetime
+import itertools
+from typing import Dict, Iterable, List, Optional, Tuple
+from src.models import Task
+
+# The prompt allows at most five tasks a day (three hard ones on weekends, plus two relaxing
+# ones), so a few times that leaves Gemini room to pick and group without flooding the prompt
+DEFAULT_TASKS_PER_DAY = 15
+
+# Score weights. Todoist priorities run from 1 (normal) to 4 (urgent).
+PRIORITY_WEIGHT = 10.0
+DUE_TODAY_WEIGHT = 8.0
+OVERDUE_WEIGHT = 10.0
+# Each day overdue adds this much, up to OVERDUE_MAX_DAYS, so old tasks rise but don't swamp priority
+OVERDUE_PER_DAY_WEIGHT = 0.5
+OVERDUE_MAX_DAYS = 14
+# Tasks with a time of day are anchored to a slot and easy to place
+DUE_TIME_WEIGHT = 2.0
+# Short tasks fit into gaps; very long ones are hard to place on a busy day
+SHORT_TASK_MINUTES = 30
+SHORT_TASK_WEIGHT = 1.0
+LONG_TASK_MINUTES = 240
+LONG_TASK_WEIGHT = -2.0
+
+
+def score_task(
+    task: Task, today: datetime.date, label_weights: Optional[Dict[str, float]] = None
+) -> float:
+    """
+    Scores a task for pre-ranking: higher means more likely to be worth planning today.
+
+    Args:
+        task (Task): The task to score.
+        today (datetime.date): The first planned day.
+        label_weights (Dict[str, float], optional): Added to the score of tasks with each label,
+                                                    e.g. {"errand": 3, "someday": -5}.
+    """
+    score = PRIORITY_WEIGHT * (task.priority - 1)
+
+    if task.due is not None:
+        due_date = task.due.date() if isinstance(task.due, datetime.datetime) else task.due
+        days_overdue = (today - due_date).days
+        if days_overdue > 0:
+            score += OVERDUE_WEIGHT + OVERDUE_PER_DAY_WEIGHT * min(days_overdue, OVERDUE_MAX_DAYS)
+        elif days_overdue == 0:
+            score += DUE_TODAY_WEIGHT
+        if task.due_time:
+            score += DUE_TIME_WEIGHT
+
+    if task.duration_minutes is not None:
+        if task.duration_minutes <= SHORT_TASK_MINUTES:
+            score += SHORT_TASK_WEIGHT
+        elif task.duration_minutes >= LONG_TASK_MINUTES:
+            score += LONG_TASK_WEIGHT
+
+    if label_weights:
+        score += sum(label_weights.get(label, 0.0) for label in task.labels)
+    return score
+
+
+def select_top_tasks(
+    tasks: Iterable[Task],
+    limit: Optional[int],
+    today: Optional[datetime.date] = None,
+    label_weights: Optional[Dict[str, float]] = None,
+) -> Tuple[List[Task], int]:
+    """
+    Keeps the `limit` highest scoring tasks, consuming `tasks` as a stream with a bounded heap
+    so that only `limit` tasks are held at once. Ties keep their original order.
+
+    Args:
+        tasks (Iterable[Task]): The candidate tasks.
+        limit (int, optional): How many tasks to keep. None keeps every task, unranked.
+        today (datetime.date, optional): The first planned day. Defaults to today.
+        label_weights (Dict[str, float], optional): Per-label score adjustments.
+
+    Returns:
+        Tuple[List[Task], int]: The kept tasks, highest score first, and how many were dropped.
+    """
+    if limit is None:
+        return list(tasks), 0
+    if limit <= 0:
+        return [], sum(1 for _ in tasks)
+
+    today = today or datetime.date.today()
+    order = itertools.count()
+    # A min-heap of the best tasks so far; the worst of them is replaced when a better one arrives.
+    # The negated arrival order makes earlier tasks win ties.
+    heap = []
+    total = 0
+    for task in tasks:
+        total += 1
+        entry = (score_task(task, today, label_weights), -next(order), task)
+        if len(heap) < limit:
+            heapq.heappush(heap, entry)
+        elif entry[:2] > heap[0][:2]:
+            heapq.heapreplace(heap, entry)
+
+    kept = [task for _, _, task in sorted(heap, key=lambda entry: entry[:2], reverse=True)]
+    return kept, total - len(kept)
@@ -1,10 +1,46 @@
+import httpx
 from todoist_api_python.api import TodoistAPI
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError, as_completed
+from typing import Dict, Iterator, List, Optional, Tuple
+from src.cassette import Cassette, CassetteTransport
+from src.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+from src.metrics import DEFAULT_METRICS, MetricsRegistry, instrumented
+from src.models import Task, render_tasks
+from src.task_ranking import select_top_tasks
+
+
+# Tasks that are overdue, due today, or sitting in the Inbox without a date
+BASE_QUERY = "overdue | today | (no date & #Inbox)"
+# Undated tasks assigned to me in a chunk of favorited projects
+FAVORITES_QUERY = "assigned to: me & no date & ({projects})"
+# Bounds for each favorites sub-query, to keep filters fast and under server length limits
+MAX_PROJECTS_PER_QUERY = 10
+MAX_QUERY_LENGTH = 500
 
 
 class TodoistManager:
-    def __init__(self, api_key):
-        self.api = TodoistAPI(api_key)
+    def __init__(
+        self,
+        api_key,
+        max_workers: int = 4,
+        deadline: Optional[Deadline] = None,
+        cassette: Optional[Cassette] = None,
+        metrics: Optional[MetricsRegistry] = None,
+    ):
+        self.metrics = metrics or DEFAULT_METRICS
+        # Every Todoist response is counted by status, however the SDK pages through results
+        client = httpx.Client(
+            transport=CassetteTransport(cassette) if cassette else None,
+            event_hooks={"response": [self._count_response]},
+        )
+        self.api = TodoistAPI(api_key, client=client)
+        self.max_workers = max_workers
+        self.deadline = deadline or NO_DEADLINE
+
+    def _count_response(self, response: httpx.Response):
+        self.metrics.inc(
+            "secretary_api_calls_total", service="todoist", status=str(response.status_code)
+        )
 
     def _sanitize_project_name(self, name: str) -> str:
         """
@@ -55,75 +91,123 @@ class TodoistManager:
 
         return all_items
 
-    def get_potential_tasks(self):
+    def _build_queries(self, fav_projects) -> List[str]:
         """
-        Fetches overdue, due today, and inbox tasks with no due date.
-        Also includes tasks from favorited projects that are assigned to the user and have no due date.
+        Builds the filter queries for the potential tasks: the base query, plus one
+        query per bounded chunk of favorited projects.
         """
-        try:
-            # Fetch all projects to identify favorites and map IDs to names
-            projects_data = self.api.get_projects()
-            projects = self._collect_all_items(projects_data)
-
-            # Defensive: ensure items have 'id'
-            valid_projects = []
-            for p in projects:
-                if hasattr(p, 'id') and hasattr(p, 'name'):
-                    valid_projects.append(p)
+        queries = [BASE_QUERY]
+
+        chunk = []
+        chunk_length = 0
+        for p in fav_projects:
+            part = f"#{self._sanitize_project_name(p.name)}"
+            if chunk and (
+                len(chunk) >= MAX_PROJECTS_PER_QUERY
+                or chunk_length + len(part) + 3 > MAX_QUERY_LENGTH
+            ):
+                queries.append(FAVORITES_QUERY.format(projects=" | ".join(chunk)))
+                chunk, chunk_length = [], 0
+            chunk.append(part)
+            chunk_length += len(part) + 3  # Account for the " | " separator
+
+        if chunk:
+            queries.append(FAVORITES_QUERY.format(projects=" | ".join(chunk)))
+        return queries
+
+    def _run_query(self, query: str) -> list:
+        # Consume the paginated response inside the worker so every page is fetched concurrently
+        return self._collect_all_items(self.api.filter_tasks(query=query))
+
+    def iter_potential_tasks(self) -> Iterator[Task]:
+        """
+        Streams overdue, due today, and inbox tasks with no due date, plus tasks from favorited
+        projects that are assigned to the user and have no due date.
+
+        The favorites are split into bounded sub-queries that run concurrently with the base query.
+        Tasks are yielded as each query completes, deduplicated by task ID.
+
+        Raises:
+            DeadlineExceeded: If the deadline is reached before every query has completed.
+        """
+        self.deadline.check("fetching tasks")
+        # Fetch all projects to identify favorites and map IDs to names
+        projects_data = self.api.get_projects()
+        projects = self._collect_all_items(projects_data)
+
+        # Defensive: ensure items have 'id'
+        valid_projects = []
+        for p in projects:
+            if hasattr(p, 'id') and hasattr(p, 'name'):
+                valid_projects.append(p)
+            else:
+                # Log warning only if it looks like we failed to flatten
+                if isinstance(p, list):
+                     print(f"Warning: Nested list found in projects after flattening: {p}")
                 else:
-                    # Log warning only if it looks like we failed to flatten
-                    if isinstance(p, list):
-                         print(f"Warning: Nested list found in projects after flattening: {p}")
-                    else:
-                         pass # Might be unexpected object, but ignore safely
-
-            fav_projects = [p for p in valid_projects if getattr(p, 'is_favorite', False)]
-
-            # Base query
-            query = "overdue | today | (no date & #Inbox)"
-
-            # Add favorited projects to query
-            if fav_projects:
-                fav_query_parts = []
-                for p in fav_projects:
-                    safe_name = self._sanitize_project_name(p.name)
-                    fav_query_parts.append(f"#{safe_name}")
-
-                if fav_query_parts:
-                    fav_query_string = " | ".join(fav_query_parts)
-                    # Add to main query: OR (assigned to me & no date & (Fav1 | Fav2 ...))
-                    query += f" | (assigned to: me & no date & ({fav_query_string}))"
-
-            tasks_data = self.api.filter_tasks(query=query)
-            all_tasks = self._collect_all_items(tasks_data)
-
-            tasks = []
-            seen_task_ids = set()
-
-            for task in all_tasks:
-                if not hasattr(task, 'id'):
-                     continue
-                if task.id not in seen_task_ids:
-                    tasks.append(task)
-                    seen_task_ids.add(task.id)
-
-            if not tasks:
-                return "No overdue or due today tasks found."
-
-            potential_tasks = ""
-            for task in tasks:
-                potential_tasks += f"- {task.content}"
-
-                if task.description:
-                    potential_tasks += f" ({task.description})"
-                if task.due:
-                    formatted_time = task.due.date.strftime("%I:%M %p")
-                    if formatted_time != "12:00 AM":
-                        potential_tasks += f" ({formatted_time})"
-                potential_tasks += "\n"
-
-            return potential_tasks
+                     pass # Might be unexpected object, but ignore safely
+
+        fav_projects = [p for p in valid_projects if getattr(p, 'is_favorite', False)]
+        queries = self._build_queries(fav_projects)
+
+        seen_task_ids = set()
+        executor = ThreadPoolExecutor(max_workers=min(len(queries), self.max_workers))
+        try:
+            futures = [executor.submit(self._run_query, query) for query in queries]
+            for future in as_completed(futures, timeout=self.deadline.timeout()):
+                for task in future.result():
+                    if not hasattr(task, 'id'):
+                         continue
+                    if task.id not in seen_task_ids:
+                        seen_task_ids.add(task.id)
+                        yield Task.from_todoist(task)
+        except TimeoutError:
+            # A network timeout inside a query is an ordinary error, not a cancellation
+            if not self.deadline.expired():
+                raise
+            raise DeadlineExceeded(f"The {self.deadline.name} deadline was reached while fetching tasks.")
+        finally:
+            # Don't wait for (or start) queries whose results are no longer wanted
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    @instrumented
+    def fetch_potential_tasks(self) -> List[Task]:
+        """
+        Fetches the potential tasks (see `iter_potential_tasks`).
+
+        Returns:
+            List[Task]: The deduplicated tasks, in the order their queries completed.
+        """
+        return list(self.iter_potential_tasks())
+
+    @instrumented
+    def rank_potential_tasks(
+        self, limit: Optional[int], label_weights: Optional[Dict[str, float]] = None
+    ) -> Tuple[List[Task], int]:
+        """
+        Fetches the potential tasks and keeps only the `limit` most worth planning, scored
+        locally on priority, due date, how long overdue, labels and duration (see
+        `select_top_tasks`). Tasks are ranked as they stream in, so the rest are never kept.
+
+        Args:
+            limit (int, optional): How many tasks to keep. None keeps every task.
+            label_weights (Dict[str, float], optional): Per-label score adjustments.
 
+        Returns:
+            Tuple[List[Task], int]: The kept tasks, highest score first, and how many were dropped.
+        """
+        return select_top_tasks(self.iter_potential_tasks(), limit, label_weights=label_weights)
+
+    def get_potential_tasks(self, limit: Optional[int] = None):
+        """
+        Fetches the potential tasks (the `limit` highest ranked, if given) and renders them as
+        prompt text.
+        """
+        try:
+            tasks, dropped = self.rank_potential_tasks(limit)
+            if dropped:
+                print(f"Dropped {dropped} lower ranked tasks from the prompt.")
+            return render_tasks(tasks)
         except Exception as error:
             import traceback
             traceback.print_exc()
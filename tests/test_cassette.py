@@ -0,0 +1,137 @@
+import unittest
+from unittest.mock import MagicMock
+import gzip
+import json
+import os
+import tempfile
+import httplib2
+import httpx
+from src.cassette import (
+    RECORD,
+    REPLAY,
+    Cassette,
+    CassetteHttp,
+    CassetteMiss,
+    CassetteTransport,
+    redact_body,
+    redact_url,
+)
+
+class TestRedaction(unittest.TestCase):
+
+    def test_secrets_are_redacted(self):
+        self.assertEqual(
+            redact_url("https://example.com/v1/models?key=secret&alt=sse"),
+            "https://example.com/v1/models?key=REDACTED&alt=sse",
+        )
+        body = redact_body(b'{"access_token": "secret", "items": [{"token": "x", "id": 1}]}')
+        self.assertNotIn("secret", body)
+        self.assertEqual(json.loads(body)["items"][0], {"token": "REDACTED", "id": 1})
+        self.assertEqual(
+            redact_body(b"client_id=abc&client_secret=secret"),
+            "client_id=abc&client_secret=REDACTED",
+        )
+
+class TestCassette(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp_dir.name, "todoist.jsonl.gz")
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def _record_with_httpx(self, handler, requests):
+        cassette = Cassette(self.path, RECORD)
+        client = httpx.Client(transport=CassetteTransport(cassette, httpx.MockTransport(handler)))
+        responses = [client.get(url, headers={"Authorization": "Bearer secret"}) for url in requests]
+        cassette.close()
+        return responses
+
+    def test_httpx_round_trip(self):
+        def handler(request):
+            return httpx.Response(200, json={"results": [request.url.params["query"]]})
+
+        recorded = self._record_with_httpx(handler, [
+            "https://api.todoist.com/api/v1/tasks/filter?query=today",
+            "https://api.todoist.com/api/v1/tasks/filter?query=overdue",
+        ])
+        self.assertEqual(recorded[0].json(), {"results": ["today"]})
+
+        with gzip.open(self.path, "rt") as f:
+            self.assertNotIn("secret", f.read())
+
+        cassette = Cassette(self.path, REPLAY)
+        client = httpx.Client(transport=CassetteTransport(cassette))
+        # Exact matches are answered regardless of order
+        overdue = client.get("https://api.todoist.com/api/v1/tasks/filter?query=overdue")
+        today = client.get("https://api.todoist.com/api/v1/tasks/filter?query=today")
+        self.assertEqual(overdue.json(), {"results": ["overdue"]})
+        self.assertEqual(today.json(), {"results": ["today"]})
+        self.assertEqual(cassette.unused(), 0)
+
+        with self.assertRaises(CassetteMiss):
+            client.get("https://api.todoist.com/api/v1/projects")
+
+    def test_streamed_response_is_passed_through_before_it_is_recorded(self):
+        cassette = Cassette(self.path, RECORD)
+        cassette.record = MagicMock(wraps=cassette.record)
+        transport = httpx.MockTransport(
+            lambda request: httpx.Response(200, content=iter([b"data: 1\n\n", b"data: 2\n\n"]))
+        )
+        client = httpx.Client(transport=CassetteTransport(cassette, transport))
+
+        url = "https://example.com/v1/models:stream"
+        with client.stream("POST", url, content=b"{}") as response:
+            chunks = response.iter_bytes()
+            self.assertEqual(next(chunks), b"data: 1\n\n")
+            cassette.record.assert_not_called()
+            self.assertEqual(list(chunks), [b"data: 2\n\n"])
+        cassette.record.assert_called_once()
+        cassette.close()
+
+        replay_client = httpx.Client(transport=CassetteTransport(Cassette(self.path, REPLAY)))
+        replayed = replay_client.post(url, content=b"{}")
+        self.assertEqual(replayed.content, b"data: 1\n\ndata: 2\n\n")
+
+    def test_replay_falls_back_to_same_path_in_order(self):
+        self._record_with_httpx(
+            lambda request: httpx.Response(200, json={"day": request.url.params["timeMin"]}),
+            ["https://example.com/events?timeMin=2024-01-01"],
+        )
+        cassette = Cassette(self.path, REPLAY)
+        client = httpx.Client(transport=CassetteTransport(cassette))
+        response = client.get("https://example.com/events?timeMin=2024-06-01")
+        self.assertEqual(response.json(), {"day": "2024-01-01"})
+
+    def test_httplib2_round_trip(self):
+        http = MagicMock()
+        http.request.return_value = (
+            httplib2.Response({"status": "200", "content-type": "application/json"}),
+            b'{"items": []}',
+        )
+        cassette = Cassette(self.path, RECORD)
+        CassetteHttp(cassette, http).request(
+            "https://www.googleapis.com/calendar/v3/users/me/calendarList", "GET"
+        )
+        cassette.close()
+
+        replay = CassetteHttp(Cassette(self.path, REPLAY))
+        response, content = replay.request(
+            "https://www.googleapis.com/calendar/v3/users/me/calendarList", "GET"
+        )
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response["content-type"], "application/json")
+        self.assertEqual(content, b'{"items": []}')
+
+    def test_truncated_recording_is_replayed_up_to_the_last_exchange(self):
+        cassette = Cassette(self.path, RECORD)
+        cassette.record("GET", "https://example.com/a", b"", 200, {}, b"first", 0.01)
+        # Read before close(), as after a crash: the gzip trailer has not been written
+
+        replayed = Cassette(self.path, REPLAY)
+        self.assertEqual(replayed.replay("GET", "https://example.com/a", b"")[2], b"first")
+        cassette.close()
+
+if __name__ == '__main__':
+    unittest.main()
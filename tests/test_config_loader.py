@@ -0,0 +1,92 @@
+import unittest
+import json
+import os
+import tempfile
+from src.config_loader import ConfigError, UserSource, read_user_ids, validate_user
+
+def make_user(user_id, **extra):
+    user = {"user_id": user_id, "email": f"{user_id}@example.com", "todoist_api_key": "key"}
+    user.update(extra)
+    return user
+
+class TestConfigLoader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_validate_user(self):
+        self.assertEqual(validate_user(make_user("a")), [])
+        errors = validate_user({"user_id": "a", "email": 5})
+        self.assertTrue(any("todoist_api_key" in e for e in errors))
+        self.assertTrue(any("'email' must be a str" in e for e in errors))
+        self.assertEqual(len(validate_user(["not", "a", "dict"])), 1)
+        self.assertEqual(validate_user({**make_user("a"), "max_tasks": 0}), [])
+        self.assertEqual(
+            validate_user({**make_user("a"), "max_tasks": -1}), ["'max_tasks' cannot be negative"]
+        )
+        weights = {"errand": 3, "focus": 1.5, "someday": "-10", "urgent": True}
+        self.assertEqual(validate_user({**make_user("a"), "task_label_weights": weights}), [
+            "'task_label_weights' must map labels to numbers, got str for 'someday'",
+            "'task_label_weights' must map labels to numbers, got bool for 'urgent'",
+        ])
+
+    def test_directory_source_is_lazy(self):
+        for user_id in ("alice", "bob"):
+            with open(os.path.join(self.tmp.name, f"{user_id}.json"), "w") as f:
+                json.dump(make_user(user_id), f)
+        with open(os.path.join(self.tmp.name, "broken.json"), "w") as f:
+            f.write("{not json")
+
+        source = UserSource.from_path(self.tmp.name)
+        self.assertEqual(source.user_ids(), ["alice", "bob", "broken"])
+
+        # Selecting one user never touches the broken file
+        selected = source.select(["bob"])
+        self.assertEqual(selected.validate(), {})
+        self.assertEqual([u["user_id"] for u in selected], ["bob"])
+
+        self.assertIn("broken", source.validate())
+
+    def test_jsonl_source_reads_only_selected_lines(self):
+        path = os.path.join(self.tmp.name, "users.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps(make_user("alice")) + "\n")
+            f.write("\n# comment\n")
+            f.write(json.dumps(make_user("bob", personal_scheduling_preferences="early")) + "\n")
+
+        source = UserSource.from_path(path)
+        self.assertEqual(source.user_ids(), ["alice", "bob"])
+
+        users = list(source.select(["bob"]))
+        self.assertEqual(users[0]["personal_scheduling_preferences"], "early")
+
+    def test_list_source_validation_and_selection(self):
+        source = UserSource.from_list([make_user("a"), make_user("a"), {"user_id": "c"}])
+
+        invalid = source.validate()
+        self.assertIn("c", invalid)
+        self.assertIn("a", invalid)  # duplicate
+
+        with self.assertRaises(ConfigError):
+            source.select(["missing"])
+
+        self.assertEqual(source.select(predicate=lambda uid: uid == "c").user_ids(), ["c"])
+        self.assertEqual(len(source.head(1)), 1)
+
+    def test_mismatched_file_name_is_invalid(self):
+        with open(os.path.join(self.tmp.name, "alice.json"), "w") as f:
+            json.dump(make_user("bob"), f)
+        invalid = UserSource.from_path(self.tmp.name).validate()
+        self.assertIn("does not match", invalid["alice"][0])
+
+    def test_read_user_ids(self):
+        path = os.path.join(self.tmp.name, "ids.txt")
+        with open(path, "w") as f:
+            f.write("alice\n\n# skip\n bob \n")
+        self.assertEqual(read_user_ids(path), ["alice", "bob"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import datetime
+import os
+import tempfile
+from src.credential_store import CredentialStore, atomic_write
+
+class TestCredentialStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.store = CredentialStore(self.tmp.name, refresh_margin=datetime.timedelta(minutes=10))
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _creds(self, expires_in, valid=True, refresh_token="refresh"):
+        creds = MagicMock()
+        creds.valid = valid
+        creds.refresh_token = refresh_token
+        creds.expiry = datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None) + expires_in
+        creds.to_json.return_value = '{"token": "new"}'
+        return creds
+
+    def test_atomic_write_replaces_file(self):
+        path = os.path.join(self.tmp.name, "nested", "token_a.json")
+        atomic_write(path, "first")
+        atomic_write(path, "second")
+
+        with open(path) as f:
+            self.assertEqual(f.read(), "second")
+        self.assertEqual(os.listdir(os.path.dirname(path)), ["token_a.json"])
+
+    def test_missing_token_is_flagged(self):
+        self.assertIsNone(self.store.load("ghost", ["scope"]))
+        self.assertIn("ghost", self.store.refresh_expiring())
+
+    @patch('src.credential_store.Request')
+    def test_refreshes_only_expiring_tokens(self, mock_request):
+        fresh = self._creds(datetime.timedelta(hours=1))
+        expiring = self._creds(datetime.timedelta(minutes=2))
+        self.store._credentials = {"fresh": fresh, "expiring": expiring}
+
+        failures = self.store.refresh_expiring()
+
+        self.assertEqual(failures, {})
+        fresh.refresh.assert_not_called()
+        expiring.refresh.assert_called_once()
+        with open(self.store.token_path("expiring")) as f:
+            self.assertEqual(f.read(), '{"token": "new"}')
+
+    @patch('src.credential_store.Request')
+    def test_refresh_failures_are_reported(self, mock_request):
+        broken = self._creds(datetime.timedelta(minutes=-5), valid=False)
+        broken.refresh.side_effect = Exception("invalid_grant")
+        no_refresh = self._creds(datetime.timedelta(minutes=-5), valid=False, refresh_token=None)
+        self.store._credentials = {"broken": broken, "no_refresh": no_refresh}
+
+        failures = self.store.refresh_expiring()
+
+        self.assertIn("invalid_grant", failures["broken"])
+        self.assertIn("no_refresh", failures)
+        self.assertIsNone(self.store.get("broken"))
+
+if __name__ == '__main__':
+    unittest.main()
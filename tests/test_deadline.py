@@ -0,0 +1,50 @@
+import unittest
+from unittest.mock import patch
+from src.deadline import NO_DEADLINE, Deadline, DeadlineExceeded
+
+class TestDeadline(unittest.TestCase):
+
+    def test_unbounded_deadline_never_expires(self):
+        self.assertIsNone(NO_DEADLINE.remaining())
+        self.assertFalse(NO_DEADLINE.expired())
+        self.assertEqual(NO_DEADLINE.timeout(30), 30)
+        NO_DEADLINE.check("anything")
+
+    def test_child_is_bounded_by_parent(self):
+        run = Deadline(10, name="run")
+        user = run.child(600, "user_1")
+        self.assertLessEqual(user.remaining(), 10)
+        self.assertLessEqual(user.timeout(30), 10)
+
+        unbounded_user = run.child(None, "user_2")
+        self.assertLessEqual(unbounded_user.remaining(), 10)
+
+    def test_expired_deadline_raises(self):
+        deadline = Deadline(0, name="user_1")
+        self.assertTrue(deadline.expired())
+        with self.assertRaises(DeadlineExceeded) as context:
+            deadline.check("fetching tasks")
+        self.assertIn("user_1 deadline was reached before fetching tasks", str(context.exception))
+
+        # Children of an expired deadline are expired too
+        self.assertTrue(Deadline(0).child(600, "user_2").expired())
+
+    def test_not_swallowed_by_broad_handlers(self):
+        with self.assertRaises(DeadlineExceeded):
+            try:
+                Deadline(0).check()
+            except Exception:
+                self.fail("DeadlineExceeded should not be caught as an Exception")
+
+    @patch('src.deadline.time.sleep')
+    def test_sleep_that_would_overrun_raises_immediately(self, mock_sleep):
+        deadline = Deadline(5)
+        deadline.sleep(1)
+        mock_sleep.assert_called_once_with(1)
+
+        with self.assertRaises(DeadlineExceeded):
+            deadline.sleep(60, "retrying Gemini")
+        self.assertEqual(mock_sleep.call_count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,120 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from src.device_flow import (
+    ClientConfig,
+    DeviceAuthorization,
+    DeviceFlowScheduler,
+    request_device_codes,
+)
+
+
+def response(status, body):
+    resp = MagicMock()
+    resp.status_code = status
+    resp.json.return_value = body
+    return resp
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def monotonic(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestDeviceFlow(unittest.TestCase):
+
+    def setUp(self):
+        self.client = ClientConfig("client-id", "client-secret", "https://token.example")
+        self.clock = FakeClock()
+        patchers = [
+            patch("time.monotonic", self.clock.monotonic),
+            patch("time.sleep", self.clock.sleep),
+        ]
+        for patcher in patchers:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def authorization(self, name, interval=5, expires_in=1800):
+        return DeviceAuthorization(
+            name=name, device_code=f"code-{name}", user_code=name.upper(),
+            verification_url="https://example.com/device", scopes=["scope"],
+            interval=interval, expires_at=self.clock.now + expires_in,
+        )
+
+    def test_polls_every_code_on_its_own_interval(self):
+        answers = {
+            "code-alice": [
+                response(428, {"error": "authorization_pending"}),
+                response(200, {"access_token": "a", "refresh_token": "ra"}),
+            ],
+            "code-bob": [
+                response(428, {"error": "slow_down"}),
+                response(428, {"error": "authorization_pending"}),
+                response(200, {"access_token": "b", "refresh_token": "rb"}),
+            ],
+        }
+        polls = []
+
+        def post(url, data, timeout):
+            polls.append((self.clock.now, data["device_code"]))
+            return answers[data["device_code"]].pop(0)
+
+        session = MagicMock()
+        session.post.side_effect = post
+        saved = []
+        scheduler = DeviceFlowScheduler(self.client, session)
+        scheduler.add(self.authorization("alice"))
+        scheduler.add(self.authorization("bob"))
+
+        authorized = scheduler.run(on_authorized=lambda name, creds: saved.append(name))
+
+        self.assertEqual(sorted(authorized), ["alice", "bob"])
+        self.assertEqual(authorized["bob"].refresh_token, "rb")
+        self.assertEqual(saved, ["alice", "bob"])
+        self.assertEqual(scheduler.failures, {})
+        # bob's interval grows from 5 to 10 seconds after slow_down
+        self.assertEqual(polls, [
+            (5, "code-alice"), (5, "code-bob"), (10, "code-alice"),
+            (15, "code-bob"), (25, "code-bob"),
+        ])
+
+    def test_records_denied_and_expired_codes(self):
+        def post(url, data, timeout):
+            if data["device_code"] == "code-alice":
+                return response(403, {"error": "access_denied"})
+            return response(428, {"error": "authorization_pending"})
+
+        session = MagicMock()
+        session.post.side_effect = post
+        scheduler = DeviceFlowScheduler(self.client, session)
+        scheduler.add(self.authorization("alice"))
+        scheduler.add(self.authorization("bob", expires_in=12))
+
+        self.assertEqual(scheduler.run(), {})
+        self.assertEqual(scheduler.failures["alice"], "The user denied access.")
+        self.assertIn("expired", scheduler.failures["bob"])
+        self.assertEqual(scheduler.pending(), 0)
+
+    def test_requests_codes_for_every_user(self):
+        def post(url, data, timeout):
+            return response(200, {
+                "device_code": "dc", "user_code": "UC", "interval": 5, "expires_in": 1800,
+                "verification_url": "https://example.com/device",
+            })
+
+        session = MagicMock()
+        session.post.side_effect = post
+        authorizations, failures = request_device_codes(
+            self.client, ["alice", "bob"], ["scope"], session
+        )
+        self.assertEqual([a.name for a in authorizations], ["alice", "bob"])
+        self.assertEqual(failures, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
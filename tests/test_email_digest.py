@@ -0,0 +1,80 @@
+import unittest
+from src.email_digest import collapse_threads, strip_quoted_text
+from src.models import Email
+
+class TestStripQuotedText(unittest.TestCase):
+
+    def test_strips_reply_history_and_signature(self):
+        text = (
+            "Please move the dentist to Friday.\r\n"
+            "\r\n"
+            "--\r\n"
+            "Jane\r\n"
+            "\r\n"
+            "On Mon, Oct 2, 2023 at 9:00 AM Bot <bot@example.com>\r\n"
+            "wrote:\r\n"
+            "> Your plan for today...\r\n"
+        )
+        self.assertEqual(strip_quoted_text(text), "Please move the dentist to Friday.")
+
+    def test_strips_inline_quotes_and_outlook_history(self):
+        text = (
+            "> earlier question\n"
+            "Yes, book it.\n"
+            "\n\n\n"
+            "Thanks\n"
+            "________________________________\n"
+            "From: Bot\n"
+            "Sent: Monday\n"
+        )
+        self.assertEqual(strip_quoted_text(text), "Yes, book it.\n\nThanks")
+
+    def test_plain_text_is_untouched(self):
+        text = "On Monday I need to finish the report.\nIt's due at noon."
+        self.assertEqual(strip_quoted_text(text), text)
+
+class TestCollapseThreads(unittest.TestCase):
+
+    def test_one_email_per_thread_with_unique_content(self):
+        emails = [
+            Email(id="m2", sender="a@example.com", date="Tue", thread_id="t1", internal_date=2,
+                  content="Also the gym.\n\nThanks!\n\nOn Mon, Bot wrote:\n> Call the bank."),
+            Email(id="m1", sender="a@example.com", date="Mon", thread_id="t1", internal_date=1,
+                  content="Call the bank.\n\nThanks!"),
+            Email(id="m3", sender="a@example.com", date="Wed", thread_id="t2", internal_date=3,
+                  content="Buy milk.\n-- \nSent with love"),
+            Email(id="m4", sender="a@example.com", date="Wed", thread_id="t3", internal_date=4,
+                  content="> only quoted text"),
+        ]
+
+        collapsed = collapse_threads(emails)
+
+        self.assertEqual([email.id for email in collapsed], ["m3", "m2"])
+        self.assertEqual(collapsed[0].content, "Buy milk.")
+        self.assertEqual(collapsed[1].date, "Tue")
+        self.assertEqual(collapsed[1].content, "Call the bank.\n\nThanks!\n\nAlso the gym.")
+
+    def test_long_thread_keeps_only_the_newest_paragraphs(self):
+        # Each reply adds two paragraphs and repeats the whole history without quote markers
+        emails = []
+        history = []
+        for i in range(10):
+            history = [f"Update {i}: moved item {i}.", f"Next step {i}."] + history
+            emails.append(Email(
+                id=f"m{i}", sender="a@example.com", date=f"Day {i}", thread_id="t1",
+                internal_date=i, content="\n\n".join(history),
+            ))
+
+        collapsed = collapse_threads(emails, max_paragraphs=4)
+
+        self.assertEqual(len(collapsed), 1)
+        self.assertEqual(collapsed[0].id, "m9")
+        self.assertEqual(
+            collapsed[0].content.split("\n\n"),
+            ["Update 8: moved item 8.", "Next step 8.", "Update 9: moved item 9.", "Next step 9."],
+        )
+        uncapped = collapse_threads(emails, max_paragraphs=None)
+        self.assertEqual(len(uncapped[0].content.split("\n\n")), 20)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+from src.email_index import BM25Index, build_query, select_snippets, tokenize
+from src.models import CalendarEvent, Email, Task
+
+DAY_MS = 86_400_000
+NOW_MS = 1_700_000_000_000
+
+
+def make_email(id, content, days_old=0.0):
+    return Email(
+        id=id, sender="me@example.com", date="Tue, 14 Nov 2023", subject="TODOBOT",
+        content=content, internal_date=int(NOW_MS - days_old * DAY_MS),
+    )
+
+
+class TestEmailIndex(unittest.TestCase):
+
+    def test_tokenize_drops_stopwords_and_single_characters(self):
+        self.assertEqual(tokenize("Please move the Dentist to 3 PM, it's urgent!"),
+                         ["move", "dentist", "pm", "it's", "urgent"])
+
+    def test_bm25_prefers_rare_terms_and_shorter_documents(self):
+        index = BM25Index([
+            ["dentist", "appointment", "tuesday"],
+            ["gym", "gym", "workout"],
+            ["dentist", "call", "insurance", "about", "bill", "and", "more", "words"],
+        ])
+        scores = index.scores(["dentist"])
+        self.assertEqual(scores[1], 0.0)
+        self.assertGreater(scores[0], scores[2])
+        self.assertEqual(index.scores(["unknown"]), [0.0, 0.0, 0.0])
+
+    def test_build_query_ignores_error_messages(self):
+        tasks = [Task(id="1", content="Renew passport", description="bring photos", labels=("errand",))]
+        events = [CalendarEvent(id="e", summary="Dentist", start="", end="", description="Dr. Lee")]
+        query = build_query(tasks, events)
+        for word in ("Renew passport", "bring photos", "errand", "Dentist", "Dr. Lee"):
+            self.assertIn(word, query)
+        self.assertEqual(build_query("Error fetching tasks", "An error occurred"), "")
+
+    def test_keeps_everything_under_the_limit(self):
+        emails = [make_email("1", "One\n\nTwo")]
+        self.assertEqual(select_snippets(emails, "anything", 5, NOW_MS), (emails, 0))
+        self.assertEqual(select_snippets(emails, "anything", None, NOW_MS), (emails, 0))
+
+    def test_selects_relevant_paragraphs_in_original_order(self):
+        emails = [
+            make_email("new", "Weather is nice.\n\nMove the passport renewal to the morning.", 2),
+            make_email("old", "Lunch menu attached.\n\nThe dentist wants me there early.\n\n"
+                              "Newsletter footer.", 2.5),
+            make_email("noise", "Random chatter only.", 2.5),
+        ]
+        kept, dropped = select_snippets(emails, "Renew passport renewal\nDentist", 2, NOW_MS)
+
+        self.assertEqual(dropped, 4)
+        self.assertEqual([email.id for email in kept], ["new", "old"])
+        self.assertEqual(kept[0].content, "Move the passport renewal to the morning.")
+        self.assertEqual(kept[1].content, "The dentist wants me there early.")
+        # Everything but the content is carried over
+        self.assertEqual(kept[0].subject, "TODOBOT")
+
+    def test_recency_ranks_paragraphs_without_matching_terms(self):
+        emails = [
+            make_email("today", "No meetings before ten tomorrow.", 0),
+            make_email("stale", "Gym bag.\n\nOld news.\n\nMore old news.", 3),
+        ]
+        kept, dropped = select_snippets(emails, "gym", 2, NOW_MS)
+
+        self.assertEqual(dropped, 2)
+        self.assertEqual([email.content for email in kept],
+                         ["No meetings before ten tomorrow.", "Gym bag."])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+import os
+from src.email_spool import EmailSpool
+from src.models import Email
+
+class TestEmailSpool(unittest.TestCase):
+
+    def test_routes_emails_to_user_buckets(self):
+        spool = EmailSpool({"alice": "Alice@Example.com", "bob": "bob@example.com", "carol": None})
+        emails = (
+            Email(id=f"m{i}", sender=sender, date="Mon", content=f"email {i}")
+            for i, sender in enumerate(["alice@example.com", "eve@example.com", "bob@example.com", "ALICE@example.com"])
+        )
+
+        self.assertEqual(spool.extend(emails), 4)
+
+        self.assertEqual([email.id for email in spool.emails_for("alice")], ["m0", "m3"])
+        self.assertEqual([email.id for email in spool.emails_for("bob")], ["m2"])
+        self.assertEqual(list(spool.emails_for("carol")), [])
+        self.assertEqual(spool.count("alice"), 2)
+        self.assertEqual(spool.message_ids, {"m0", "m1", "m2", "m3"})
+        self.assertEqual(spool.add(Email(id="m4", sender="bob@example.com", date="Tue")), ["bob"])
+
+    def test_close_removes_the_buckets(self):
+        with EmailSpool({"alice": "alice@example.com"}) as spool:
+            spool.add(Email(id="m1", sender="alice@example.com", date="Mon"))
+            directory = spool._tmp_dir.name
+            self.assertTrue(os.listdir(directory))
+        self.assertFalse(os.path.exists(directory))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import datetime
+import tempfile
+import unittest
+from src.event_cache import CalendarCache, EventCache
+
+UTC = datetime.timezone.utc
+
+
+def event(event_id, start, end, **fields):
+    return {"id": event_id, "start": {"dateTime": start}, "end": {"dateTime": end}, **fields}
+
+
+def at(hour, minute=0):
+    return datetime.datetime(2023, 10, 27, hour, minute, tzinfo=UTC)
+
+
+class TestEventCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = CalendarCache()
+        self.cache.apply([
+            event("lunch", "2023-10-27T12:00:00Z", "2023-10-27T13:00:00Z", summary="Lunch"),
+            event("offsite", "2023-10-26T09:00:00Z", "2023-10-28T17:00:00Z", summary="Offsite"),
+            event("standup", "2023-10-27T09:00:00Z", "2023-10-27T09:15:00Z", summary="Standup"),
+            event("review", "2023-10-28T10:00:00Z", "2023-10-28T11:00:00Z", summary="Review"),
+        ])
+
+    def ids(self, events):
+        return [event["id"] for event in events]
+
+    def test_between_returns_overlapping_events_by_start(self):
+        self.assertEqual(
+            self.ids(self.cache.between(at(0), at(23, 59))), ["offsite", "standup", "lunch"]
+        )
+        # Events already over by the window start are left out; ongoing ones are not
+        self.assertEqual(self.ids(self.cache.between(at(12, 30))), ["offsite", "lunch", "review"])
+
+    def test_apply_replaces_moved_and_drops_cancelled_events(self):
+        changed = self.cache.apply([
+            event("lunch", "2023-10-27T14:00:00Z", "2023-10-27T15:00:00Z", summary="Late lunch"),
+            {"id": "standup", "status": "cancelled"},
+        ])
+        self.assertEqual(changed, 2)
+        self.assertEqual(len(self.cache), 3)
+        events = self.cache.between(at(10), at(23))
+        self.assertEqual(self.ids(events), ["offsite", "lunch"])
+        self.assertEqual(events[1]["summary"], "Late lunch")
+
+    def test_persists_between_runs(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "events_user.json")
+            store = EventCache(path)
+            store.calendars["primary"] = self.cache
+            self.cache.sync_token = "token-1"
+            store.save()
+
+            reloaded = EventCache(path).calendar("primary")
+            self.assertEqual(reloaded.sync_token, "token-1")
+            self.assertEqual(
+                self.ids(reloaded.between(at(0), at(23, 59))), ["offsite", "standup", "lunch"]
+            )
+
+            with open(path, "w") as f:
+                f.write("{not json")
+            self.assertEqual(EventCache(path).calendars, {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,202 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import datetime
+from src.deadline import Deadline, DeadlineExceeded
+from src.metrics import MetricsRegistry
+from src.gemini_manager import GeminiManager, ModelHealthTracker
+
+class TestGeminiManager(unittest.TestCase):
+
+    @patch('src.gemini_manager.genai')
+    def setUp(self, mock_genai):
+        self.mock_client = mock_genai.Client.return_value
+        self.calendar_manager = MagicMock()
+        self.health_tracker = ModelHealthTracker(cooldown=300)
+        self.manager = GeminiManager(
+            "fake_key", self.calendar_manager,
+            models=["main-model", "lite-model"], health_tracker=self.health_tracker,
+        )
+
+    def test_single_day_prompt(self):
+        prompt = self.manager.generate_full_prompt("prefs", "- Task\n", "", existing_events=[])
+
+        self.assertIn(f"No events found for {datetime.date.today()}.", prompt)
+        self.assertNotIn("MULTI-DAY PLANNING", prompt)
+
+    def test_multi_day_prompt_fetches_range(self):
+        self.calendar_manager.get_events_for_range.return_value = "Events"
+
+        prompt = self.manager.generate_full_prompt("prefs", "- Task\n", "", days=3)
+
+        today = datetime.date.today()
+        last_day = today + datetime.timedelta(days=2)
+        self.calendar_manager.get_events_for_range.assert_called_once_with(today, last_day)
+        self.assertIn("MULTI-DAY PLANNING", prompt)
+        self.assertIn(f"through {last_day}", prompt)
+
+    def test_generate_and_execute_sets_planning_window(self):
+        self.mock_client.chats.create.return_value.send_message.return_value.text = "Done"
+
+        result = self.manager.generate_and_execute("prefs", [], [], existing_events=[], days=2)
+
+        today = datetime.date.today()
+        self.assertEqual(result, "Done")
+        self.assertEqual(
+            self.calendar_manager.planning_window,
+            (today, today + datetime.timedelta(days=1)),
+        )
+        self.assertIsNotNone(self.manager.last_prompt)
+
+    def test_streaming_collects_text_and_usage(self):
+        metrics = MetricsRegistry()
+        self.manager.metrics = metrics
+        self.manager.stream = True
+        self.calendar_manager.add_event.return_value = "Event planned."
+        chat = self.mock_client.chats.create.return_value
+
+        def chunk(*parts, function_calls=None, usage=None):
+            response = MagicMock(usage_metadata=None, function_calls=function_calls)
+            response.candidates[0].content.parts = list(parts)
+            if usage:
+                response.usage_metadata = MagicMock(
+                    prompt_token_count=usage[0], candidates_token_count=usage[1],
+                    cached_content_token_count=None,
+                )
+            return response
+
+        call = MagicMock(args={"summary": "Gym"})
+        call.name = "add_event"
+        # The add_event call runs as soon as its chunk arrives; its result is sent back
+        chat.send_message_stream.side_effect = [
+            iter([
+                chunk(MagicMock(text="Planning ", thought=None), MagicMock(text="hmm", thought=True)),
+                chunk(MagicMock(text=None), function_calls=[call], usage=(100, 20)),
+            ]),
+            iter([chunk(MagicMock(text="ready.", thought=None), usage=(130, 5))]),
+        ]
+
+        with patch("builtins.print"):
+            result = self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+
+        self.assertEqual(result, "Planning ready.")
+        chat.send_message.assert_not_called()
+        self.calendar_manager.restart_plan.assert_called_once()
+        self.calendar_manager.add_event.assert_called_once_with(summary="Gym")
+        (result_part,) = chat.send_message_stream.call_args_list[1][0][0]
+        self.assertEqual(result_part.function_response.name, "add_event")
+        self.assertEqual(result_part.function_response.response, {"result": "Event planned."})
+        # Every request of the turn is counted, not only the last one
+        tokens = "secretary_gemini_tokens_total"
+        self.assertEqual(metrics.value(tokens, user="", model="main-model", kind="input"), 230)
+        self.assertEqual(metrics.value(tokens, user="", model="main-model", kind="output"), 25)
+
+    def test_records_token_usage_and_calls(self):
+        metrics = MetricsRegistry()
+        self.manager.metrics = metrics
+        self.manager.user_id = "user_1"
+        call = MagicMock(args={"summary": "Gym"})
+        call.name = "add_event"
+        rounds = []
+        for text, function_calls, input_tokens, output_tokens in (
+            (None, [call], 1000, 50),
+            ("Done", None, 1200, 300),
+        ):
+            response = MagicMock(text=text, function_calls=function_calls)
+            response.usage_metadata = MagicMock(
+                prompt_token_count=input_tokens, candidates_token_count=output_tokens,
+                cached_content_token_count=None,
+            )
+            rounds.append(response)
+        chat = self.mock_client.chats.create.return_value
+        chat.send_message.side_effect = rounds
+
+        result = self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+
+        self.assertEqual(result, "Done")
+        self.calendar_manager.add_event.assert_called_once_with(summary="Gym")
+        self.assertTrue(
+            self.mock_client.chats.create.call_args[1]["config"].automatic_function_calling.disable
+        )
+        tokens = "secretary_gemini_tokens_total"
+        self.assertEqual(metrics.value(tokens, user="user_1", model="main-model", kind="input"), 2200)
+        self.assertEqual(metrics.value(tokens, user="user_1", model="main-model", kind="output"), 350)
+        self.assertEqual(metrics.value(tokens, user="user_1", model="main-model", kind="cached"), 0)
+        self.assertEqual(metrics.value("secretary_api_calls_total", service="gemini", status="200"), 1)
+        self.assertEqual(
+            metrics.value(
+                "secretary_method_duration_seconds",
+                manager="GeminiManager", method="generate_and_execute", outcome="ok",
+            ),
+            1,
+        )
+
+    def _chat_for(self, failures):
+        """Makes chats.create return a chat that fails with `failures[model]` or succeeds."""
+        def create(model, config):
+            chat = MagicMock()
+            if model in failures:
+                chat.send_message.side_effect = Exception(failures[model])
+            else:
+                chat.send_message.return_value.text = f"Planned with {model}"
+            return chat
+        self.mock_client.chats.create.side_effect = create
+
+    @patch('src.gemini_manager.time.sleep')
+    def test_falls_back_immediately_on_overload(self, mock_sleep):
+        self._chat_for({"main-model": "503 UNAVAILABLE: The model is overloaded."})
+
+        result = self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+
+        self.assertEqual(result, "Planned with lite-model")
+        self.assertEqual(self.manager.last_model, "lite-model")
+        mock_sleep.assert_not_called()
+        self.assertFalse(self.health_tracker.is_healthy("main-model"))
+
+        # The next user goes straight to the healthy model
+        self.mock_client.chats.create.reset_mock()
+        self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+        self.assertEqual(self.mock_client.chats.create.call_args_list[0][1]["model"], "lite-model")
+
+    @patch('src.gemini_manager.time.sleep')
+    def test_sleeps_only_when_every_model_fails(self, mock_sleep):
+        self._chat_for({"main-model": "503 overloaded", "lite-model": "503 overloaded"})
+
+        result = self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+
+        self.assertIn("all models", result)
+        self.assertEqual(mock_sleep.call_count, 4)
+        self.assertEqual(mock_sleep.call_args_list[0][0][0], 15)
+
+    @patch('src.gemini_manager.time.sleep')
+    def test_deadline_stops_retries(self, mock_sleep):
+        self._chat_for({"main-model": "503 overloaded", "lite-model": "503 overloaded"})
+        self.manager.deadline = Deadline(10, name="user_1")
+
+        # The first backoff (15s) would overrun the deadline, so it is never slept
+        with self.assertRaises(DeadlineExceeded):
+            self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+        mock_sleep.assert_not_called()
+
+    def test_deadline_bounds_request_timeout(self):
+        self._chat_for({})
+        self.manager.deadline = Deadline(10, name="user_1")
+        self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+
+        config = self.mock_client.chats.create.call_args[1]["config"]
+        self.assertLessEqual(config.http_options.timeout, 10000)
+
+    def test_non_retryable_error_is_returned(self):
+        self._chat_for({"main-model": "400 INVALID_ARGUMENT"})
+        result = self.manager.generate_and_execute("prefs", [], [], existing_events=[])
+        self.assertEqual(result, "Error interacting with Gemini: 400 INVALID_ARGUMENT")
+
+    def test_health_tracker_order(self):
+        tracker = ModelHealthTracker()
+        tracker.mark_unavailable("a", 100)
+        tracker.mark_unavailable("b", 10)
+        self.assertEqual(tracker.order(["a", "b", "c"]), ["c", "b", "a"])
+        tracker.mark_healthy("a")
+        self.assertEqual(tracker.order(["a", "b", "c"]), ["a", "c", "b"])
+
+if __name__ == '__main__':
+    unittest.main()
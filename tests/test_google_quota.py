@@ -0,0 +1,106 @@
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+import httplib2
+from googleapiclient.errors import HttpError
+from src.google_quota import QuotaExecutor, error_reason, is_retryable
+
+
+def http_error(status, reason=None, headers=None):
+    body = {"error": {"code": status, "errors": [{"reason": reason}] if reason else []}}
+    resp = httplib2.Response({"status": str(status), **(headers or {})})
+    return HttpError(resp, json.dumps(body).encode("utf-8"))
+
+
+class TestGoogleQuota(unittest.TestCase):
+
+    def test_classifies_retryable_errors(self):
+        self.assertEqual(error_reason(http_error(403, "rateLimitExceeded")), "rateLimitExceeded")
+        self.assertTrue(is_retryable(http_error(403, "rateLimitExceeded")))
+        self.assertTrue(is_retryable(http_error(403, "userRateLimitExceeded")))
+        self.assertTrue(is_retryable(http_error(429)))
+        self.assertTrue(is_retryable(http_error(503)))
+        self.assertTrue(is_retryable(ConnectionResetError()))
+        self.assertFalse(is_retryable(http_error(403, "forbidden")))
+        self.assertFalse(is_retryable(http_error(403, "quotaExceeded")))
+        self.assertFalse(is_retryable(http_error(404, "notFound")))
+        self.assertFalse(is_retryable(ValueError()))
+
+    @patch("src.deadline.time.sleep")
+    def test_retries_transient_errors_with_backoff(self, mock_sleep):
+        request = MagicMock()
+        request.execute.side_effect = [
+            http_error(403, "rateLimitExceeded"), http_error(500), {"id": "e1"},
+        ]
+        executor = QuotaExecutor(base_delay=1.0)
+
+        self.assertEqual(executor.execute(request, write=True), {"id": "e1"})
+        self.assertEqual(request.execute.call_count, 3)
+        first, second = (call.args[0] for call in mock_sleep.call_args_list)
+        self.assertTrue(0.5 <= first <= 1.0)
+        self.assertTrue(1.0 <= second <= 2.0)
+        self.assertEqual(executor.stats["requests"], 3)
+        self.assertEqual(executor.stats["writes"], 1)
+        self.assertEqual(executor.stats["retries"], 2)
+
+    @patch("src.deadline.time.sleep")
+    def test_honours_retry_after(self, mock_sleep):
+        request = MagicMock()
+        request.execute.side_effect = [http_error(429, headers={"retry-after": "7"}), {}]
+        QuotaExecutor().execute(request)
+        mock_sleep.assert_called_once_with(7.0)
+
+    @patch("src.deadline.time.sleep")
+    def test_raises_permanent_errors_and_exhausted_retries(self, mock_sleep):
+        request = MagicMock()
+        request.execute.side_effect = http_error(404, "notFound")
+        executor = QuotaExecutor(max_retries=2)
+        with self.assertRaises(HttpError):
+            executor.execute(request)
+        self.assertEqual(request.execute.call_count, 1)
+
+        request.execute.side_effect = http_error(503)
+        with self.assertRaises(HttpError):
+            executor.execute(request)
+        self.assertEqual(request.execute.call_count, 4)
+        self.assertEqual(executor.stats["failures"], 2)
+
+    @patch("src.deadline.time.sleep")
+    def test_paces_writes_over_the_limit(self, mock_sleep):
+        request = MagicMock()
+        request.execute.return_value = {}
+        executor = QuotaExecutor(writes_per_minute=2)
+
+        for _ in range(3):
+            executor.execute(request, write=True)
+        executor.execute(request)  # Reads are never paced
+
+        mock_sleep.assert_called_once()
+        self.assertGreater(mock_sleep.call_args.args[0], 59)
+        self.assertGreater(executor.stats["throttled_seconds"], 59)
+
+    @patch("src.google_quota.time.monotonic", return_value=1000.0)
+    def test_bursts_are_paced_from_the_oldest_write_in_the_window(self, mock_monotonic):
+        # Writes arriving together (e.g. from several threads) each get their own slot
+        executor = QuotaExecutor(writes_per_minute=2)
+        waits = []
+        executor._wait = lambda seconds, action: waits.append(seconds)
+
+        for _ in range(6):
+            executor.execute(MagicMock(), write=True)
+
+        self.assertEqual(waits, [60, 60, 120, 120])
+        self.assertEqual(executor.stats["throttled_seconds"], 360)
+        self.assertEqual(executor.stats["writes"], 6)
+        self.assertLessEqual(len(executor._recent_writes), 2)
+
+    @patch("src.deadline.time.sleep")
+    def test_replaying_never_waits(self, mock_sleep):
+        request = MagicMock()
+        request.execute.side_effect = [http_error(500), {}]
+        QuotaExecutor(replaying=True).execute(request)
+        mock_sleep.assert_not_called()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,13 +1,19 @@
 import unittest
 from unittest.mock import MagicMock, patch
+import base64
 import datetime
 import sys
 import os
+import httplib2
+from googleapiclient.errors import HttpError
 
 # Add src to python path to import modules
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
-from src.google_service_manager import GoogleServiceManager
+from src.event_cache import EventCache
+from src.gemini_manager import GeminiManager
+from src.google_service_manager import GoogleServiceManager, build_gmail_queries, event_id_for
+from src.run_store import RunStore
 
 class TestGoogleServiceManager(unittest.TestCase):
 
@@ -18,6 +24,9 @@ class TestGoogleServiceManager(unittest.TestCase):
         mock_exists.return_value = True
         self.mock_service = MagicMock()
         mock_build.return_value = self.mock_service
+        self.mock_service.calendarList.return_value.list.return_value.execute.return_value = {
+            "items": [{"id": "secretary_bot_id", "summary": "secretary_bot"}]
+        }
 
         # Mock credentials
         mock_creds.from_authorized_user_file.return_value = MagicMock(valid=True)
@@ -70,5 +79,402 @@ class TestGoogleServiceManager(unittest.TestCase):
         else:
             print("Method clear_events_for_day not implemented yet.")
 
+    def test_fetch_events_for_day_returns_sorted_models(self):
+        self.mock_service.events.return_value.list.return_value.execute.side_effect = [
+            {"items": [{"id": "p1", "summary": "Lunch",
+                        "start": {"dateTime": "2023-10-27T12:00:00-07:00"},
+                        "end": {"dateTime": "2023-10-27T13:00:00-07:00"}}]},
+            {"items": [{"id": "b1", "summary": "Focus",
+                        "start": {"dateTime": "2023-10-27T09:00:00-07:00"},
+                        "end": {"dateTime": "2023-10-27T10:00:00-07:00"}}]},
+        ]
+
+        events = self.manager.fetch_events_for_day(datetime.date(2023, 10, 27))
+
+        self.assertEqual([e.id for e in events], ["b1", "p1"])
+        self.assertEqual(events[0].calendar_id, "secretary_bot_id")
+        self.assertEqual(events[1].calendar_id, "primary")
+
+    def test_fetch_events_for_range_paginates(self):
+        mock_list = self.mock_service.events.return_value.list
+        mock_list.return_value.execute.side_effect = [
+            {"items": [{"id": "p1", "summary": "A", "start": {"dateTime": "2023-10-27T09:00:00Z"},
+                        "end": {"dateTime": "2023-10-27T10:00:00Z"}}], "nextPageToken": "page2"},
+            {"items": [{"id": "p2", "summary": "B", "start": {"dateTime": "2023-10-29T09:00:00Z"},
+                        "end": {"dateTime": "2023-10-29T10:00:00Z"}}]},
+            {"items": []},
+        ]
+
+        events = self.manager.fetch_events_for_range(datetime.date(2023, 10, 27), datetime.date(2023, 10, 29))
+
+        self.assertEqual([e.id for e in events], ["p1", "p2"])
+        # Two pages for primary, one for the bot calendar
+        self.assertEqual(mock_list.call_count, 3)
+        self.assertEqual(mock_list.call_args_list[1][1]["pageToken"], "page2")
+
+    def test_add_event_respects_planning_window(self):
+        mock_insert = self.mock_service.events.return_value.insert
+        mock_insert.return_value.execute.return_value = {"id": "new1", "htmlLink": "link"}
+        self.manager.planning_window = (datetime.date(2023, 10, 27), datetime.date(2023, 10, 28))
+
+        result = self.manager.add_event("Late", "2023-10-29T09:00:00", "2023-10-29T10:00:00")
+        self.assertIn("outside the planning window", result)
+        mock_insert.assert_not_called()
+
+        result = self.manager.add_event("OK", "2023-10-28T09:00:00", "2023-10-28T10:00:00")
+        self.assertEqual(result, "Event created: link")
+        self.assertEqual(self.manager.created_event_ids, ["new1"])
+
+    @patch('src.deadline.time.sleep')
+    def test_add_event_retries_rate_limited_insert(self, mock_sleep):
+        rate_limited = HttpError(
+            httplib2.Response({"status": "403"}),
+            b'{"error": {"errors": [{"reason": "rateLimitExceeded"}]}}',
+        )
+        mock_insert = self.mock_service.events.return_value.insert
+        mock_insert.return_value.execute.side_effect = [rate_limited, {"id": "new1", "htmlLink": "link"}]
+
+        result = self.manager.add_event("Task", "2023-10-28T09:00:00", "2023-10-28T10:00:00")
+
+        self.assertEqual(result, "Event created: link")
+        mock_sleep.assert_called_once()
+        self.assertEqual(self.manager.executor.stats["retries"], 1)
+
+    def test_fetch_busy_blocks_single_query_and_merge(self):
+        self.mock_service.calendarList.return_value.list.return_value.execute.return_value = {
+            "items": [
+                {"id": "me@example.com", "primary": True, "selected": True},
+                {"id": "secretary_bot_id", "selected": True},
+                {"id": "family", "selected": True},
+                {"id": "work", "selected": True},
+                {"id": "hidden", "selected": False},
+            ]
+        }
+        mock_query = self.mock_service.freebusy.return_value.query
+        mock_query.return_value.execute.return_value = {
+            "calendars": {
+                "family": {"busy": [{"start": "2023-10-27T16:00:00Z", "end": "2023-10-27T17:00:00Z"}]},
+                "work": {"busy": [
+                    {"start": "2023-10-27T16:30:00Z", "end": "2023-10-27T18:00:00Z"},
+                    {"start": "2023-10-27T20:00:00Z", "end": "2023-10-27T21:00:00Z"},
+                ]},
+            }
+        }
+
+        blocks = self.manager.fetch_busy_blocks(datetime.date(2023, 10, 27), datetime.date(2023, 10, 27))
+
+        mock_query.assert_called_once()
+        items = mock_query.call_args[1]["body"]["items"]
+        self.assertEqual(items, [{"id": "family"}, {"id": "work"}])
+        self.assertEqual(len(blocks), 2)
+        first_start = datetime.datetime.fromisoformat(blocks[0].start)
+        first_end = datetime.datetime.fromisoformat(blocks[0].end)
+        self.assertEqual(first_end - first_start, datetime.timedelta(hours=2))
+
+    def test_clear_events_in_window_keeps_events_already_started(self):
+        self.mock_service.events.return_value.list.return_value.execute.return_value = {
+            "items": [
+                {"id": "running", "start": {"dateTime": "2023-10-27T13:00:00+00:00"}},
+                {"id": "later", "start": {"dateTime": "2023-10-27T15:00:00+00:00"}},
+            ]
+        }
+        mock_delete = self.mock_service.events.return_value.delete
+        start = datetime.datetime(2023, 10, 27, 14, 0, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2023, 10, 27, 23, 59, tzinfo=datetime.timezone.utc)
+
+        self.manager.clear_events_in_window(start, end)
+
+        mock_delete.assert_called_once_with(calendarId="secretary_bot_id", eventId="later")
+
+    def test_event_ids_are_deterministic(self):
+        day = datetime.date(2023, 10, 27)
+        event_id = event_id_for("user_1", day, "Write report")
+        self.assertEqual(event_id, event_id_for("user_1", day, "  write   REPORT "))
+        self.assertNotEqual(event_id, event_id_for("user_2", day, "Write report"))
+        self.assertNotEqual(event_id, event_id_for("user_1", day, "Write report", 1))
+        # Valid Calendar IDs use base32hex characters
+        self.assertRegex(event_id, r"^[0-9a-v]{5,1024}$")
+
+    def test_reconcile_sends_only_needed_writes(self):
+        events = self.mock_service.events.return_value
+        self.manager.start_plan("user_1")
+        self.manager.add_event("Same", "2023-10-27T09:00:00+00:00", "2023-10-27T10:00:00+00:00")
+        self.manager.add_event("Moved", "2023-10-27T11:00:00+00:00", "2023-10-27T12:00:00+00:00")
+        self.manager.add_event("New", "2023-10-27T13:00:00+00:00", "2023-10-27T14:00:00+00:00")
+        events.insert.assert_not_called()
+
+        day = datetime.date(2023, 10, 27)
+        same_id = event_id_for("user_1", day, "Same")
+        moved_id = event_id_for("user_1", day, "Moved")
+        new_id = event_id_for("user_1", day, "New")
+        events.list.return_value.execute.return_value = {
+            "items": [
+                {"id": same_id, "summary": "Same",
+                 "start": {"dateTime": "2023-10-27T11:00:00+02:00"},
+                 "end": {"dateTime": "2023-10-27T12:00:00+02:00"}},
+                {"id": moved_id, "summary": "Moved",
+                 "start": {"dateTime": "2023-10-27T15:00:00+00:00"},
+                 "end": {"dateTime": "2023-10-27T16:00:00+00:00"}},
+                {"id": "dropped", "summary": "Dropped",
+                 "start": {"dateTime": "2023-10-27T17:00:00+00:00"},
+                 "end": {"dateTime": "2023-10-27T18:00:00+00:00"}},
+                {"id": "gone", "status": "cancelled",
+                 "start": {"dateTime": "2023-10-27T17:00:00+00:00"}},
+            ]
+        }
+
+        start = datetime.datetime(2023, 10, 27, 0, 0, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2023, 10, 27, 23, 59, tzinfo=datetime.timezone.utc)
+        counts = self.manager.reconcile_plan(start, end)
+
+        self.assertEqual(counts, {"inserted": 1, "patched": 1, "deleted": 1, "unchanged": 1})
+        self.assertEqual(events.insert.call_args[1]["body"]["id"], new_id)
+        self.assertEqual(events.patch.call_args[1]["eventId"], moved_id)
+        events.delete.assert_called_once_with(calendarId="secretary_bot_id", eventId="dropped")
+        self.assertTrue(events.list.call_args[1]["showDeleted"])
+        self.assertEqual(self.manager.created_event_ids, [new_id])
+        self.assertIsNone(self.manager.planned_events)
+
+    def test_write_through_writes_while_planning(self):
+        events = self.mock_service.events.return_value
+        day = datetime.date(2023, 10, 27)
+        same_id = event_id_for("user_1", day, "Same")
+        events.list.return_value.execute.return_value = {
+            "items": [
+                {"id": same_id, "summary": "Same",
+                 "start": {"dateTime": "2023-10-27T09:00:00+00:00"},
+                 "end": {"dateTime": "2023-10-27T10:00:00+00:00"}},
+                {"id": "dropped", "summary": "Dropped",
+                 "start": {"dateTime": "2023-10-27T17:00:00+00:00"},
+                 "end": {"dateTime": "2023-10-27T18:00:00+00:00"}},
+            ]
+        }
+        start = datetime.datetime(2023, 10, 27, 0, 0, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2023, 10, 27, 23, 59, tzinfo=datetime.timezone.utc)
+        self.manager.start_plan("user_1", write_through=(start, end))
+
+        # An attempt that fails part way has already written its events
+        self.manager.add_event("Partial", "2023-10-27T11:00:00+00:00", "2023-10-27T12:00:00+00:00")
+        self.manager.restart_plan()
+        partial_id = event_id_for("user_1", day, "Partial")
+        self.assertEqual(events.insert.call_args[1]["body"]["id"], partial_id)
+
+        self.manager.add_event("Same", "2023-10-27T09:00:00+00:00", "2023-10-27T10:00:00+00:00")
+        self.manager.add_event("New", "2023-10-27T13:00:00+00:00", "2023-10-27T14:00:00+00:00")
+        counts = self.manager.reconcile_plan(start, end)
+
+        new_id = event_id_for("user_1", day, "New")
+        self.assertEqual(counts, {"inserted": 2, "patched": 0, "deleted": 2, "unchanged": 1})
+        self.assertEqual(events.insert.call_args[1]["body"]["id"], new_id)
+        self.assertEqual(
+            sorted(call[1]["eventId"] for call in events.delete.call_args_list),
+            sorted(["dropped", partial_id]),
+        )
+        # The window was listed once, when planning started
+        self.assertEqual(events.list.call_count, 1)
+        self.assertIsNone(self.manager.planned_events)
+
+    def test_conflicting_event_ids_are_only_reused_when_deleted(self):
+        events = self.mock_service.events.return_value
+        events.list.return_value.execute.return_value = {"items": []}
+        conflict = HttpError(httplib2.Response({"status": 409}), b"{}")
+        events.insert.return_value.execute.side_effect = [conflict, None, conflict]
+        day = datetime.date(2023, 10, 27)
+        gym_id = event_id_for("user_1", day, "Gym")
+        errand_id = event_id_for("user_1", day, "Errand")
+        # This morning's gym session (before the replan window) is live; the errand was deleted
+        events.get.return_value.execute.side_effect = [
+            {"id": gym_id, "status": "confirmed"},
+            {"id": errand_id, "status": "cancelled"},
+        ]
+        start = datetime.datetime(2023, 10, 27, 12, 0, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2023, 10, 27, 23, 59, tzinfo=datetime.timezone.utc)
+        self.manager.start_plan("user_1", write_through=(start, end))
+        self.manager.add_event("Gym", "2023-10-27T17:00:00+00:00", "2023-10-27T18:00:00+00:00")
+        self.manager.add_event("Errand", "2023-10-27T19:00:00+00:00", "2023-10-27T20:00:00+00:00")
+        counts = self.manager.reconcile_plan(start, end)
+
+        second_gym_id = event_id_for("user_1", day, "Gym", 1)
+        self.assertEqual(counts["inserted"], 2)
+        self.assertEqual(
+            [call[1]["body"]["id"] for call in events.insert.call_args_list],
+            [gym_id, second_gym_id, errand_id],
+        )
+        # Only the deleted event is restored in place; the morning session is never moved
+        events.update.assert_called_once()
+        self.assertEqual(events.update.call_args[1]["eventId"], errand_id)
+        self.assertEqual(self.manager.created_event_ids, [second_gym_id, errand_id])
+
+    def test_write_through_failure_is_raised_by_reconcile(self):
+        events = self.mock_service.events.return_value
+        events.list.return_value.execute.return_value = {"items": []}
+        events.insert.return_value.execute.side_effect = HttpError(
+            httplib2.Response({"status": 400}), b"{}"
+        )
+        start = datetime.datetime(2023, 10, 27, 0, 0, tzinfo=datetime.timezone.utc)
+        end = datetime.datetime(2023, 10, 27, 23, 59, tzinfo=datetime.timezone.utc)
+        self.manager.start_plan("user_1", write_through=(start, end))
+        self.manager.add_event("New", "2023-10-27T13:00:00+00:00", "2023-10-27T14:00:00+00:00")
+
+        with self.assertRaises(HttpError):
+            self.manager.reconcile_plan(start, end)
+        events.delete.assert_not_called()
+        self.assertIsNone(self.manager.planned_events)
+
+    @patch('src.gemini_manager.genai')
+    def test_failed_stream_rolls_back_written_events(self, mock_genai):
+        events = self.mock_service.events.return_value
+        day = datetime.date.today()
+        at = lambda hour: f"{day}T{hour:02d}:00:00+00:00"
+        moved_id = event_id_for("user_1", day, "Moved")
+        moved = {"id": moved_id, "summary": "Moved",
+                 "start": {"dateTime": at(15)}, "end": {"dateTime": at(16)}}
+        events.list.return_value.execute.return_value = {"items": [moved]}
+        start = datetime.datetime.combine(day, datetime.time.min, datetime.timezone.utc)
+        end = datetime.datetime.combine(day, datetime.time.max, datetime.timezone.utc)
+        self.manager.start_plan("user_1", write_through=(start, end))
+
+        def failing_stream(prompt):
+            # Each function call runs as its chunk arrives, then the stream breaks
+            self.manager.add_event("New", at(9), at(10))
+            self.manager.add_event("Moved", at(11), at(12))
+            yield MagicMock()
+            raise Exception("400 INVALID_ARGUMENT")
+
+        chat = mock_genai.Client.return_value.chats.create.return_value
+        chat.send_message_stream.side_effect = failing_stream
+        gemini = GeminiManager("key", self.manager, models=["main-model"], stream=True)
+        with patch("builtins.print"):
+            result = gemini.generate_and_execute(
+                "prefs", [], [], existing_events=[], prompt="P"
+            )
+            self.assertTrue(result.startswith("Error interacting with Gemini"))
+            # Waits for the writes made while streaming, then undoes them
+            self.assertTrue(self.manager.discard_plan())
+
+        self.assertEqual(events.insert.call_count, 1)
+        events.patch.assert_called_once()
+        new_id = event_id_for("user_1", day, "New")
+        events.delete.assert_called_once_with(calendarId="secretary_bot_id", eventId=new_id)
+        events.update.assert_called_once_with(
+            calendarId="secretary_bot_id", eventId=moved_id, body=moved
+        )
+        self.assertEqual(self.manager.created_event_ids, [])
+        self.assertIsNone(self.manager.planned_events)
+
+    def _gmail_message(self, message_id, sender, text):
+        return {
+            "id": message_id,
+            "threadId": f"thread-{message_id}",
+            "internalDate": "1700000000000",
+            "payload": {
+                "headers": [{"name": "From", "value": f"Someone <{sender}>"}],
+                "body": {"data": base64.urlsafe_b64encode(text.encode()).decode()},
+            },
+        }
+
+    def test_emails_are_streamed_one_message_at_a_time(self):
+        gmail = MagicMock()
+        self.manager.services["gmail"] = gmail
+        messages = gmail.users.return_value.messages.return_value
+        messages.list.return_value.execute.return_value = {
+            "messages": [{"id": "m1"}, {"id": "m2"}]
+        }
+        messages.get.return_value.execute.side_effect = [
+            self._gmail_message("m1", "a@example.com", "first"),
+            self._gmail_message("m2", "b@example.com", "second"),
+        ]
+
+        emails = self.manager.iter_emails_from_last_days(3)
+        first = next(emails)
+        self.assertEqual((first.sender, first.content), ("a@example.com", "first"))
+        self.assertEqual(messages.get.call_count, 1)
+        self.assertEqual([email.id for email in emails], ["m2"])
+
+    def test_gmail_queries_chunk_senders(self):
+        self.assertEqual(build_gmail_queries("label:TODOBOT"), ["label:TODOBOT"])
+        self.assertEqual(build_gmail_queries("label:TODOBOT", []), [])
+        self.assertEqual(
+            build_gmail_queries("label:TODOBOT", ["B@example.com", "a@example.com", "b@example.com"]),
+            ["label:TODOBOT from:(a@example.com OR b@example.com)"],
+        )
+
+        senders = [f"user{i:03d}@example.com" for i in range(100)]
+        queries = build_gmail_queries("label:TODOBOT", senders)
+        self.assertGreater(len(queries), 1)
+        for query in queries:
+            self.assertLessEqual(len(query), 1500)
+        joined = " ".join(queries)
+        self.assertTrue(all(sender in joined for sender in senders))
+
+    def test_email_listing_paginates_each_sender_query(self):
+        gmail = MagicMock()
+        self.manager.services["gmail"] = gmail
+        messages = gmail.users.return_value.messages.return_value
+        messages.list.return_value.execute.side_effect = [
+            {"messages": [{"id": "m1"}], "nextPageToken": "page2"},
+            {"messages": [{"id": "m2"}]},
+        ]
+        messages.get.return_value.execute.side_effect = [
+            self._gmail_message("m1", "a@example.com", "first"),
+            self._gmail_message("m2", "a@example.com", "second"),
+        ]
+
+        emails = list(self.manager.iter_emails_from_last_days(3, senders=["a@example.com"]))
+
+        self.assertEqual([email.id for email in emails], ["m1", "m2"])
+        self.assertEqual(messages.list.call_count, 2)
+        self.assertIn("from:(a@example.com)", messages.list.call_args_list[0][1]["q"])
+        self.assertEqual(messages.list.call_args_list[1][1]["pageToken"], "page2")
+
+    def test_failing_gmail_page_leaves_the_saved_mailbox_incomplete(self):
+        gmail = MagicMock()
+        self.manager.services["gmail"] = gmail
+        messages = gmail.users.return_value.messages.return_value
+        messages.list.return_value.execute.side_effect = [
+            {"messages": [{"id": "m1"}], "nextPageToken": "page2"},
+            HttpError(httplib2.Response({"status": "404"}), b'{"error": {"code": 404}}'),
+        ]
+        messages.get.return_value.execute.return_value = (
+            self._gmail_message("m1", "a@example.com", "first")
+        )
+        store = RunStore(":memory:")
+        run_id = store.start_run()
+
+        with self.assertRaises(HttpError):
+            list(store.save_mailbox(run_id, self.manager.iter_emails_from_last_days(3)))
+
+        self.assertIsNone(store.saved_mailbox(run_id))
+        store.close()
+
+    def test_event_cache_syncs_incrementally_and_resyncs_on_410(self):
+        self.manager.event_cache = EventCache()
+        self.manager.bot_calendar_id = "primary"
+        mock_list = self.mock_service.events.return_value.list
+        today = datetime.date.today()
+        start = datetime.datetime.combine(today, datetime.time(9)).astimezone().isoformat()
+        end = datetime.datetime.combine(today, datetime.time(10)).astimezone().isoformat()
+        gone = HttpError(httplib2.Response({"status": "410"}), b'{"error": {"code": 410}}')
+        mock_list.return_value.execute.side_effect = [
+            {"items": [{"id": "e1", "summary": "Gym", "start": {"dateTime": start}, "end": {"dateTime": end}}],
+             "nextSyncToken": "sync1"},
+            {"items": [{"id": "e1", "status": "cancelled"}], "nextSyncToken": "sync2"},
+            gone,
+            {"items": [], "nextSyncToken": "sync3"},
+        ]
+
+        events = self.manager.fetch_events_for_range(today, today)
+        self.assertEqual([event.summary for event in events], ["Gym"])
+        self.assertIn("timeMin", mock_list.call_args_list[0][1])
+
+        self.assertEqual(self.manager.fetch_events_for_range(today, today), [])
+        self.assertEqual(mock_list.call_args_list[1][1]["syncToken"], "sync1")
+        self.assertNotIn("timeMin", mock_list.call_args_list[1][1])
+
+        self.manager.fetch_events_for_range(today, today)
+        self.assertEqual(mock_list.call_args_list[2][1]["syncToken"], "sync2")
+        self.assertIn("timeMin", mock_list.call_args_list[3][1])
+        self.assertEqual(self.manager.event_cache.calendar("primary").sync_token, "sync3")
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrent.futures import ThreadPoolExecutor
+from src.http_transport import PooledHttp, SharedTransport, format_stats
+
+class _OkHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive
+
+    def do_GET(self):
+        body = b"ok"
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+class TestPooledHttp(unittest.TestCase):
+
+    def setUp(self):
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def test_connections_are_reused(self):
+        http = PooledHttp(size=2, timeout=5)
+        for _ in range(5):
+            response, content = http.request(self.url)
+            self.assertEqual((response.status, content), (200, b"ok"))
+
+        self.assertEqual(http.requests_sent, 5)
+        self.assertEqual(http.connections_opened, 1)
+        http.shutdown()
+
+    def test_concurrent_requests_never_exceed_the_pool(self):
+        http = PooledHttp(size=2, timeout=5)
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda _: http.request(self.url)[1], range(12)))
+
+        self.assertEqual(results, [b"ok"] * 12)
+        self.assertLessEqual(http.connections_opened, 2)
+        http.shutdown()
+
+class TestSharedTransport(unittest.TestCase):
+
+    def test_stats_and_formatting(self):
+        transport = SharedTransport(pool_size=2, timeout=5)
+        transport.http.requests_sent, transport.http.connections_opened = 10, 2
+        stats = transport.stats()
+        self.assertEqual(stats["google_api"], {"requests": 10, "connections": 2})
+        self.assertIn("google_api: 10 requests over 2 connections (80% reused)", format_stats(stats))
+        self.assertIn("oauth: 0 requests over 0 connections (n/a reused)", format_stats(stats))
+        transport.close()
+
+    def test_oauth_session_connections_are_counted(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _OkHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        transport = SharedTransport(pool_size=2, timeout=5)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/"
+            for _ in range(4):
+                self.assertEqual(transport.session.get(url, timeout=5).text, "ok")
+            self.assertEqual(transport.stats()["oauth"], {"requests": 4, "connections": 1})
+        finally:
+            transport.close()
+            server.shutdown()
+            server.server_close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,156 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import base64
+import json
+import threading
+import urllib.request
+from src.metrics import MetricsRegistry
+from src.listener import Debouncer, ListenerServer, NotificationRouter, WatchRenewer
+
+class TestDebouncer(unittest.TestCase):
+
+    def test_burst_fires_once_per_key(self):
+        fired = []
+        done = threading.Event()
+
+        def callback(key, first_seen):
+            fired.append(key)
+            if len(fired) == 2:
+                done.set()
+
+        debouncer = Debouncer(callback, delay=0.05)
+        for _ in range(5):
+            debouncer.notify("user_1")
+        debouncer.notify("user_2")
+
+        self.assertTrue(done.wait(2))
+        self.assertEqual(sorted(fired), ["user_1", "user_2"])
+
+class TestNotificationRouter(unittest.TestCase):
+
+    def setUp(self):
+        self.on_calendar_change = MagicMock()
+        self.on_mailbox_change = MagicMock()
+        self.router = NotificationRouter(
+            self.on_calendar_change, self.on_mailbox_change, gmail_token="push-secret"
+        )
+        self.router.register_channel("chan-1", "user_1", token="secret")
+
+    def test_calendar_notification(self):
+        headers = {"X-Goog-Channel-ID": "chan-1", "X-Goog-Channel-Token": "secret",
+                   "X-Goog-Resource-State": "exists"}
+        self.assertEqual(self.router.handle_calendar(headers), "user_1")
+        self.on_calendar_change.assert_called_once_with("user_1")
+
+    def test_calendar_notification_ignored(self):
+        self.assertIsNone(self.router.handle_calendar(
+            {"X-Goog-Channel-ID": "chan-1", "X-Goog-Channel-Token": "wrong", "X-Goog-Resource-State": "exists"}))
+        self.assertIsNone(self.router.handle_calendar(
+            {"X-Goog-Channel-ID": "chan-1", "X-Goog-Channel-Token": "secret", "X-Goog-Resource-State": "sync"}))
+        self.assertIsNone(self.router.handle_calendar({"X-Goog-Channel-ID": "unknown"}))
+        self.on_calendar_change.assert_not_called()
+
+    def test_gmail_notification(self):
+        data = base64.b64encode(json.dumps({"emailAddress": "admin@example.com", "historyId": 1234}).encode())
+        body = json.dumps({"message": {"data": data.decode()}}).encode()
+
+        self.assertEqual(self.router.handle_gmail(body, "push-secret"), "1234")
+        self.on_mailbox_change.assert_called_once_with("1234")
+        self.assertIsNone(self.router.handle_gmail(b"not json", "push-secret"))
+
+    def test_gmail_notification_needs_the_token(self):
+        data = base64.b64encode(json.dumps({"historyId": 1234}).encode())
+        body = json.dumps({"message": {"data": data.decode()}}).encode()
+
+        self.assertIsNone(self.router.handle_gmail(body))
+        self.assertIsNone(self.router.handle_gmail(body, "wrong"))
+        # Without a configured token every push is ignored
+        self.router.gmail_token = None
+        self.assertIsNone(self.router.handle_gmail(body, "push-secret"))
+        self.on_mailbox_change.assert_not_called()
+
+    def test_unregistered_channel_is_ignored(self):
+        self.router.unregister_channel("chan-1")
+        headers = {"X-Goog-Channel-ID": "chan-1", "X-Goog-Channel-Token": "secret",
+                   "X-Goog-Resource-State": "exists"}
+        self.assertIsNone(self.router.handle_calendar(headers))
+
+class TestWatchRenewer(unittest.TestCase):
+
+    def test_renews_shortly_before_expiry(self):
+        expirations = iter([10_000_000, 20_000_000])
+        renew = MagicMock(side_effect=lambda: {"expiration": str(next(expirations))})
+        renewer = WatchRenewer(renew_before=3600)
+
+        self.assertEqual(renewer.add("user_1", renew), {"expiration": "10000000"})
+        self.assertEqual(renewer.renew_due(now=10_000 - 3601), [])
+        self.assertEqual(renewer.seconds_until_due(now=10_000 - 3600 - 120), 120)
+        self.assertEqual(renewer.renew_due(now=10_000 - 3599), ["user_1"])
+        self.assertEqual(renew.call_count, 2)
+        # The next renewal follows the new expiration
+        self.assertEqual(renewer.renew_due(now=10_000), [])
+
+    def test_failed_renewal_is_retried(self):
+        renew = MagicMock(return_value={"expiration": "1000"})
+        renewer = WatchRenewer(renew_before=60)
+        renewer.add("admin", renew)
+        renew.side_effect = Exception("backend error")
+
+        with patch("builtins.print"):
+            self.assertEqual(renewer.renew_due(now=1000), [])
+        renew.side_effect = None
+        renew.return_value = {"expiration": "999999999"}
+        self.assertEqual(renewer.renew_due(now=1000), ["admin"])
+        # Never checks more often than the minimum interval
+        renewer.add("soon", MagicMock(return_value={"expiration": "0"}))
+        self.assertEqual(renewer.seconds_until_due(now=1000), 60)
+
+class TestListenerServer(unittest.TestCase):
+
+    def test_stand_in_receiver(self):
+        received = threading.Event()
+        router = NotificationRouter(lambda user_id: received.set())
+        router.register_channel("chan-1", "user_1")
+        server = ListenerServer(router, port=0)
+        server.start()
+        try:
+            request = urllib.request.Request(
+                f"{server.address}/calendar", data=b"", method="POST",
+                headers={"X-Goog-Channel-ID": "chan-1", "X-Goog-Resource-State": "exists"},
+            )
+            with urllib.request.urlopen(request, timeout=5) as response:
+                self.assertEqual(response.status, 200)
+            self.assertTrue(received.wait(2))
+        finally:
+            server.stop()
+
+    def test_gmail_push_token_from_query(self):
+        received = []
+        router = NotificationRouter(MagicMock(), received.append, gmail_token="push-secret")
+        server = ListenerServer(router, port=0)
+        server.start()
+        data = base64.b64encode(json.dumps({"historyId": 7}).encode()).decode()
+        body = json.dumps({"message": {"data": data}}).encode()
+        try:
+            for path in ("/gmail", "/gmail?token=wrong", "/gmail?token=push-secret"):
+                request = urllib.request.Request(f"{server.address}{path}", data=body, method="POST")
+                with urllib.request.urlopen(request, timeout=5) as response:
+                    self.assertEqual(response.status, 200)
+        finally:
+            server.stop()
+        self.assertEqual(received, ["7"])
+
+    def test_serves_metrics(self):
+        metrics = MetricsRegistry()
+        metrics.inc("secretary_api_calls_total", service="calendar", status="200")
+        server = ListenerServer(NotificationRouter(lambda user_id: None), port=0, metrics=metrics)
+        server.start()
+        try:
+            with urllib.request.urlopen(f"{server.address}/metrics", timeout=5) as response:
+                body = response.read().decode("utf-8")
+            self.assertIn('secretary_api_calls_total{service="calendar",status="200"} 1', body)
+        finally:
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import os
+import tempfile
+import unittest
+from src.metrics import MetricsRegistry, instrumented, shard_textfile_path
+
+
+class Manager:
+    def __init__(self, metrics):
+        self.metrics = metrics
+
+    @instrumented
+    def work(self, fail=False):
+        if fail:
+            raise ValueError("failed")
+        return "done"
+
+
+class TestMetrics(unittest.TestCase):
+
+    def test_renders_counters_in_text_format(self):
+        metrics = MetricsRegistry()
+        metrics.inc("secretary_api_calls_total", service="calendar", status="200")
+        metrics.inc("secretary_api_calls_total", service="calendar", status="200")
+        metrics.inc("secretary_sleep_seconds_total", 1.5, service="gemini", reason="retry")
+
+        text = metrics.render()
+        self.assertIn("# TYPE secretary_api_calls_total counter", text)
+        self.assertIn('secretary_api_calls_total{service="calendar",status="200"} 2', text)
+        self.assertIn('secretary_sleep_seconds_total{reason="retry",service="gemini"} 1.5', text)
+
+    def test_histogram_buckets_are_cumulative(self):
+        metrics = MetricsRegistry(buckets=(1, 5))
+        for value in (0.5, 2, 10):
+            metrics.observe("secretary_method_duration_seconds", value, method="m")
+
+        text = metrics.render()
+        self.assertIn('secretary_method_duration_seconds_bucket{method="m",le="1.0"} 1', text)
+        self.assertIn('secretary_method_duration_seconds_bucket{method="m",le="5.0"} 2', text)
+        self.assertIn('secretary_method_duration_seconds_bucket{method="m",le="+Inf"} 3', text)
+        self.assertIn('secretary_method_duration_seconds_sum{method="m"} 12.5', text)
+        self.assertIn('secretary_method_duration_seconds_count{method="m"} 3', text)
+
+    def test_instrumented_times_methods_by_outcome(self):
+        metrics = MetricsRegistry()
+        manager = Manager(metrics)
+        manager.work()
+        with self.assertRaises(ValueError):
+            manager.work(fail=True)
+
+        name = "secretary_method_duration_seconds"
+        self.assertEqual(metrics.value(name, manager="Manager", method="work", outcome="ok"), 1)
+        self.assertEqual(metrics.value(name, manager="Manager", method="work", outcome="error"), 1)
+
+    def test_shard_textfiles_are_labelled(self):
+        metrics = MetricsRegistry()
+        metrics.const_labels["shard"] = "1"
+        metrics.inc("secretary_api_retries_total", service="gmail")
+        self.assertEqual(shard_textfile_path("out/metrics.prom", 1), "out/metrics.shard1.prom")
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "metrics.prom")
+            metrics.write_textfile(path)
+            with open(path) as f:
+                self.assertIn('secretary_api_retries_total{service="gmail",shard="1"} 1', f.read())
+
+
+if __name__ == '__main__':
+    unittest.main()
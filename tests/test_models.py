@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import MagicMock
+import datetime
+from src.models import (
+    CalendarEvent,
+    Email,
+    Task,
+    render_emails,
+    render_events,
+    render_tasks,
+)
+
+class TestModels(unittest.TestCase):
+
+    def test_task_from_todoist_and_render(self):
+        mock_task = MagicMock()
+        mock_task.id = "t1"
+        mock_task.content = "Write report"
+        mock_task.description = "Quarterly"
+        mock_task.project_id = "p1"
+        mock_task.priority = 4
+        mock_task.labels = ["work"]
+        mock_task.due.date = datetime.datetime(2023, 10, 27, 9, 30)
+        mock_task.duration = None
+
+        task = Task.from_todoist(mock_task)
+
+        self.assertEqual(task.priority, 4)
+        self.assertEqual(task.labels, ("work",))
+        self.assertEqual(task.render(), "- Write report (Quarterly) (09:30 AM)\n")
+
+    def test_date_only_due_has_no_time(self):
+        task = Task(id="t1", content="Pay rent", due=datetime.date(2023, 10, 27))
+        self.assertEqual(task.render(), "- Pay rent\n")
+
+    def test_round_trip_serialization(self):
+        task = Task(id="t1", content="A", labels=("x",), due=datetime.datetime(2023, 1, 2, 3, 4))
+        event = CalendarEvent(id="e1", summary="S", start="2023-01-02T03:04:00Z", end="2023-01-02T04:04:00Z")
+        email = Email(id="m1", sender="a@example.com", date="Mon", content="hi", thread_id="th1")
+
+        self.assertEqual(Task.from_dict(task.to_dict()), task)
+        self.assertEqual(CalendarEvent.from_dict(event.to_dict()), event)
+        self.assertEqual(Email.from_dict(email.to_dict()), email)
+
+    def test_slots(self):
+        task = Task(id="t1", content="A")
+        with self.assertRaises(AttributeError):
+            task.unknown = 1
+
+    def test_render_sections(self):
+        self.assertEqual(render_tasks([]), "No overdue or due today tasks found.")
+
+        date = datetime.date(2023, 10, 27)
+        self.assertEqual(render_events([], date), "No events found for 2023-10-27.")
+        event = CalendarEvent(id="e1", summary="Gym", start="s", end="e", location="Club", description="x" * 120)
+        rendered = render_events([event], date)
+        self.assertTrue(rendered.startswith("Events for 2023-10-27:\n- Gym\n  Start: s\n  End: e\n  Location: Club\n"))
+        self.assertIn("  Description: " + "x" * 100 + "...\n\n", rendered)
+
+        emails = [Email(id="m1", sender="a", date="D1", content="C1"), Email(id="m2", sender="a", date="D2", content="C2")]
+        self.assertEqual(render_emails(emails), "Date: D1\nContent: C1\n\nDate: D2\nContent: C2\n\n")
+
+if __name__ == '__main__':
+    unittest.main()
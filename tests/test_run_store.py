@@ -0,0 +1,151 @@
+import sqlite3
+import tempfile
+import unittest
+import datetime
+from src.models import Email, Task
+from src.run_store import RunStore, timed_stage
+
+class TestRunStore(unittest.TestCase):
+
+    def setUp(self):
+        self.store = RunStore(":memory:")
+
+    def tearDown(self):
+        self.store.close()
+
+    def test_record_and_history(self):
+        run_id = self.store.start_run()
+        date = datetime.date(2023, 10, 27)
+
+        self.store.record(run_id, "user_1", date, tasks=[Task(id="t1", content="A")], emails=[])
+        self.store.record(run_id, "user_1", date, prompt="P", response="R",
+                          event_ids=["e1"], timings={"gemini": 1.5})
+        self.store.finish_run(run_id)
+
+        history = self.store.history("user_1")
+        self.assertEqual(len(history), 1)
+        record = history[0]
+        self.assertEqual(record["tasks"][0]["content"], "A")
+        self.assertEqual(record["prompt"], "P")
+        self.assertEqual(record["event_ids"], ["e1"])
+        self.assertEqual(record["timings"], {"gemini": 1.5})
+        self.assertEqual(len(self.store.records_for_date(date)), 1)
+
+    def test_unknown_column_is_rejected(self):
+        run_id = self.store.start_run()
+        with self.assertRaises(ValueError):
+            self.store.record(run_id, "user_1", datetime.date.today(), bogus="x")
+
+    def test_evict_by_age(self):
+        old_run = self.store.start_run()
+        self.store.conn.execute("UPDATE runs SET started_at = '2000-01-01T00:00:00+00:00' WHERE run_id = ?", (old_run,))
+        self.store.record(old_run, "user_1", datetime.date(2000, 1, 1), prompt="old")
+        new_run = self.store.start_run()
+        self.store.record(new_run, "user_1", datetime.date.today(), prompt="new")
+
+        self.assertEqual(self.store.evict(max_age_days=30), 1)
+        self.assertEqual([r["prompt"] for r in self.store.history("user_1")], ["new"])
+
+    def test_evict_keeps_newest_per_user(self):
+        for day in range(1, 4):
+            run_id = self.store.start_run()
+            self.store.record(run_id, "user_1", datetime.date(2023, 10, day), prompt=str(day))
+            self.store.finish_run(run_id)
+
+        self.assertEqual(self.store.evict(max_age_days=None, max_runs_per_user=2), 1)
+        self.assertEqual([r["prompt"] for r in self.store.history("user_1")], ["3", "2"])
+
+    def test_checkpoints(self):
+        run_id = self.store.start_run()
+        today = datetime.date.today()
+        self.assertIsNone(self.store.checkpoint(run_id, "user_1"))
+        # Records without a stage (e.g. skipped users) are not checkpoints
+        self.store.record(run_id, "user_1", today, response="Skipped: deadline")
+        self.assertIsNone(self.store.checkpoint(run_id, "user_1"))
+
+        self.store.record(run_id, "user_1", today, tasks=[Task(id="t1", content="A")],
+                          events="Error fetching events", emails=[], busy_blocks=[],
+                          window_start="2023-10-27T09:00:00+00:00", stage="inputs")
+        self.store.record(run_id, "user_1", today, response="R",
+                          plan={"e1": {"id": "e1", "summary": "A"}}, stage="gemini")
+        checkpoint = self.store.checkpoint(run_id, "user_1")
+        self.assertEqual(checkpoint["stage"], "gemini")
+        self.assertEqual(checkpoint["tasks"][0]["content"], "A")
+        self.assertEqual(checkpoint["events"], "Error fetching events")
+        self.assertEqual(checkpoint["plan"]["e1"]["summary"], "A")
+
+        with self.assertRaises(ValueError):
+            self.store.record(run_id, "user_1", today, stage="bogus")
+
+    def test_unfinished_run(self):
+        self.assertIsNone(self.store.unfinished_run())
+        first = self.store.start_run()
+        self.store.conn.execute(
+            "UPDATE runs SET started_at = '2000-01-01T00:00:00+00:00' WHERE run_id = ?", (first,)
+        )
+        second = self.store.start_run()
+        self.assertEqual(self.store.unfinished_run()["run_id"], second)
+        self.assertEqual(self.store.unfinished_run(first)["run_id"], first)
+
+        self.store.finish_run(second)
+        self.assertEqual(self.store.unfinished_run()["run_id"], first)
+        self.assertIsNone(self.store.unfinished_run(second))
+        self.assertIsNone(self.store.unfinished_run("missing"))
+
+    def test_saved_mailbox(self):
+        run_id = self.store.start_run()
+        emails = [Email(id=str(i), sender="a@example.com", date="d") for i in range(250)]
+
+        # An interrupted fetch is not a saved mailbox
+        partial = self.store.save_mailbox(run_id, iter(emails))
+        next(partial)
+        self.assertIsNone(self.store.saved_mailbox(run_id))
+
+        # Neither is a fetch that failed part way
+        def failing_fetch():
+            yield emails[0]
+            raise OSError("connection reset")
+
+        with self.assertRaises(OSError):
+            list(self.store.save_mailbox(run_id, failing_fetch()))
+        self.assertIsNone(self.store.saved_mailbox(run_id))
+
+        self.assertEqual(list(self.store.save_mailbox(run_id, iter(emails))), emails)
+        self.assertEqual(list(self.store.saved_mailbox(run_id)), emails)
+        # Mailboxes are deleted with their run
+        self.assertEqual(self.store.evict(max_age_days=-1), 0)
+        self.assertEqual(
+            self.store.conn.execute("SELECT COUNT(*) FROM run_emails").fetchone()[0], 0
+        )
+
+    def test_adds_columns_to_old_databases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = f"{directory}/runs.db"
+            conn = sqlite3.connect(path)
+            conn.executescript("""
+                CREATE TABLE runs (run_id TEXT PRIMARY KEY, started_at TEXT NOT NULL,
+                                   finished_at TEXT);
+                CREATE TABLE user_runs (
+                    run_id TEXT NOT NULL, user_id TEXT NOT NULL, run_date TEXT NOT NULL,
+                    tasks TEXT, events TEXT, emails TEXT, prompt TEXT, response TEXT,
+                    event_ids TEXT, timings TEXT, updated_at TEXT NOT NULL,
+                    PRIMARY KEY (run_id, user_id)
+                );
+            """)
+            conn.close()
+
+            store = RunStore(path)
+            run_id = store.start_run()
+            store.record(run_id, "user_1", datetime.date.today(), stage="written")
+            self.assertEqual(store.checkpoint(run_id, "user_1")["stage"], "written")
+            self.assertIsNone(store.saved_mailbox(run_id))
+            store.close()
+
+    def test_timed_stage(self):
+        timings = {}
+        with timed_stage(timings, "stage"):
+            pass
+        self.assertIn("stage", timings)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import os
+import sys
+import tempfile
+from src.models import Email
+from src.sharding import (
+    MAIN_SCRIPT,
+    load_emails,
+    merge_summaries,
+    parse_shard,
+    run_local_shards,
+    save_emails,
+    shard_for,
+    strip_option,
+)
+
+class TestSharding(unittest.TestCase):
+
+    def test_parse_shard(self):
+        self.assertEqual(parse_shard("1/4"), (1, 4))
+        for bad in ("4/4", "-1/4", "1/0", "abc", "1/2/3"):
+            with self.assertRaises(ValueError):
+                parse_shard(bad)
+
+    def test_shard_assignment_is_stable_and_covers_all_users(self):
+        user_ids = [f"user_{i}" for i in range(100)]
+        assignments = [shard_for(user_id, 4) for user_id in user_ids]
+
+        # Deterministic across calls (and processes: sha256, not hash())
+        self.assertEqual(assignments, [shard_for(user_id, 4) for user_id in user_ids])
+        self.assertEqual(shard_for("user_1", 4), 2)
+        self.assertEqual(set(assignments), {0, 1, 2, 3})
+
+    def test_emails_round_trip(self):
+        emails = [Email(id="m1", sender="a@example.com", date="Mon", content="hi")]
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "emails.json")
+            # Generators are written as they are consumed
+            self.assertEqual(save_emails(path, iter(emails)), 1)
+            self.assertEqual(load_emails(path), emails)
+
+    def test_strip_option(self):
+        argv = ["--shards", "4", "--days", "2", "--shards=3", "--no_export"]
+        self.assertEqual(strip_option(argv, "--shards"), ["--days", "2", "--no_export"])
+
+    def test_merge_summaries(self):
+        merged = merge_summaries([
+            {"users": [{"user_id": "b", "status": "ok"}]},
+            {"users": [{"user_id": "a", "status": "error"}, {"user_id": "c", "status": "ok"}]},
+        ])
+        self.assertEqual([u["user_id"] for u in merged["users"]], ["a", "b", "c"])
+        self.assertEqual(merged["counts"], {"error": 1, "ok": 2})
+
+    def test_main_script_is_absolute(self):
+        self.assertTrue(os.path.isabs(MAIN_SCRIPT))
+        self.assertTrue(os.path.exists(MAIN_SCRIPT))
+
+    def test_each_shard_writes_its_own_summary(self):
+        child = (
+            "import json, sys\n"
+            "argv = sys.argv[1:]\n"
+            "assert argv.count('--summary_out') == 1 and argv.count('--shard') == 1, argv\n"
+            "shard = argv[argv.index('--shard') + 1]\n"
+            "with open(argv[argv.index('--summary_out') + 1], 'w') as f:\n"
+            "    json.dump({'users': [{'user_id': shard, 'status': 'ok'}]}, f)\n"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            script = os.path.join(tmp, "child.py")
+            with open(script, "w") as f:
+                f.write(child)
+            argv = ["--days", "2", "--summary_out", os.path.join(tmp, "run.json"), "--shard=0/9"]
+            summary = run_local_shards(2, argv, iter([]), script=script)
+
+        self.assertEqual([u["user_id"] for u in summary["users"]], ["0/2", "1/2"])
+        self.assertEqual(summary["failed_shards"], [])
+
+if __name__ == '__main__':
+    unittest.main()
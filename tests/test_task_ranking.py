@@ -0,0 +1,58 @@
+import datetime
+import unittest
+from src.models import Task
+from src.task_ranking import score_task, select_top_tasks
+
+TODAY = datetime.date(2023, 10, 27)
+
+
+class TestTaskRanking(unittest.TestCase):
+
+    def test_scores_priority_due_date_labels_and_duration(self):
+        inbox = Task(id="1", content="Inbox idea")
+        urgent = Task(id="2", content="Urgent", priority=4)
+        due_today = Task(id="3", content="Today", due=TODAY)
+        overdue = Task(id="4", content="Late", due=TODAY - datetime.timedelta(days=3))
+        very_overdue = Task(id="5", content="Later", due=TODAY - datetime.timedelta(days=60))
+
+        self.assertGreater(score_task(urgent, TODAY), score_task(overdue, TODAY))
+        self.assertGreater(score_task(overdue, TODAY), score_task(due_today, TODAY))
+        self.assertGreater(score_task(due_today, TODAY), score_task(inbox, TODAY))
+        # Overdue days are capped, so a stale task never outranks an urgent one
+        self.assertLess(score_task(very_overdue, TODAY), score_task(urgent, TODAY))
+
+        timed = Task(id="6", content="Call", due=datetime.datetime(2023, 10, 27, 9, 30))
+        self.assertGreater(score_task(timed, TODAY), score_task(due_today, TODAY))
+        quick = Task(id="7", content="Quick", duration_minutes=15)
+        long = Task(id="8", content="Long", duration_minutes=300)
+        self.assertGreater(score_task(quick, TODAY), score_task(inbox, TODAY))
+        self.assertLess(score_task(long, TODAY), score_task(inbox, TODAY))
+
+        errand = Task(id="9", content="Errand", labels=("errand",))
+        self.assertEqual(score_task(errand, TODAY, {"errand": 3}), score_task(inbox, TODAY) + 3)
+
+    def test_selects_top_k_and_counts_dropped(self):
+        tasks = [
+            Task(id="a", content="A"),
+            Task(id="b", content="B", priority=3),
+            Task(id="c", content="C", due=TODAY),
+            Task(id="d", content="D"),
+            Task(id="e", content="E", priority=4),
+        ]
+        kept, dropped = select_top_tasks(iter(tasks), 3, TODAY)
+        self.assertEqual([task.id for task in kept], ["e", "b", "c"])
+        self.assertEqual(dropped, 2)
+
+        # Ties keep their original order
+        kept, dropped = select_top_tasks(tasks, 4, TODAY)
+        self.assertEqual([task.id for task in kept], ["e", "b", "c", "a"])
+
+    def test_no_limit_keeps_everything(self):
+        tasks = [Task(id=str(i), content=str(i)) for i in range(3)]
+        self.assertEqual(select_top_tasks(tasks, None), (tasks, 0))
+        self.assertEqual(select_top_tasks(tasks, 10, TODAY), (tasks, 0))
+        self.assertEqual(select_top_tasks(tasks, 0, TODAY), ([], 3))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,7 @@
 import unittest
+import threading
 from unittest.mock import MagicMock
+from src.deadline import Deadline, DeadlineExceeded
 from src.todoist_manager import TodoistManager
 
 class TestTodoistManager(unittest.TestCase):
@@ -84,15 +86,16 @@ class TestTodoistManager(unittest.TestCase):
         # Expected: overdue | today | (no date & #Inbox) | (assigned to: me & no date & (#Work\ Project | #Shopping\ List))
         # Note: escaping logic replace(" ", r"\ ")
 
-        call_args = self.manager.api.filter_tasks.call_args
-        self.assertIsNotNone(call_args)
-        query_arg = call_args.kwargs.get('query')
+        # The base query and the favorites query run as separate, concurrent sub-queries
+        queries = sorted(c.kwargs.get('query') for c in self.manager.api.filter_tasks.call_args_list)
+        self.assertEqual(len(queries), 2)
+        base_query, fav_query = queries[1], queries[0]
 
-        self.assertIn("overdue | today | (no date & #Inbox)", query_arg)
-        self.assertIn("assigned to: me & no date", query_arg)
+        self.assertEqual("overdue | today | (no date & #Inbox)", base_query)
+        self.assertIn("assigned to: me & no date", fav_query)
         # Check for escaped names
-        self.assertIn(r"#Work\ Project", query_arg)
-        self.assertIn(r"#Shopping\ List", query_arg)
+        self.assertIn(r"#Work\ Project", fav_query)
+        self.assertIn(r"#Shopping\ List", fav_query)
 
         # Verify output format
         self.assertIn("- Inbox Task", result)
@@ -122,5 +125,44 @@ class TestTodoistManager(unittest.TestCase):
         count = result.count("- Task 1")
         self.assertEqual(count, 1)
 
+    def test_many_favorites_are_split_into_bounded_chunks(self):
+        projects = []
+        for i in range(25):
+            mock_p = MagicMock()
+            mock_p.id = str(i)
+            mock_p.name = f"Project {i}"
+            mock_p.is_favorite = True
+            projects.append(mock_p)
+        self.manager.api.get_projects.return_value = projects
+
+        def filter_tasks(query):
+            # Every sub-query returns a shared task plus one unique to the query
+            shared = MagicMock(id="shared", content="Shared", description="", due=None)
+            unique = MagicMock(id=query, content=f"Task for {len(query)}", description="", due=None)
+            return [[shared, unique]]
+
+        self.manager.api.filter_tasks.side_effect = filter_tasks
+
+        tasks = self.manager.fetch_potential_tasks()
+
+        queries = [c.kwargs['query'] for c in self.manager.api.filter_tasks.call_args_list]
+        # Base query + ceil(25 / 10) favorites chunks
+        self.assertEqual(len(queries), 4)
+        fav_queries = [q for q in queries if q.startswith("assigned to: me")]
+        self.assertEqual(sorted(q.count("#") for q in fav_queries), [5, 10, 10])
+        # Deduplicated by task ID across sub-queries
+        self.assertEqual(sum(1 for t in tasks if t.id == "shared"), 1)
+        self.assertEqual(len(tasks), 5)
+
+    def test_deadline_abandons_slow_queries(self):
+        self.manager.api.get_projects.return_value = []
+        release = threading.Event()
+        self.manager.api.filter_tasks.side_effect = lambda query: release.wait(5) and []
+        self.manager.deadline = Deadline(0.05, name="user_1")
+
+        with self.assertRaises(DeadlineExceeded):
+            self.manager.fetch_potential_tasks()
+        release.set()
+
 if __name__ == '__main__':
     unittest.main()